@@ -1,3 +1,24 @@
 from django.contrib import admin
+from django.utils import timezone
 
-# Register your models here.
+from .models import EmailOutbox
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ['to_email', 'kind', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at']
+    list_filter = ['kind', 'status', 'created_at']
+    search_fields = ['to_email', 'user__username']
+    list_select_related = ['user']
+    # The context holds verification codes and reset tokens
+    exclude = ['context']
+    readonly_fields = ['user', 'kind', 'to_email', 'attempts', 'last_error', 'created_at', 'sent_at']
+    actions = ['retry_now']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Retry selected messages now')
+    def retry_now(self, request, queryset):
+        count = queryset.filter(status='pending').update(next_attempt_at=timezone.now())
+        self.message_user(request, f"{count} pending messages will be sent on the next outbox run.")
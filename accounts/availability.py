@@ -0,0 +1,217 @@
+"""
+Username and email availability checks for the registration form.
+
+Most names people type are free, so every check first asks a Bloom filter of
+the existing usernames and emails (lowercased). A Bloom filter has no false
+negatives: "not in the filter" means available without touching the
+database. Only a possible hit, about AVAILABILITY_FILTER_ERROR_RATE of free
+names plus every taken one, is confirmed with one case-insensitive query
+that uses the lower(username) / lower(email) indexes.
+
+The filter is rebuilt from the database by the ``rebuild_availability_filter``
+task and shared through the cache; each process reloads it every
+AVAILABILITY_FILTER_REFRESH seconds. Accounts created in between are marked
+in the cache by a post_save signal, so they are never reported available.
+While the cache holds no filter (cold start, eviction) every check goes to
+the indexed query and a rebuild is enqueued, so no request scans the table.
+
+The answer is advisory: registration re-checks with the indexed lookup.
+The endpoints are throttled per client IP (``throttle``).
+"""
+import hashlib
+import math
+import operator
+import time
+from functools import reduce
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.functions import Lower
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+FILTER_KEY = 'availability:filter'
+REBUILD_KEY = 'availability:rebuilding'
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter of strings"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def filter_item(field, value) -> str:
+    return f"{field}:{value.strip().lower()}"
+
+
+def build_filter() -> BloomFilter:
+    """A filter of every username and email, stored in the cache for all processes"""
+    # Headroom for the accounts this process adds before the next rebuild
+    count = User.objects.count()
+    bloom = BloomFilter(count * 2 + 1000, _setting('AVAILABILITY_FILTER_ERROR_RATE', 0.01))
+    for username, email in User.objects.values_list('username', 'email').iterator(chunk_size=5000):
+        bloom.add(filter_item('username', username))
+        if email:
+            bloom.add(filter_item('email', email))
+    cache.set(FILTER_KEY, bloom, _setting('AVAILABILITY_FILTER_REFRESH', 600) * 3)
+    cache.delete(REBUILD_KEY)
+    _local.update(filter=bloom, loaded_at=time.monotonic())
+    return bloom
+
+
+_local = {'filter': None, 'loaded_at': 0.0}
+
+
+def get_filter() -> Optional[BloomFilter]:
+    """This process's copy of the shared filter, or None while there is none to load"""
+    if _local['filter'] is None or time.monotonic() - _local['loaded_at'] > _setting('AVAILABILITY_FILTER_REFRESH', 600):
+        bloom = cache.get(FILTER_KEY)
+        if bloom is None:
+            _local.update(filter=None, loaded_at=0.0)
+            request_rebuild()
+            return None
+        _local.update(filter=bloom, loaded_at=time.monotonic())
+    return _local['filter']
+
+
+def request_rebuild():
+    """Enqueue one filter rebuild, however many requests find the cache cold"""
+    from .tasks import rebuild_availability_filter
+
+    if cache.add(REBUILD_KEY, 1, _setting('AVAILABILITY_FILTER_REFRESH', 600)):
+        rebuild_availability_filter.delay()
+
+
+def recent_key(item) -> str:
+    return f"availability:recent:{hashlib.md5(item.encode('utf-8')).hexdigest()}"
+
+
+@receiver(post_save, sender=User)
+def mark_taken(sender, instance, update_fields=None, **kwargs):
+    """Make new or renamed accounts visible before the next filter rebuild"""
+    if update_fields is not None and not {'username', 'email'} & set(update_fields):
+        return  # e.g. the last_login update on every login
+    items = [filter_item('username', instance.username)]
+    if instance.email:
+        items.append(filter_item('email', instance.email))
+    if _local['filter'] is not None:
+        for item in items:
+            _local['filter'].add(item)
+    # Outlive the shared filter they are missing from
+    cache.set_many({recent_key(item): 1 for item in items}, _setting('AVAILABILITY_FILTER_REFRESH', 600) * 3)
+
+
+def email_match(lowered) -> Q:
+    """``lower(email) = lowered``, written so the partial unique index (email <> '') can serve it"""
+    return Q(email_lower=lowered) & ~Q(email='')
+
+
+def username_taken(username) -> bool:
+    return User.objects.alias(username_lower=Lower('username')).filter(username_lower=username.strip().lower()).exists()
+
+
+def email_taken(email) -> bool:
+    return User.objects.alias(email_lower=Lower('email')).filter(email_match(email.strip().lower())).exists()
+
+
+def _validate(field, value):
+    if field == 'username' and len(value) < 3:
+        return 'Username too short'
+    if field == 'email' and '@' not in value:
+        return 'Invalid email format'
+    return None
+
+
+TAKEN_MESSAGES = {
+    'username': 'Username already taken',
+    'email': 'Email already registered',
+}
+
+
+def check(**values) -> dict:
+    """
+    Availability of ``username`` and/or ``email``:
+    {field: {'available': bool, 'message': str}}, with at most one query
+    """
+    results, pending = {}, {}
+    for field, value in values.items():
+        value = (value or '').strip()
+        error = _validate(field, value)
+        if error:
+            results[field] = {'available': False, 'message': error}
+        else:
+            pending[field] = filter_item(field, value)
+
+    bloom = get_filter()
+    if bloom is None:
+        # No filter yet: confirm everything with the indexed query
+        maybe_taken = dict(pending)
+    else:
+        maybe_taken = {field: item for field, item in pending.items() if item in bloom}
+        unknown = {recent_key(item): field for field, item in pending.items() if field not in maybe_taken}
+        for key in cache.get_many(list(unknown)):
+            field = unknown[key]
+            maybe_taken[field] = pending[field]
+
+    taken = set()
+    if maybe_taken:
+        # One indexed query confirms every possible hit
+        lookups = {'username': lambda value: Q(username_lower=value), 'email': email_match}
+        matches = {field: lookups[field](item.split(':', 1)[1]) for field, item in maybe_taken.items()}
+        counts = (
+            User.objects.alias(username_lower=Lower('username'), email_lower=Lower('email'))
+            .filter(reduce(operator.or_, matches.values()))
+            .aggregate(**{field: Count('pk', filter=match) for field, match in matches.items()})
+        )
+        taken = {field for field, count in counts.items() if count}
+
+    for field in pending:
+        available = field not in taken
+        results[field] = {'available': available, 'message': 'Available' if available else TAKEN_MESSAGES[field]}
+    return results
+
+
+def client_ip(request) -> str:
+    if _setting('USE_X_FORWARDED_FOR', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def throttle(request, scope='availability') -> bool:
+    """Count a request from the client's IP; False once it is over the limit for the window"""
+    limit = _setting('AVAILABILITY_RATE_LIMIT', 30)
+    window = _setting('AVAILABILITY_RATE_WINDOW', 60)
+    key = f"throttle:{scope}:{client_ip(request)}:{int(time.time() // window)}"
+    cache.add(key, 0, window)
+    try:
+        return cache.incr(key) <= limit
+    except ValueError:
+        # Evicted between add and incr; let this one through
+        return True
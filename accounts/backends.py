@@ -0,0 +1,46 @@
+"""
+Authentication backend accepting a username or an email address.
+
+The identifier is resolved in one query on the lower(username) and unique
+lower(email) indexes, case-insensitively. If it matches several accounts
+(e.g. one user's username is another's email, or usernames differing only
+in case), the exact username wins, then a case-insensitive username, then
+the email.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Lower
+
+from .availability import email_match
+
+
+class EmailOrUsernameModelBackend(ModelBackend):
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        identifier = username.strip()
+        lowered = identifier.lower()
+        user = (
+            UserModel._default_manager
+            .alias(username_lower=Lower('username'), email_lower=Lower('email'))
+            .filter(Q(username_lower=lowered) | email_match(lowered))
+            .order_by(Case(
+                When(username=identifier, then=Value(0)),
+                When(username_lower=lowered, then=Value(1)),
+                default=Value(2),
+                output_field=IntegerField(),
+            ))
+            .first()
+        )
+        if user is None:
+            # Run the hasher anyway so unknown accounts take as long as wrong passwords
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,122 @@
+"""
+Transactional email outbox.
+
+Views never talk to the SMTP server: ``queue_email`` stores an EmailOutbox
+row and, once the transaction commits, enqueues ``send_outbox``. The worker
+(``drain``) claims due messages in batches, renders them from templates
+compiled once per process and sends the whole batch over one SMTP
+connection. A failed message is retried with exponential backoff until
+EMAIL_OUTBOX_MAX_ATTEMPTS, then marked failed.
+
+A claimed message gets a lease (``next_attempt_at`` in the future while
+'sending'), so messages left behind by a crashed worker become due again.
+Without a Celery broker the task runs eagerly, i.e. in the request, which
+with the console backend is what local development wants anyway.
+"""
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+# kind -> (subject, template name without extension; .txt and .html are rendered)
+EMAIL_TEMPLATES = {
+    'otp': ('Your AI Website Generator Verification Code', 'auth/otp_email'),
+    'verification': ('Verify your AI Website Generator account', 'auth/verification_email'),
+    'password_reset': ('Reset your AI Website Generator password', 'auth/password_reset_email'),
+}
+
+
+def queue_email(kind, user, context) -> EmailOutbox:
+    """Store a message for ``user`` and have the worker send it after commit"""
+    from .tasks import send_outbox
+
+    context = {'user': {'username': user.username, 'first_name': user.first_name}, **context}
+    message = EmailOutbox.objects.create(user=user, kind=kind, to_email=user.email, context=context)
+    transaction.on_commit(send_outbox.delay)
+    return message
+
+
+@lru_cache(maxsize=None)
+def _template(name):
+    # Parsed once per process, even when DEBUG turns off the cached loader
+    return get_template(name)
+
+
+def render_email(message, connection=None) -> EmailMultiAlternatives:
+    subject, template = EMAIL_TEMPLATES[message.kind]
+    email = EmailMultiAlternatives(
+        subject,
+        _template(f"{template}.txt").render(message.context),
+        settings.DEFAULT_FROM_EMAIL,
+        [message.to_email],
+        connection=connection,
+    )
+    email.attach_alternative(_template(f"{template}.html").render(message.context), 'text/html')
+    return email
+
+
+def claim(batch_size) -> list:
+    """Due messages, leased to this worker"""
+    now = timezone.now()
+    lease = now + timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_LEASE', 300))
+    due = EmailOutbox.objects.filter(status__in=('pending', 'sending'), next_attempt_at__lte=now)
+    ids = list(due.order_by('next_attempt_at').values_list('id', flat=True)[:batch_size])
+    # Conditional update: a message claimed by another worker in between is skipped
+    EmailOutbox.objects.filter(id__in=ids, next_attempt_at__lte=now).exclude(status__in=('sent', 'failed')).update(
+        status='sending', next_attempt_at=lease, attempts=F('attempts') + 1,
+    )
+    return list(EmailOutbox.objects.filter(id__in=ids, status='sending', next_attempt_at=lease))
+
+
+def drain(batch_size=None) -> dict:
+    """Send due messages batch by batch over one connection; returns counts by outcome"""
+    batch_size = batch_size or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 50)
+    results = {'sent': 0, 'retry': 0, 'failed': 0}
+    while True:
+        batch = claim(batch_size)
+        if not batch:
+            return results
+        connection = get_connection()
+        try:
+            for message in batch:
+                results[_send(message, connection)] += 1
+        finally:
+            connection.close()
+        if len(batch) < batch_size:
+            return results
+
+
+def _send(message, connection) -> str:
+    try:
+        connection.open()  # No-op while the connection is still open
+        render_email(message, connection).send()
+    except Exception as e:
+        # Start the next message on a fresh connection
+        connection.close()
+        return _failed(message, e)
+    EmailOutbox.objects.filter(pk=message.pk).update(
+        status='sent', sent_at=timezone.now(), context={}, last_error='',
+    )
+    print(f"📧 {message.kind} email sent to {message.to_email}")
+    return 'sent'
+
+
+def _failed(message, error) -> str:
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    if message.attempts >= max_attempts:
+        EmailOutbox.objects.filter(pk=message.pk).update(status='failed', last_error=str(error), context={})
+        print(f"❌ Giving up on {message.kind} email to {message.to_email} after {message.attempts} attempts: {error}")
+        return 'failed'
+    delay = getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 30) * 2 ** (message.attempts - 1)
+    EmailOutbox.objects.filter(pk=message.pk).update(
+        status='pending', next_attempt_at=timezone.now() + timedelta(seconds=delay), last_error=str(error),
+    )
+    print(f"⚠️ {message.kind} email to {message.to_email} failed (attempt {message.attempts}), retrying in {delay}s: {error}")
+    return 'retry'
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from accounts import emails
+
+
+class Command(BaseCommand):
+    help = "Send the due messages in the email outbox (what the send_outbox task does, without Celery)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Messages per SMTP connection (default EMAIL_OUTBOX_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        results = emails.drain(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {results['sent']} sent, {results['retry']} to retry, {results['failed']} failed"
+        ))
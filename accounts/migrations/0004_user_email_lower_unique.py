@@ -0,0 +1,41 @@
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import Lower
+
+# One account per email address, case-insensitively; blank emails (e.g.
+# createsuperuser without one) are left out. Replaces the plain
+# lower(email) index from 0003 and backs accounts/backends.py.
+OLD_INDEX = models.Index(Lower('email'), name='auth_user_email_lower_idx')
+CONSTRAINT = models.UniqueConstraint(Lower('email'), condition=~Q(email=''), name='auth_user_email_lower_uniq')
+
+
+def add_constraint(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    duplicates = list(
+        User.objects.exclude(email='').values(email_lower=Lower('email'))
+        .annotate(accounts=Count('id')).filter(accounts__gt=1).values_list('email_lower', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Cannot make emails unique, these addresses belong to several accounts: "
+            + ", ".join(duplicates) + ". Merge or change them, then migrate again."
+        )
+    schema_editor.remove_index(User, OLD_INDEX)
+    schema_editor.add_constraint(User, CONSTRAINT)
+
+
+def remove_constraint(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    schema_editor.remove_constraint(User, CONSTRAINT)
+    schema_editor.add_index(User, OLD_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_user_lower_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_constraint, remove_constraint),
+    ]
@@ -0,0 +1,194 @@
+"""
+One-time codes for email verification.
+
+Codes live in an OTP store instead of on the UserProfile row, so issuing and
+checking codes during signup bursts never writes to the profile table:
+
+- ``CacheOTPStore`` (default with a shared cache, i.e. CACHE_URL): the code
+  (HMAC'd, never stored in clear) and its attempt counter expire with the
+  cache TTL; attempts are counted with atomic ``incr`` and the resend window
+  is claimed with ``add``. A per-process cache would lose codes between web
+  workers and on every deploy.
+- ``DatabaseOTPStore`` (default otherwise): one ``OTPCode`` row per user and
+  purpose, updated with conditional UPDATEs.
+
+OTP_STORE selects the store ('cache', 'db' or a dotted class path). The
+10-minute expiry, 5-attempt limit and 2-minute resend window come from
+OTP_TTL, OTP_MAX_ATTEMPTS and OTP_RESEND_INTERVAL.
+"""
+import secrets
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.module_loading import import_string
+
+STORES = {
+    'cache': 'accounts.otp.CacheOTPStore',
+    'db': 'accounts.otp.DatabaseOTPStore',
+}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def new_code() -> str:
+    return f"{secrets.randbelow(900000) + 100000}"
+
+
+def hash_code(user_id, purpose, code) -> str:
+    return salted_hmac('accounts.otp', f"{purpose}:{user_id}:{code}").hexdigest()
+
+
+class OTPStore(ABC):
+    """Issue and check one-time codes for (user, purpose)"""
+
+    @abstractmethod
+    def issue(self, user_id, purpose='email', resend=False):
+        """
+        A new code replacing any previous one. With ``resend``, None while the
+        resend window of the last code is still open.
+        """
+
+    @abstractmethod
+    def check(self, user_id, code, purpose='email'):
+        """(True, None) or (False, error message); a used code is consumed"""
+
+    @abstractmethod
+    def can_resend(self, user_id, purpose='email') -> bool:
+        """Whether the resend window of the last code has passed"""
+
+    def _failed(self, attempts):
+        remaining = _setting('OTP_MAX_ATTEMPTS', 5) - attempts
+        if remaining <= 0:
+            return False, "Too many attempts. Please request a new OTP."
+        return False, f"Invalid OTP. {remaining} attempts remaining."
+
+
+class CacheOTPStore(OTPStore):
+
+    def _keys(self, user_id, purpose):
+        prefix = f"otp:{purpose}:{user_id}"
+        return f"{prefix}:code", f"{prefix}:attempts", f"{prefix}:resend"
+
+    def issue(self, user_id, purpose='email', resend=False):
+        code_key, attempts_key, resend_key = self._keys(user_id, purpose)
+        interval = _setting('OTP_RESEND_INTERVAL', 120)
+        if resend:
+            # add() is atomic: of two concurrent resends only one gets the window
+            if not cache.add(resend_key, 1, interval):
+                return None
+        else:
+            cache.set(resend_key, 1, interval)
+        code = new_code()
+        ttl = _setting('OTP_TTL', 600)
+        cache.set_many({code_key: hash_code(user_id, purpose, code), attempts_key: 0}, ttl)
+        return code
+
+    def check(self, user_id, code, purpose='email'):
+        code_key, attempts_key, resend_key = self._keys(user_id, purpose)
+        try:
+            attempts = cache.incr(attempts_key)
+        except ValueError:
+            return False, "OTP has expired. Please request a new one."
+        expected = cache.get(code_key)
+        if expected is None:
+            return False, "OTP has expired. Please request a new one."
+        if attempts > _setting('OTP_MAX_ATTEMPTS', 5):
+            return False, "Too many attempts. Please request a new OTP."
+        if not constant_time_compare(expected, hash_code(user_id, purpose, code)):
+            return self._failed(attempts)
+        cache.delete_many([code_key, attempts_key])
+        return True, None
+
+    def can_resend(self, user_id, purpose='email') -> bool:
+        return cache.get(self._keys(user_id, purpose)[2]) is None
+
+
+class DatabaseOTPStore(OTPStore):
+
+    def _rows(self, user_id, purpose):
+        from .models import OTPCode
+        return OTPCode.objects.filter(user_id=user_id, purpose=purpose)
+
+    def issue(self, user_id, purpose='email', resend=False):
+        from .models import OTPCode
+        code = new_code()
+        now = timezone.now()
+        values = {
+            'code_hash': hash_code(user_id, purpose, code),
+            'attempts': 0,
+            'issued_at': now,
+            'expires_at': now + timedelta(seconds=_setting('OTP_TTL', 600)),
+        }
+        rows = self._rows(user_id, purpose)
+        if resend:
+            rows = rows.filter(issued_at__lte=now - timedelta(seconds=_setting('OTP_RESEND_INTERVAL', 120)))
+        if rows.update(**values):
+            return code
+        try:
+            with transaction.atomic():
+                OTPCode.objects.create(user_id=user_id, purpose=purpose, **values)
+        except IntegrityError:
+            # A row exists: either inside its resend window, or created concurrently
+            if resend or not self._rows(user_id, purpose).update(**values):
+                return None
+        return code
+
+    def check(self, user_id, code, purpose='email'):
+        now = timezone.now()
+        rows = self._rows(user_id, purpose).filter(expires_at__gt=now)
+        # Count the attempt first; the row only moves forward within its limit
+        if not rows.filter(attempts__lt=_setting('OTP_MAX_ATTEMPTS', 5)).update(attempts=F('attempts') + 1):
+            if rows.exists():
+                return False, "Too many attempts. Please request a new OTP."
+            return False, "OTP has expired. Please request a new one."
+        row = rows.values('code_hash', 'attempts').first()
+        if row is None:
+            return False, "OTP has expired. Please request a new one."
+        if not constant_time_compare(row['code_hash'], hash_code(user_id, purpose, code)):
+            return self._failed(row['attempts'])
+        # Consumed: expire it (the row keeps issued_at for the resend window)
+        self._rows(user_id, purpose).update(expires_at=now, code_hash='')
+        return True, None
+
+    def can_resend(self, user_id, purpose='email') -> bool:
+        since = timezone.now() - timedelta(seconds=_setting('OTP_RESEND_INTERVAL', 120))
+        return not self._rows(user_id, purpose).filter(issued_at__gt=since).exists()
+
+
+@lru_cache(maxsize=None)
+def get_store() -> OTPStore:
+    name = _setting('OTP_STORE', 'db')
+    return import_string(STORES.get(name, name))()
+
+
+def issue_email_otp(user, resend=False):
+    return get_store().issue(user.id, 'email', resend=resend)
+
+
+def can_request_new_otp(user) -> bool:
+    return get_store().can_resend(user.id, 'email')
+
+
+def verify_email_otp(user, code):
+    """Check the code and, if it is right, activate the account"""
+    from generator.models import UserProfile
+
+    ok, message = get_store().check(user.id, code, 'email')
+    if not ok:
+        return False, message
+    # Only the successful verification writes, and only the two flags
+    with transaction.atomic():
+        UserProfile.objects.filter(user_id=user.id).update(email_verified=True, updated_at=timezone.now())
+        User.objects.filter(pk=user.id).update(is_active=True)
+    user.is_active = True
+    return True, "Email verified successfully!"
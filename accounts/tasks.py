@@ -0,0 +1,24 @@
+"""
+Background jobs for the accounts app.
+
+``send_outbox`` is enqueued whenever a message is queued, and also runs on
+Celery beat every minute to pick up retries whose backoff has elapsed.
+``rebuild_availability_filter`` refreshes the registration-form filter on beat.
+"""
+from celery import shared_task
+
+from . import availability, emails
+
+
+@shared_task(ignore_result=True)
+def send_outbox():
+    """Send every due message in the email outbox"""
+    results = emails.drain()
+    if results['retry'] or results['failed']:
+        print(f"📬 Outbox drained: {results}")
+
+
+@shared_task(ignore_result=True)
+def rebuild_availability_filter():
+    """Rebuild the username/email Bloom filter from the database"""
+    availability.build_filter()
@@ -1,3 +1,428 @@
-from django.test import TestCase
+import smtplib
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.db import IntegrityError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from generator.models import UserProfile
+
+from . import availability, emails, otp, tasks
+from .models import EmailOutbox
+
+
+@contextmanager
+def travel(seconds):
+    """Move the clock of the database and the cache forward by ``seconds``"""
+    now = timezone.now() + timedelta(seconds=seconds)
+    with mock.patch('django.utils.timezone.now', return_value=now), \
+            mock.patch('time.time', return_value=now.timestamp()):
+        yield
+
+
+class OTPStoreTestsMixin:
+    store_class = None
+
+    def setUp(self):
+        cache.clear()
+        self.store = self.store_class()
+        self.user = User.objects.create_user('verify', 'verify@example.com')
+
+    def wrong(self, code):
+        return f"{(int(code) + 1) % 900000 + 100000}"
+
+    def test_code_is_accepted_once(self):
+        code = self.store.issue(self.user.id)
+
+        self.assertEqual(self.store.check(self.user.id, code), (True, None))
+        self.assertFalse(self.store.check(self.user.id, code)[0])
+
+    def test_code_expires_after_ten_minutes(self):
+        code = self.store.issue(self.user.id)
+
+        with travel(9 * 60):
+            self.assertFalse(self.store.check(self.user.id, self.wrong(code))[0])
+        with travel(10 * 60 + 1):
+            self.assertEqual(
+                self.store.check(self.user.id, code), (False, "OTP has expired. Please request a new one."),
+            )
+
+    def test_five_attempts_then_locked(self):
+        code = self.store.issue(self.user.id)
+
+        messages = [self.store.check(self.user.id, self.wrong(code))[1] for _ in range(5)]
+
+        self.assertEqual(messages[0], "Invalid OTP. 4 attempts remaining.")
+        self.assertEqual(messages[3], "Invalid OTP. 1 attempts remaining.")
+        self.assertEqual(messages[4], "Too many attempts. Please request a new OTP.")
+        # Even the right code is refused now
+        self.assertEqual(self.store.check(self.user.id, code), (False, "Too many attempts. Please request a new OTP."))
+
+    def test_right_code_on_the_last_attempt(self):
+        code = self.store.issue(self.user.id)
+        for _ in range(4):
+            self.store.check(self.user.id, self.wrong(code))
+
+        self.assertEqual(self.store.check(self.user.id, code), (True, None))
+
+    def test_resend_window_is_two_minutes(self):
+        first = self.store.issue(self.user.id)
+
+        self.assertFalse(self.store.can_resend(self.user.id))
+        self.assertIsNone(self.store.issue(self.user.id, resend=True))
+        with travel(2 * 60 + 1):
+            self.assertTrue(self.store.can_resend(self.user.id))
+            second = self.store.issue(self.user.id, resend=True)
+            self.assertIsNotNone(second)
+            self.assertFalse(self.store.can_resend(self.user.id))
+            self.assertIsNone(self.store.issue(self.user.id, resend=True))
+            # Only the newest code is valid
+            if second != first:
+                self.assertFalse(self.store.check(self.user.id, first)[0])
+            self.assertEqual(self.store.check(self.user.id, second), (True, None))
+
+    def test_new_code_resets_attempts(self):
+        code = self.store.issue(self.user.id)
+        for _ in range(5):
+            self.store.check(self.user.id, self.wrong(code))
+
+        code = self.store.issue(self.user.id)
+
+        self.assertEqual(self.store.check(self.user.id, code), (True, None))
+
+
+OTP_SETTINGS = {'OTP_TTL': 600, 'OTP_MAX_ATTEMPTS': 5, 'OTP_RESEND_INTERVAL': 120}
+
+
+@override_settings(**OTP_SETTINGS)
+class CacheOTPStoreTests(OTPStoreTestsMixin, TestCase):
+    store_class = otp.CacheOTPStore
+
+
+@override_settings(**OTP_SETTINGS)
+class DatabaseOTPStoreTests(OTPStoreTestsMixin, TestCase):
+    store_class = otp.DatabaseOTPStore
+
+
+class IncompleteOTPStore(otp.OTPStore):
+
+    def issue(self, user_id, purpose='email', resend=False):
+        return '123456'
+
+
+class OTPStoreSettingTests(TestCase):
+
+    def setUp(self):
+        otp.get_store.cache_clear()
+        self.addCleanup(otp.get_store.cache_clear)
+
+    @override_settings(OTP_STORE='accounts.tests.IncompleteOTPStore')
+    def test_incomplete_store_fails_when_loaded(self):
+        with self.assertRaisesMessage(TypeError, 'check'):
+            otp.get_store()
+
+    @override_settings(OTP_STORE='cache')
+    def test_store_by_name(self):
+        self.assertIsInstance(otp.get_store(), otp.CacheOTPStore)
+
+
+@override_settings(OTP_STORE='db')
+class VerifyEmailOTPTests(TestCase):
+
+    def setUp(self):
+        otp.get_store.cache_clear()
+        self.addCleanup(otp.get_store.cache_clear)
+        self.user = User.objects.create_user('inactive', 'inactive@example.com', is_active=False)
+
+    def test_right_code_activates_account(self):
+        code = otp.issue_email_otp(self.user)
+
+        self.assertEqual(otp.verify_email_otp(self.user, code), (True, "Email verified successfully!"))
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+        self.assertTrue(UserProfile.objects.get(user=self.user).email_verified)
+
+
+class CountingBackend(locmem.EmailBackend):
+    """locmem backend that opens and closes like SMTP, counting its connections"""
+    opened = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.is_open = False
+
+    def open(self):
+        if self.is_open:
+            return False
+        self.is_open = True
+        CountingBackend.opened += 1
+        return True
+
+    def close(self):
+        self.is_open = False
+
+
+class FailingBackend(CountingBackend):
+
+    def send_messages(self, messages):
+        raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+
+
+@override_settings(
+    EMAIL_BACKEND='accounts.tests.CountingBackend',
+    EMAIL_OUTBOX_BATCH_SIZE=2,
+    EMAIL_OUTBOX_MAX_ATTEMPTS=3,
+    EMAIL_OUTBOX_RETRY_DELAY=30,
+)
+class EmailOutboxTests(TestCase):
+
+    def setUp(self):
+        CountingBackend.opened = 0
+        self.users = [
+            User.objects.create_user(f'mail{i}', f'mail{i}@example.com', first_name=f'Mail{i}')
+            for i in range(5)
+        ]
+
+    def queue(self, users):
+        with self.captureOnCommitCallbacks() as callbacks:
+            messages = [emails.queue_email('otp', user, {'otp': '123456'}) for user in users]
+        return messages, callbacks
+
+    def test_queued_email_is_sent_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            message = emails.queue_email('otp', self.users[0], {'otp': '654321'})
+        self.assertEqual(len(mail.outbox), 1)  # Sent by send_outbox once the transaction committed
+
+        sent = mail.outbox[0]
+        self.assertEqual(sent.to, ['mail0@example.com'])
+        self.assertIn('654321', sent.body)
+        self.assertIn('654321', sent.alternatives[0][0])
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts, message.context), ('sent', 1, {}))
+        self.assertIsNotNone(message.sent_at)
+
+    def test_one_connection_per_batch(self):
+        messages, callbacks = self.queue(self.users)
+        self.assertEqual(len(callbacks), 5)
+        self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(emails.drain(), {'sent': 5, 'retry': 0, 'failed': 0})
+
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(CountingBackend.opened, 3)  # Batches of 2, 2 and 1
+        self.assertFalse(EmailOutbox.objects.exclude(status='sent').exists())
+        self.assertFalse(EmailOutbox.objects.exclude(context={}).exists())
+
+    @override_settings(EMAIL_BACKEND='accounts.tests.FailingBackend')
+    def test_failures_back_off_exponentially_then_give_up(self):
+        (message,), callbacks = self.queue(self.users[:1])
+
+        self.assertEqual(emails.drain(), {'sent': 0, 'retry': 1, 'failed': 0})
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('pending', 1))
+        self.assertIn('Connection unexpectedly closed', message.last_error)
+        delay = message.next_attempt_at - timezone.now()
+        self.assertTrue(timedelta(seconds=25) < delay <= timedelta(seconds=30))
+        # Not due again before its backoff has elapsed
+        self.assertEqual(emails.drain(), {'sent': 0, 'retry': 0, 'failed': 0})
+
+        with travel(31):
+            self.assertEqual(emails.drain(), {'sent': 0, 'retry': 1, 'failed': 0})
+            message.refresh_from_db()
+            self.assertEqual(message.attempts, 2)
+            self.assertEqual(message.next_attempt_at - timezone.now(), timedelta(seconds=60))
+
+        with travel(31 + 61):
+            self.assertEqual(emails.drain(), {'sent': 0, 'retry': 0, 'failed': 1})
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts, message.context), ('failed', 3, {}))
+
+        with travel(3600):
+            self.assertEqual(emails.drain(), {'sent': 0, 'retry': 0, 'failed': 0})
+
+    def test_failed_message_is_retried_on_a_fresh_connection(self):
+        messages, callbacks = self.queue(self.users[:2])
+
+        with override_settings(EMAIL_BACKEND='accounts.tests.FailingBackend'):
+            emails.drain()
+        with travel(31):
+            self.assertEqual(emails.drain(), {'sent': 2, 'retry': 0, 'failed': 0})
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(set(EmailOutbox.objects.values_list('attempts', flat=True)), {2})
+
+
+class EmailOrUsernameBackendTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('Alice', 'Alice@Example.com', 'correct horse')
+
+    def test_login_by_username_or_email_ignores_case(self):
+        for identifier in ('Alice', 'alice', 'alice@example.com', ' ALICE@EXAMPLE.COM '):
+            self.assertEqual(authenticate(username=identifier, password='correct horse'), self.user, identifier)
+
+    def test_wrong_password_unknown_or_inactive_account_is_refused(self):
+        self.assertIsNone(authenticate(username='alice', password='wrong'))
+        self.assertIsNone(authenticate(username='nobody@example.com', password='correct horse'))
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(authenticate(username='alice', password='correct horse'))
+
+    def test_username_wins_over_another_accounts_email(self):
+        squatter = User.objects.create_user('bob@example.com', 'other@example.com', 'squatter pass')
+        User.objects.create_user('bob', 'bob@example.com', 'bob pass')
+
+        self.assertEqual(authenticate(username='bob@example.com', password='squatter pass'), squatter)
+        self.assertIsNone(authenticate(username='bob@example.com', password='bob pass'))
+
+
+class ProfileEmailTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('carol', 'carol@example.com')
+        User.objects.create_user('dave', 'dave@example.com')
+        self.client.force_login(self.user)
+
+    def post_email(self, email):
+        response = self.client.post('/auth/profile/', {'first_name': 'Carol', 'email': email}, follow=True)
+        return [str(message) for message in response.context['messages']]
+
+    def test_taken_email_is_refused(self):
+        self.assertEqual(self.post_email('DAVE@example.com'), ['Email already registered.'])
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email, 'carol@example.com')
+
+    def test_email_taken_after_the_check_is_refused(self):
+        # Another request claims the address between the check and the save
+        with mock.patch('accounts.views.availability.email_taken', return_value=False):
+            self.assertEqual(self.post_email('Dave@Example.com'), ['Email already registered.'])
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email, 'carol@example.com')
+
+    def test_own_email_in_another_case_is_allowed(self):
+        self.assertEqual(self.post_email('Carol@Example.com'), ['Profile updated successfully!'])
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email, 'Carol@Example.com')
+
+
+class EmailUniqueMigrationTests(TransactionTestCase):
+    """0004 refuses to add the unique lower(email) constraint over duplicates"""
+
+    before = [('accounts', '0003_user_lower_indexes')]
+    after = [('accounts', '0004_user_email_lower_unique')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+
+    def test_duplicate_emails_stop_the_migration(self):
+        self.migrate(self.before)
+        self.addCleanup(self.migrate, self.after)
+        User.objects.create_user('erin', 'erin@example.com')
+        duplicate = User.objects.create_user('erin2', 'Erin@Example.com')
+        User.objects.create_user('frank', '')
+        User.objects.create_user('grace', '')
+
+        with self.assertRaisesMessage(RuntimeError, 'erin@example.com'):
+            self.migrate(self.after)
+
+        duplicate.delete()
+        self.migrate(self.after)
+        with self.assertRaises(IntegrityError):
+            User.objects.create_user('erin3', 'ERIN@example.com')
+
+
+class BloomFilterTests(TestCase):
+
+    def test_no_false_negatives_and_few_false_positives(self):
+        bloom = availability.BloomFilter(1000, error_rate=0.01)
+        for n in range(1000):
+            bloom.add(f'username:user{n}')
+
+        self.assertTrue(all(f'username:user{n}' in bloom for n in range(1000)))
+        false_hits = sum(f'username:other{n}' in bloom for n in range(10000))
+        self.assertLess(false_hits, 300)
+
+
+class AvailabilityTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        availability._local.update(filter=None, loaded_at=0.0)
+        self.addCleanup(availability._local.update, filter=None, loaded_at=0.0)
+        User.objects.create_user('Henry', 'henry@example.com')
+
+    def post(self, path, data, ip='10.0.0.1'):
+        return self.client.post(path, data, content_type='application/json', REMOTE_ADDR=ip)
+
+    def test_cold_cache_queries_and_enqueues_one_rebuild(self):
+        with mock.patch.object(tasks.rebuild_availability_filter, 'delay') as delay:
+            with self.assertNumQueries(1):
+                self.assertFalse(availability.check(username='henry')['username']['available'])
+            self.assertTrue(availability.check(username='ivy')['username']['available'])
+
+        delay.assert_called_once_with()
+        self.assertIsNone(cache.get(availability.FILTER_KEY))
+
+    def test_warm_filter_answers_free_names_without_a_query(self):
+        availability.build_filter()
+
+        with self.assertNumQueries(0):
+            result = availability.check(username='ivy', email='ivy@example.com')
+        self.assertEqual(result, {
+            'username': {'available': True, 'message': 'Available'},
+            'email': {'available': True, 'message': 'Available'},
+        })
+
+        with self.assertNumQueries(1):
+            result = availability.check(username='HENRY', email='Henry@Example.com')
+        self.assertEqual(result, {
+            'username': {'available': False, 'message': 'Username already taken'},
+            'email': {'available': False, 'message': 'Email already registered'},
+        })
+
+    def test_accounts_created_after_the_rebuild_are_taken(self):
+        availability.build_filter()
+        User.objects.create_user('Jack', 'jack@example.com')
+        # Another process loading the shared filter still sees the new account
+        availability._local.update(filter=None, loaded_at=0.0)
+
+        result = availability.check(username='jack', email='JACK@example.com')
+
+        self.assertFalse(result['username']['available'])
+        self.assertFalse(result['email']['available'])
+
+    def test_batched_endpoint_checks_both_fields(self):
+        response = self.post('/auth/check-availability/', {'username': 'henry', 'email': 'new@example.com'})
+
+        self.assertEqual(response.json(), {
+            'username': {'available': False, 'message': 'Username already taken'},
+            'email': {'available': True, 'message': 'Available'},
+        })
+        self.assertEqual(self.post('/auth/check-availability/', {'email': 'nope'}).json(),
+                         {'email': {'available': False, 'message': 'Invalid email format'}})
+        self.assertEqual(self.post('/auth/check-availability/', ['henry']).status_code, 400)
+
+    @override_settings(AVAILABILITY_RATE_LIMIT=2)
+    def test_endpoints_are_throttled_per_ip(self):
+        for _ in range(2):
+            self.assertEqual(self.post('/auth/check-username/', {'username': 'ivy'}).status_code, 200)
+
+        response = self.post('/auth/check-email/', {'email': 'ivy@example.com'})
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(response.json()['available'])
+        self.assertEqual(self.post('/auth/check-username/', {'username': 'ivy'}, ip='10.0.0.2').status_code, 200)
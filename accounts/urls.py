@@ -23,4 +23,5 @@ urlpatterns = [
     # AJAX endpoints
     path('check-username/', views.check_username_availability, name='check_username'),
     path('check-email/', views.check_email_availability, name='check_email'),
+    path('check-availability/', views.check_availability, name='check_availability'),
 ]
\ No newline at end of file
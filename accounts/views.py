@@ -3,21 +3,21 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.conf import settings
 from django.contrib.sites.shortcuts import get_current_site
-from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.contrib.auth.tokens import default_token_generator
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
+from django.db import IntegrityError, transaction
 from datetime import timedelta
-from django.db import transaction
 import json
 
 from generator.models import UserProfile
+from . import availability, otp as otp_store
+from .emails import queue_email
 
 
 def login_view(request):
@@ -30,15 +30,7 @@ def login_view(request):
         password = request.POST.get('password')
         remember_me = request.POST.get('remember_me')
         
-        # Allow login with email or username
-        if '@' in username:
-            try:
-                user_obj = User.objects.get(email=username)
-                username = user_obj.username
-            except User.DoesNotExist:
-                messages.error(request, 'Invalid email or password.')
-                return render(request, 'auth/login.html')
-        
+        # The backend accepts a username or an email address
         user = authenticate(request, username=username, password=password)
         
         if user is not None:
@@ -94,11 +86,11 @@ def register_view(request):
             return render(request, 'auth/register.html')
         
         # Check if username or email already exists
-        if User.objects.filter(username=username).exists():
+        if availability.username_taken(username):
             messages.error(request, 'Username already exists.')
             return render(request, 'auth/register.html')
         
-        if User.objects.filter(email=email).exists():
+        if availability.email_taken(email):
             messages.error(request, 'Email already registered.')
             return render(request, 'auth/register.html')
         
@@ -113,11 +105,8 @@ def register_view(request):
                 is_active=False  # User needs to verify email with OTP
             )
             
-            # Create user profile
-            profile = UserProfile.objects.create(user=user)
-            
             # Generate and send OTP
-            otp = profile.generate_email_otp()
+            otp = otp_store.issue_email_otp(user)
             send_otp_email(request, user, otp)
             
             messages.success(
@@ -130,6 +119,10 @@ def register_view(request):
             request.session['otp_session_start'] = timezone.now().timestamp()
             return redirect('auth:verify_otp')
             
+        except IntegrityError:
+            # Lost a race with another signup for the same email (unique lower(email))
+            messages.error(request, 'Email already registered.')
+            return render(request, 'auth/register.html')
         except Exception as e:
             messages.error(request, f'Registration failed: {str(e)}')
             return render(request, 'auth/register.html')
@@ -138,126 +131,23 @@ def register_view(request):
 
 
 def send_otp_email(request, user, otp):
-    """Send OTP verification email"""
-    subject = 'Your AI Website Generator Verification Code'
-    
-    try:
-        # Create HTML email content
-        html_message = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>Verification Code - AI Website Generator</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 20px; background: #f8fafc; }}
-                .container {{ max-width: 600px; margin: 0 auto; background: white; border-radius: 10px; overflow: hidden; box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1); }}
-                .header {{ background: linear-gradient(135deg, #667eea, #764ba2); color: white; padding: 2rem; text-align: center; }}
-                .content {{ padding: 2rem; }}
-                .otp-box {{ background: #f7fafc; border: 2px solid #e2e8f0; border-radius: 8px; padding: 2rem; margin: 1.5rem 0; text-align: center; }}
-                .otp-code {{ font-size: 2.5rem; font-weight: bold; color: #667eea; letter-spacing: 0.5rem; margin: 1rem 0; font-family: 'Courier New', monospace; }}
-                .footer {{ background: #f8fafc; padding: 1rem; text-align: center; color: #666; font-size: 0.9rem; }}
-                .warning {{ background: #fef2f2; border: 1px solid #fecaca; color: #dc2626; padding: 1rem; border-radius: 6px; margin: 1rem 0; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🤖 AI Website Generator</h1>
-                    <p>Email Verification</p>
-                </div>
-                
-                <div class="content">
-                    <h2>Hi {user.first_name or user.username},</h2>
-                    
-                    <p>Welcome to AI Website Generator! To complete your registration and start creating amazing websites with AI, please use the verification code below:</p>
-                    
-                    <div class="otp-box">
-                        <p>Your Verification Code:</p>
-                        <div class="otp-code">{otp}</div>
-                        <p><strong>Valid for 10 minutes</strong></p>
-                    </div>
-                    
-                    <p>Enter this code on the verification page to activate your account.</p>
-                    
-                    <div class="warning">
-                        <strong>⚠️ Security Notice:</strong>
-                        <ul style="margin: 0; padding-left: 1.5rem;">
-                            <li>Never share this code with anyone</li>
-                            <li>This code expires in 10 minutes</li>
-                            <li>If you didn't request this, please ignore this email</li>
-                        </ul>
-                    </div>
-                    
-                    <p>Best regards,<br>The AI Website Generator Team</p>
-                </div>
-                
-                <div class="footer">
-                    <p>© 2025 AI Website Generator. All rights reserved.</p>
-                    <p>This is an automated message, please do not reply to this email.</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        # Plain text version
-        plain_message = f"""
-        Hi {user.first_name or user.username},
-        
-        Welcome to AI Website Generator!
-        
-        Your verification code is: {otp}
-        
-        This code is valid for 10 minutes. Enter it on the verification page to activate your account.
-        
-        If you didn't request this, please ignore this email.
-        
-        Best regards,
-        The AI Website Generator Team
-        """
-        
-        send_mail(
-            subject,
-            plain_message,
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            fail_silently=False,
-            html_message=html_message
-        )
-        
-        print(f"OTP email sent successfully to {user.email}")
-        return True
-        
-    except Exception as e:
-        print(f"Failed to send OTP email: {e}")
-        return False
+    """Queue the OTP verification email (sent by the outbox worker)"""
+    queue_email('otp', user, {'otp': otp})
+    return True
 
 
-def send_verification_email(request, user):
-    """Send email verification link (legacy function - keeping for backward compatibility)"""
-    current_site = get_current_site(request)
-    subject = 'Verify your AI Website Generator account'
-    
-    message = render_to_string('auth/verification_email.html', {
-        'user': user,
-        'domain': current_site.domain,
+def _link_context(request, user):
+    return {
+        'domain': get_current_site(request).domain,
         'uid': urlsafe_base64_encode(force_bytes(user.pk)),
         'token': default_token_generator.make_token(user),
         'protocol': 'https' if request.is_secure() else 'http',
-    })
-    
-    try:
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            fail_silently=False,
-            html_message=message
-        )
-    except Exception as e:
-        print(f"Failed to send email: {e}")
+    }
+
+
+def send_verification_email(request, user):
+    """Queue the email verification link (legacy function - keeping for backward compatibility)"""
+    queue_email('verification', user, _link_context(request, user))
 
 
 def verify_otp(request):
@@ -281,8 +171,7 @@ def verify_otp(request):
     
     try:
         user = User.objects.get(id=user_id)
-        profile = user.userprofile
-    except (User.DoesNotExist, UserProfile.DoesNotExist):
+    except User.DoesNotExist:
         messages.error(request, 'Invalid session. Please register again.')
         return redirect('auth:register')
     
@@ -297,20 +186,19 @@ def verify_otp(request):
             messages.error(request, 'Please enter a valid 6-digit code.')
             return render(request, 'auth/verify_otp.html', {'user': user})
         
-        # Verify OTP with transaction safety
-        with transaction.atomic():
-            success, message = profile.verify_email_otp(otp)
+        # Attempts are counted atomically by the OTP store
+        success, message = otp_store.verify_email_otp(user, otp)
+        
+        if success:
+            # Clear session
+            if 'otp_user_id' in request.session:
+                del request.session['otp_user_id']
             
-            if success:
-                # Clear session
-                if 'otp_user_id' in request.session:
-                    del request.session['otp_user_id']
-                
-                messages.success(request, message + ' You can now log in and start creating websites!')
-                return redirect('auth:login')
-            else:
-                messages.error(request, message)
-                return render(request, 'auth/verify_otp.html', {'user': user})
+            messages.success(request, message + ' You can now log in and start creating websites!')
+            return redirect('auth:login')
+        else:
+            messages.error(request, message)
+            return render(request, 'auth/verify_otp.html', {'user': user})
     
     return render(request, 'auth/verify_otp.html', {'user': user})
 
@@ -324,18 +212,17 @@ def resend_otp(request):
     
     try:
         user = User.objects.get(id=user_id)
-        profile = user.userprofile
-    except (User.DoesNotExist, UserProfile.DoesNotExist):
+    except User.DoesNotExist:
         messages.error(request, 'Invalid session. Please register again.')
         return redirect('auth:register')
     
-    # Check if user can request new OTP (rate limiting)
-    if not profile.can_request_new_otp():
+    # Generate a new OTP unless the last one is under 2 minutes old (rate limiting)
+    otp = otp_store.issue_email_otp(user, resend=True)
+    if otp is None:
         messages.error(request, 'Please wait 2 minutes before requesting a new code.')
         return redirect('auth:verify_otp')
     
-    # Generate and send new OTP
-    otp = profile.generate_email_otp()
+    # Send new OTP
     if send_otp_email(request, user, otp):
         messages.success(request, 'A new verification code has been sent to your email.')
     else:
@@ -371,14 +258,24 @@ def verify_email(request, uidb64, token):
 @login_required
 def profile_view(request):
     """User profile view"""
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    profile = request.profile
     
     if request.method == 'POST':
         # Update user information
         request.user.first_name = request.POST.get('first_name', '')
         request.user.last_name = request.POST.get('last_name', '')
-        request.user.email = request.POST.get('email', '')
-        request.user.save()
+        email = request.POST.get('email', '').strip()
+        if email and email.lower() != request.user.email.lower() and availability.email_taken(email):
+            messages.error(request, 'Email already registered.')
+            return redirect('auth:profile')
+        request.user.email = email
+        try:
+            with transaction.atomic():
+                request.user.save()
+        except IntegrityError:
+            # Lost a race with another account taking this email (unique lower(email))
+            messages.error(request, 'Email already registered.')
+            return redirect('auth:profile')
         
         messages.success(request, 'Profile updated successfully!')
         return redirect('auth:profile')
@@ -424,29 +321,8 @@ def password_reset_request(request):
 
 
 def send_password_reset_email(request, user):
-    """Send password reset email"""
-    current_site = get_current_site(request)
-    subject = 'Reset your AI Website Generator password'
-    
-    message = render_to_string('auth/password_reset_email.html', {
-        'user': user,
-        'domain': current_site.domain,
-        'uid': urlsafe_base64_encode(force_bytes(user.pk)),
-        'token': default_token_generator.make_token(user),
-        'protocol': 'https' if request.is_secure() else 'http',
-    })
-    
-    try:
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            fail_silently=False,
-            html_message=message
-        )
-    except Exception as e:
-        print(f"Failed to send password reset email: {e}")
+    """Queue the password reset email"""
+    queue_email('password_reset', user, _link_context(request, user))
 
 
 def password_reset_confirm(request, uidb64, token):
@@ -482,37 +358,43 @@ def password_reset_confirm(request, uidb64, token):
         return redirect('auth:password_reset')
 
 
+def _availability_request(request, fields):
+    """The JSON body's values for ``fields``, or an error response"""
+    if request.method != 'POST':
+        return None, JsonResponse({'available': False, 'message': 'Invalid request'})
+    if not availability.throttle(request):
+        return None, JsonResponse({'available': False, 'message': 'Too many requests, please slow down'}, status=429)
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return None, JsonResponse({'available': False, 'message': 'Invalid request'}, status=400)
+    if not isinstance(data, dict):
+        return None, JsonResponse({'available': False, 'message': 'Invalid request'}, status=400)
+    return {field: str(data[field]) for field in fields if data.get(field) is not None}, None
+
+
 @csrf_exempt
 def check_username_availability(request):
     """AJAX view to check username availability"""
-    if request.method == 'POST':
-        data = json.loads(request.body)
-        username = data.get('username', '').strip()
-        
-        if len(username) < 3:
-            return JsonResponse({'available': False, 'message': 'Username too short'})
-        
-        available = not User.objects.filter(username=username).exists()
-        message = 'Available' if available else 'Username already taken'
-        
-        return JsonResponse({'available': available, 'message': message})
-    
-    return JsonResponse({'available': False, 'message': 'Invalid request'})
+    values, error = _availability_request(request, ['username'])
+    if error:
+        return error
+    return JsonResponse(availability.check(username=values.get('username', ''))['username'])
 
 
 @csrf_exempt
 def check_email_availability(request):
     """AJAX view to check email availability"""
-    if request.method == 'POST':
-        data = json.loads(request.body)
-        email = data.get('email', '').strip()
-        
-        if '@' not in email:
-            return JsonResponse({'available': False, 'message': 'Invalid email format'})
-        
-        available = not User.objects.filter(email=email).exists()
-        message = 'Available' if available else 'Email already registered'
-        
-        return JsonResponse({'available': available, 'message': message})
-    
-    return JsonResponse({'available': False, 'message': 'Invalid request'})
+    values, error = _availability_request(request, ['email'])
+    if error:
+        return error
+    return JsonResponse(availability.check(email=values.get('email', ''))['email'])
+
+
+@csrf_exempt
+def check_availability(request):
+    """AJAX view checking the username and email fields in one request"""
+    values, error = _availability_request(request, ['username', 'email'])
+    if error:
+        return error
+    return JsonResponse(availability.check(**values))
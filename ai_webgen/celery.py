@@ -0,0 +1,17 @@
+"""
+Celery application for ai_webgen project.
+
+Website generation runs on Celery workers so web workers are never blocked
+by the OpenAI round trip. Configuration is read from Django settings using
+the ``CELERY_`` prefix.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ai_webgen.settings')
+
+app = Celery('ai_webgen')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 import os
 from pathlib import Path
+from celery.schedules import crontab
 from dotenv import load_dotenv
 
 
@@ -58,6 +59,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'generator.profiles.ProfileMiddleware',  # Lazy request.profile / request.quota
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -102,6 +104,13 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Transactions take the write lock when they begin, so concurrent
+            # writers queue on the busy timeout instead of failing with
+            # "database is locked" when a read lock can't be upgraded
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+            # A file rather than shared-cache memory, so threaded tests wait on
+            # SQLite's busy timeout instead of failing with "table is locked"
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
         }
     }
 
@@ -153,8 +162,94 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 
+# ========== Generated Archives ==========
+# 'file' stores a zip per site under MEDIA_ROOT, 'stream' keeps only the
+# compressed files in the database and zips them at download time
+SITE_ARCHIVE_MODE = os.getenv('SITE_ARCHIVE_MODE', 'file')
+
+# How stored archives reach the client: 'django' streams them from Python,
+# 'x-accel' (nginx) and 'x-sendfile' (Apache/lighttpd) let the proxy send
+# the file after Django has checked permissions
+SITE_DOWNLOAD_BACKEND = os.getenv('SITE_DOWNLOAD_BACKEND', 'django')
+SITE_DOWNLOAD_ACCEL_PREFIX = os.getenv('SITE_DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+
+# 'atomic' bumps downloads_count with an F() update per download, 'buffered'
+# collects counts per process and flushes them in batches
+DOWNLOAD_COUNTER_MODE = os.getenv('DOWNLOAD_COUNTER_MODE', 'atomic')
+DOWNLOAD_COUNTER_BATCH_SIZE = int(os.getenv('DOWNLOAD_COUNTER_BATCH_SIZE', 50))
+DOWNLOAD_COUNTER_FLUSH_INTERVAL = int(os.getenv('DOWNLOAD_COUNTER_FLUSH_INTERVAL', 30))  # seconds
+
+# ========== Generation Cache ==========
+# Flask projects are deterministic per prompt, so identical prompts share one zip
+GENERATION_CACHE_ENABLED = os.getenv('GENERATION_CACHE_ENABLED', 'True').lower() == 'true'
+GENERATION_CACHE_TTL = int(os.getenv('GENERATION_CACHE_TTL', 7 * 24 * 60 * 60))  # seconds
+GENERATION_CACHE_MAX_ENTRIES = int(os.getenv('GENERATION_CACHE_MAX_ENTRIES', 500))
+GENERATION_CACHE_MAX_BYTES = int(os.getenv('GENERATION_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+
 # ========== Third-Party API Keys ==========
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # Optional OpenAI-compatible endpoint (e.g. a local fake server)
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+# Seconds to cache per-user quota state (0 disables). Invalidated on every
+# profile change; use a shared cache backend when running several processes
+QUOTA_CACHE_TIMEOUT = int(os.getenv("QUOTA_CACHE_TIMEOUT", "0"))
+
+# Public page counters and fragments (see generator/counters.py), seconds
+COUNTER_CACHE_TTL = int(os.getenv("COUNTER_CACHE_TTL", "900"))
+FRAGMENT_CACHE_TTL = int(os.getenv("FRAGMENT_CACHE_TTL", "600"))
+
+# Payment QR codes (see generator/qr.py): 'svg' or 'png' on the payment page,
+# browser cache lifetime of the image and size of the in-process matrix cache
+PAYMENT_QR_FORMAT = os.getenv("PAYMENT_QR_FORMAT", "svg")
+PAYMENT_QR_MAX_AGE = int(os.getenv("PAYMENT_QR_MAX_AGE", str(24 * 60 * 60)))
+
+# ========== Cache Backend ==========
+# Redis when CACHE_URL (or REDIS_URL) is set, shared by every process;
+# otherwise a per-process local-memory cache
+CACHE_URL = os.getenv("CACHE_URL", os.getenv("REDIS_URL", ""))
+if CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+            "KEY_PREFIX": "aiwebgen",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "aiwebgen",
+        }
+    }
+
+# Full-page cache for anonymous visitors (see generator/page_cache.py)
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE_ENABLED", "True").lower() == "true"
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", "3600"))  # Legal and help pages, seconds
+PAGE_CACHE_SHORT_TTL = int(os.getenv("PAGE_CACHE_SHORT_TTL", "300"))  # Pricing and contact
+
+# `manage.py prerender_pages` writes static copies here. Serving them through
+# whitenoise is opt-in: they are the anonymous render, so logged-in visitors
+# would see the logged-out navigation on those URLs
+PRERENDER_ROOT = BASE_DIR / os.getenv("PRERENDER_ROOT", "prerendered")
+SERVE_PRERENDERED_PAGES = os.getenv("SERVE_PRERENDERED_PAGES", "False").lower() == "true"
+if SERVE_PRERENDERED_PAGES:
+    WHITENOISE_ROOT = PRERENDER_ROOT
+    WHITENOISE_INDEX_FILE = True
+
+# Bulk generation API (enterprise)
+BULK_GENERATION_MAX_PROMPTS = int(os.getenv("BULK_GENERATION_MAX_PROMPTS", "50"))
+
+# OpenAI client resilience (see generator/openai_client.py)
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))  # Per-attempt read timeout, seconds
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_DEADLINE = float(os.getenv("OPENAI_DEADLINE", "120"))  # Overall budget per call, including retries
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "10"))  # Keep-alive connections per process
+OPENAI_BREAKER_THRESHOLD = int(os.getenv("OPENAI_BREAKER_THRESHOLD", "5"))  # Consecutive failures before opening
+OPENAI_BREAKER_COOLDOWN = float(os.getenv("OPENAI_BREAKER_COOLDOWN", "30"))  # Seconds before probing again
+OPENAI_METRICS_LOG_INTERVAL = float(os.getenv("OPENAI_METRICS_LOG_INTERVAL", "300"))  # Seconds between metric lines, 0 = off
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 
@@ -183,9 +278,41 @@ else:
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'noreply@aiwebgen.com')
 SERVER_EMAIL = DEFAULT_FROM_EMAIL
 
+# Email outbox (see accounts/emails.py): messages per SMTP connection, tries
+# before a message is marked failed, first retry delay (doubles each time)
+# and how long a worker may hold claimed messages, in seconds
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', 50))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', 5))
+EMAIL_OUTBOX_RETRY_DELAY = int(os.getenv('EMAIL_OUTBOX_RETRY_DELAY', 30))
+EMAIL_OUTBOX_LEASE = int(os.getenv('EMAIL_OUTBOX_LEASE', 300))
+
+# ========== One-Time Codes ==========
+# Where verification codes live (see accounts/otp.py): 'cache' needs the shared
+# cache (CACHE_URL), the per-process LocMem fallback would lose codes between
+# workers, so 'db' is the default without one; lifetime, attempts and resend
+# window in seconds
+OTP_STORE = os.getenv('OTP_STORE', 'cache' if CACHE_URL else 'db')
+OTP_TTL = int(os.getenv('OTP_TTL', 10 * 60))
+OTP_MAX_ATTEMPTS = int(os.getenv('OTP_MAX_ATTEMPTS', 5))
+OTP_RESEND_INTERVAL = int(os.getenv('OTP_RESEND_INTERVAL', 2 * 60))
+
+# ========== Availability Checks ==========
+# Registration form username/email checks (see accounts/availability.py):
+# Bloom filter refresh (seconds) and false-positive rate, and per-IP throttling
+AVAILABILITY_FILTER_REFRESH = int(os.getenv('AVAILABILITY_FILTER_REFRESH', 600))
+AVAILABILITY_FILTER_ERROR_RATE = float(os.getenv('AVAILABILITY_FILTER_ERROR_RATE', 0.01))
+AVAILABILITY_RATE_LIMIT = int(os.getenv('AVAILABILITY_RATE_LIMIT', 30))  # Requests per window
+AVAILABILITY_RATE_WINDOW = int(os.getenv('AVAILABILITY_RATE_WINDOW', 60))
+# Take the client IP from X-Forwarded-For (only behind a proxy that sets it)
+USE_X_FORWARDED_FOR = os.getenv('USE_X_FORWARDED_FOR', 'False').lower() == 'true'
+
 # ========== Site Configuration ==========
 SITE_ID = 1
 
+# ========== Authentication ==========
+# Log in with a username or an email address, in one query (accounts/backends.py)
+AUTHENTICATION_BACKENDS = ['accounts.backends.EmailOrUsernameModelBackend']
+
 # ========== Login/Logout URLs ==========
 LOGIN_URL = '/auth/login/'
 LOGIN_REDIRECT_URL = '/dashboard/'
@@ -195,3 +322,52 @@ LOGOUT_REDIRECT_URL = '/'
 SESSION_COOKIE_AGE = 30 * 24 * 60 * 60  # 30 days
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SECURE = not DEBUG  # True in production with HTTPS
+
+# ========== Background Jobs (Celery) ==========
+# Without a broker, tasks run in-process (eager) so local development and
+# tests work without Redis or a separate worker.
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', os.getenv('REDIS_URL', ''))
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', CELERY_BROKER_URL)
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', str(not CELERY_BROKER_URL)).lower() == 'true'
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['json']
+CELERY_WORKER_CONCURRENCY = int(os.getenv('CELERY_WORKER_CONCURRENCY', 4))
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1  # Generations are long, don't hoard jobs
+CELERY_TASK_TIME_LIMIT = int(os.getenv('GENERATION_TIME_LIMIT', 300))
+# Raised inside the task first, so it can fail the site and refund its quota
+CELERY_TASK_SOFT_TIME_LIMIT = int(os.getenv('GENERATION_SOFT_TIME_LIMIT', CELERY_TASK_TIME_LIMIT - 30))
+# Pending sites a worker started this long ago were lost (hard limit, OOM, SIGKILL);
+# keep it above CELERY_TASK_TIME_LIMIT and OPENAI_DEADLINE (streamed generations)
+GENERATION_STALE_AFTER = int(os.getenv('GENERATION_STALE_AFTER', CELERY_TASK_TIME_LIMIT + 60))
+# Pending sites no worker has picked up in this long were lost with their message
+GENERATION_QUEUE_TIMEOUT = int(os.getenv('GENERATION_QUEUE_TIMEOUT', 60 * 60))
+# Run `celery -A ai_webgen beat` alongside the workers for scheduled jobs
+CELERY_BEAT_SCHEDULE = {
+    # Paid-plan allowances reset with each calendar month
+    'open-usage-periods': {
+        'task': 'generator.tasks.open_usage_periods',
+        'schedule': crontab(minute=5, hour=0, day_of_month=1),
+    },
+    # Fail and refund generations whose worker died without settling them
+    'fail-stale-generations': {
+        'task': 'generator.tasks.fail_stale_generations',
+        'schedule': crontab(minute='*/5'),
+    },
+    # Keep the public page counters warm (well inside COUNTER_CACHE_TTL)
+    'refresh-counters': {
+        'task': 'generator.tasks.refresh_counters',
+        'schedule': crontab(minute='*/10'),
+    },
+    # Availability filter of existing usernames/emails, shared through the cache
+    'rebuild-availability-filter': {
+        'task': 'accounts.tasks.rebuild_availability_filter',
+        'schedule': crontab(minute='*/10'),
+    },
+    # Retry outbox email whose backoff has elapsed
+    'drain-email-outbox': {
+        'task': 'accounts.tasks.send_outbox',
+        'schedule': crontab(),
+    },
+}
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import GeneratedSite, UserProfile, Suggestion, Payment
+from django.core.exceptions import PermissionDenied
+from .models import GeneratedSite, UserProfile, Suggestion, Payment, GenerationCacheEntry, GenerationBatch, UserSiteStats, UsagePeriod, UsageEvent
+from .search import search_admin_sites
 
 
 @admin.register(GeneratedSite)
@@ -8,6 +10,22 @@ class GeneratedSiteAdmin(admin.ModelAdmin):
     list_filter = ['status', 'created_at']
     search_fields = ['user__username', 'prompt']
     readonly_fields = ['created_at', 'generation_time']
+    list_select_related = ['user']
+    # Newest first on the (created_at, id) key the indexes cover, and no
+    # second COUNT(*) over the whole table for the "N total" link
+    ordering = ['-created_at', '-id']
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            # The list never shows the prompt body
+            queryset = queryset.defer('prompt')
+        return queryset
+
+    def get_search_results(self, request, queryset, search_term):
+        # Full-text index instead of an icontains scan over every prompt
+        return search_admin_sites(queryset, search_term), False
 
 
 @admin.register(UserProfile)
@@ -64,3 +82,59 @@ class PaymentAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(GenerationCacheEntry)
+class GenerationCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ['key', 'generator_version', 'hit_count', 'miss_count', 'size_bytes', 'created_at', 'last_used_at']
+    list_filter = ['generator_version']
+    search_fields = ['key']
+    readonly_fields = ['created_at', 'last_used_at', 'hit_count', 'miss_count']
+
+
+@admin.register(GenerationBatch)
+class GenerationBatchAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'status', 'total_items', 'combined_archive', 'created_at', 'completed_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['user__username']
+    readonly_fields = ['created_at', 'completed_at']
+
+
+@admin.register(UserSiteStats)
+class UserSiteStatsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'total_sites', 'completed_sites', 'failed_sites', 'total_downloads', 'updated_at']
+    search_fields = ['user__username']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(UsagePeriod)
+class UsagePeriodAdmin(admin.ModelAdmin):
+    list_display = ['user', 'period', 'plan', 'used', 'limit', 'generated', 'updated_at']
+    list_filter = ['period', 'plan']
+    search_fields = ['user__username']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(UsageEvent)
+class UsageEventAdmin(admin.ModelAdmin):
+    list_display = ['user', 'kind', 'quantity', 'period', 'site', 'created_at']
+    list_filter = ['kind', 'period']
+    search_fields = ['user__username']
+    list_select_related = ['user']
+    raw_id_fields = ['site']
+
+    # Append-only ledger: read-only here. Delete permission is left alone so
+    # deleting a user cascades to their events; only direct deletes are refused
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def delete_view(self, request, object_id, extra_context=None):
+        raise PermissionDenied
@@ -1,8 +1,16 @@
-import os, zipfile
-from openai import OpenAI
+import os, time, uuid, zipfile
+import httpx
 from django.conf import settings
+from django.utils import timezone
 from pathlib import Path
-from .flask_templates import generate_flask_project
+from .artifacts import ProjectArtifact, RenderedFile
+from .classifier import classify
+from .flask_templates import extract_project_name, extract_app_type
+from .openai_client import RETRYABLE_ERRORS, CircuitOpenError, DeadlineExceeded, get_openai_manager
+from .template_registry import render_project
+from .zipstream import iter_zip
+
+OPENAI_MODEL = getattr(settings, 'OPENAI_MODEL', 'gpt-4o-mini')
 
 # Initialize OpenAI client with error handling
 try:
@@ -10,26 +18,27 @@ try:
         print("⚠️  Warning: OPENAI_API_KEY not found in settings. Website generation will use fallback.")
         client = None
     else:
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        # Pooled client with deadlines, retries and a circuit breaker (see openai_client)
+        client = get_openai_manager()
         print("✅ OpenAI client initialized successfully")
 except Exception as e:
     print(f"❌ Error initializing OpenAI client: {e}")
     client = None
 
-def generate_website_code(prompt: str) -> str:
+class GenerationError(Exception):
+    """Raised when no website could be generated for a prompt"""
+
+
+def generate_website_code(prompt: str) -> ProjectArtifact:
     """Generate a complete Flask project based on user prompt"""
     
     print(f"🚀 Generating Flask project for: {prompt}")
     
     try:
-        # Generate Flask project files using templates
-        flask_files = generate_flask_project(prompt)
+        artifact = build_flask_artifact(prompt)
         
-        print(f"✅ Generated {len(flask_files)} files for Flask project")
-        
-        # Return the project files as a special marker for processing
-        # We'll handle this in save_website_as_zip function
-        return f"FLASK_PROJECT:{len(flask_files)} files generated"
+        print(f"✅ Generated {len(artifact.files)} files for Flask project")
+        return artifact
         
     except Exception as e:
         print(f"❌ Error generating Flask project: {e}")
@@ -37,16 +46,110 @@ def generate_website_code(prompt: str) -> str:
         return generate_openai_website(prompt)
 
 
+def build_flask_artifact(prompt: str) -> ProjectArtifact:
+    """Classify the prompt and render every Flask project file exactly once"""
+    start = time.perf_counter()
+    project_name = extract_project_name(prompt)
+    app_type = extract_app_type(prompt)
+    classified = time.perf_counter()
+    
+    # Only the prompt-specific files are rendered here, the rest is pre-rendered
+    files = render_project(prompt, project_name, app_type)
+    
+    artifact = ProjectArtifact(
+        kind='flask',
+        files=files,
+        app_type=app_type,
+        project_name=project_name,
+    )
+    artifact.record_timing('classify', classified - start)
+    artifact.record_timing('render', time.perf_counter() - classified)
+    return artifact
+
 
-def generate_openai_website(prompt: str) -> str:
+def generate_openai_website(prompt: str) -> ProjectArtifact:
     """Generate website using OpenAI (fallback method)"""
+    start = time.perf_counter()
+    
     # Check if OpenAI client is available
     if not client:
-        return generate_fallback_website(prompt)
+        artifact = build_html_artifact(generate_fallback_website(prompt), prompt)
+        artifact.record_timing('render', time.perf_counter() - start)
+        return artifact
     
     try:
-        # Enhanced system prompt for better website generation
-        system_prompt = """You are an expert web developer that creates complete, professional websites. 
+        response = client.chat_completion(
+            model=OPENAI_MODEL,
+            messages=build_openai_messages(prompt),
+            temperature=0.7,
+            max_tokens=16384  # Increased from 1000 to 8000 for complete websites
+        )
+
+        code = finalize_html(response.choices[0].message.content, response.choices[0].finish_reason)
+        
+    except (CircuitOpenError, *RETRYABLE_ERRORS) as e:
+        # Upstream is failing (breaker open, or retries and deadline used up): degrade
+        print(f"⚠️  OpenAI unavailable ({type(e).__name__}), using fallback website")
+        artifact = build_html_artifact(generate_fallback_website(prompt), prompt)
+        artifact.record_timing('render', time.perf_counter() - start)
+        return artifact
+    except Exception as e:
+        raise GenerationError(f"Error: {str(e)}") from e
+    
+    artifact = build_html_artifact(code, prompt)
+    artifact.record_timing('llm', time.perf_counter() - start)
+    return artifact
+
+
+def stream_openai_website(prompt: str):
+    """
+    Stream the website from OpenAI as it is written.
+    Yields text chunks; the generator's return value is the final, finalized HTML.
+    """
+    if not client:
+        code = generate_fallback_website(prompt)
+        yield code
+        return code
+    
+    parts = []
+    try:
+        stream = client.stream_chat_completion(
+            model=OPENAI_MODEL,
+            messages=build_openai_messages(prompt),
+            temperature=0.7,
+            max_tokens=16384,
+        )
+        
+        finish_reason = None
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            if choice.delta and choice.delta.content:
+                parts.append(choice.delta.content)
+                yield choice.delta.content
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+        
+    except (CircuitOpenError, *RETRYABLE_ERRORS, httpx.HTTPError, DeadlineExceeded) as e:
+        if parts:
+            # Part of the OpenAI page has already reached the client; a
+            # different page can't be spliced on, so the stream fails
+            raise GenerationError(f"Error: {str(e)}") from e
+        print(f"⚠️  OpenAI unavailable ({type(e).__name__}), using fallback website")
+        code = generate_fallback_website(prompt)
+        yield code
+        return code
+    except Exception as e:
+        raise GenerationError(f"Error: {str(e)}") from e
+    
+    return finalize_html(''.join(parts), finish_reason)
+
+
+def build_openai_messages(prompt: str) -> list:
+    """Chat messages asking the model for a complete single-file website"""
+    # Enhanced system prompt for better website generation
+    system_prompt = """You are an expert web developer that creates complete, professional websites. 
         Generate a full HTML page with embedded CSS and JavaScript that includes:
         1. Complete HTML structure with proper DOCTYPE, head, and body
         2. Embedded CSS styles for modern, responsive design
@@ -56,9 +159,9 @@ def generate_openai_website(prompt: str) -> str:
         6. All code in a single HTML file
         
         Make sure the website is complete and fully functional. Do not truncate the response."""
-        
-        # Enhanced user prompt
-        enhanced_prompt = f"""Create a complete, professional website for: {prompt}
+    
+    # Enhanced user prompt
+    enhanced_prompt = f"""Create a complete, professional website for: {prompt}
         
         Requirements:
         - Single HTML file with embedded CSS and JS
@@ -69,81 +172,48 @@ def generate_openai_website(prompt: str) -> str:
         - Complete and functional code
         
         Generate the COMPLETE website code:"""
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": enhanced_prompt}
-            ],
-            temperature=0.7,
-            max_tokens=16384  # Increased from 1000 to 8000 for complete websites
-        )
+    
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": enhanced_prompt}
+    ]
 
-        code = response.choices[0].message.content
-        
-        # Check if response was truncated and handle it
-        if response.choices[0].finish_reason == 'length':
-            print("Warning: Response was truncated due to token limit")
-            # Try to ensure we have at least a closing html tag
-            if not code.strip().endswith('</html>'):
-                code += "\n</body>\n</html>"
-        
-        # Validate that we have a complete HTML structure
-        if not code.strip().startswith('<!DOCTYPE') and not code.strip().startswith('<html'):
-            code = f"<!DOCTYPE html>\n<html lang='en'>\n<head>\n<meta charset='UTF-8'>\n<meta name='viewport' content='width=device-width, initial-scale=1.0'>\n<title>Generated Website</title>\n</head>\n<body>\n{code}\n</body>\n</html>"
-        
-        return code
 
-    except Exception as e:
-        return f"Error: {str(e)}"
+def finalize_html(code: str, finish_reason: str = None) -> str:
+    """Repair truncated or fragment-only model output into a complete HTML page"""
+    code = code or ""
+    
+    # Check if response was truncated and handle it
+    if finish_reason == 'length':
+        print("Warning: Response was truncated due to token limit")
+        # Try to ensure we have at least a closing html tag
+        if not code.strip().endswith('</html>'):
+            code += "\n</body>\n</html>"
+    
+    # Validate that we have a complete HTML structure
+    if not code.strip().startswith('<!DOCTYPE') and not code.strip().startswith('<html'):
+        code = f"<!DOCTYPE html>\n<html lang='en'>\n<head>\n<meta charset='UTF-8'>\n<meta name='viewport' content='width=device-width, initial-scale=1.0'>\n<title>Generated Website</title>\n</head>\n<body>\n{code}\n</body>\n</html>"
+    
+    return code
 
 
-def save_website_as_zip(site_obj, code: str):
+def build_html_artifact(code: str, prompt: str = '', generated_on=None) -> ProjectArtifact:
     """
-    Save the generated Flask project or HTML code into a zip file and attach to GeneratedSite.
-    Creates a professional project structure.
+    Split a single-page HTML website into its project files.
+    Embedded CSS and JS are moved to their own files when present.
     """
-    try:
-        site_dir = Path(settings.MEDIA_ROOT) / "sites"
-        site_dir.mkdir(parents=True, exist_ok=True)
-
-        # Define paths
-        zip_path = site_dir / f"site_{site_obj.id}.zip"
-        
-        # Check if this is a Flask project or HTML code
-        if code.startswith("FLASK_PROJECT:"):
-            # Generate Flask project files
-            flask_files = generate_flask_project(site_obj.prompt)
-            
-            # Create the zip file with Flask project structure
-            with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-                for file_path, file_content in flask_files.items():
-                    zipf.writestr(file_path, file_content)
-            
-            # Store a summary of the Flask project as generated_code
-            site_obj.generated_code = f"Flask Project with {len(flask_files)} files: {', '.join(list(flask_files.keys())[:10])}..."
-            
-        else:
-            # Handle traditional HTML generation
-            # Try to extract CSS and JS from the HTML if they're embedded
-            html_content, css_content, js_content = extract_embedded_assets(code)
-            
-            # Create the zip file with proper structure
-            with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-                # Add main HTML file
-                zipf.writestr("index.html", html_content)
-                
-                # Add CSS file if extracted
-                if css_content:
-                    zipf.writestr("styles.css", css_content)
-                    
-                # Add JS file if extracted  
-                if js_content:
-                    zipf.writestr("script.js", js_content)
-                    
-                # Add a README with instructions
-                readme_content = f"""# Generated Website
+    start = time.perf_counter()
+    generated_on = generated_on or timezone.now()
+    html_content, css_content, js_content = extract_embedded_assets(code)
+    
+    files = {"index.html": RenderedFile.from_text(html_content)}
+    if css_content:
+        files["styles.css"] = RenderedFile.from_text(css_content)
+    if js_content:
+        files["script.js"] = RenderedFile.from_text(js_content)
+    
+    # Add a README with instructions
+    files["README.md"] = RenderedFile.from_text(f"""# Generated Website
 
 This website was generated by AI Website Generator.
 
@@ -157,18 +227,63 @@ This website was generated by AI Website Generator.
 2. Open index.html in a web browser
 3. Upload to any web hosting service
 
-## Generated on: {site_obj.created_at.strftime('%Y-%m-%d %H:%M:%S')}
-"""
-                zipf.writestr("README.md", readme_content)
-                
-            # Store the HTML code
-            site_obj.generated_code = code
+## Generated on: {generated_on.strftime('%Y-%m-%d %H:%M:%S')}
+""")
+    
+    artifact = ProjectArtifact(
+        kind='html',
+        files=files,
+        app_type=extract_business_type(prompt),
+        project_name=extract_business_name(prompt),
+        source_code=code,
+    )
+    artifact.record_timing('split', time.perf_counter() - start)
+    return artifact
+
+
+def save_website_as_zip(site_obj, artifact: ProjectArtifact, archive_name: str = None):
+    """
+    Save the generated project files into a zip file and attach to GeneratedSite.
+    The artifact already holds every file, so nothing is regenerated here.
+    ``archive_name`` overrides the default media path (e.g. for shared cached archives).
+    """
+    try:
+        # Store the HTML code, or a summary of the Flask project
+        site_obj.generated_code = artifact.source_code or artifact.summary()
+        
+        if getattr(settings, 'SITE_ARCHIVE_MODE', 'file') == 'stream':
+            # Archives are built on the fly at download time from the stored
+            # files, so template changes never alter a delivered project
+            site_obj.generated_code = artifact.source_code or artifact.stored_text()
+            site_obj.status = "completed"
+            site_obj.save()
+            return
+        
+        start = time.perf_counter()
+        archive_name = archive_name or f"sites/site_{site_obj.id}.zip"
+
+        # Define paths
+        zip_path = Path(settings.MEDIA_ROOT) / archive_name
+        zip_path.parent.mkdir(parents=True, exist_ok=True)
+        # Unique per writer: threads of one process may build the same cached archive
+        tmp_path = zip_path.with_name(f"{zip_path.name}.{uuid.uuid4().hex}.tmp")
+        
+        # Create the zip file from the pre-deflated entries, then move it into
+        # place so readers never see a half-written archive
+        with open(tmp_path, "wb") as zipf:
+            for chunk in iter_zip(artifact.files.items()):
+                zipf.write(chunk)
+        os.replace(tmp_path, zip_path)
+        
+        artifact.record_timing('zip', time.perf_counter() - start)
 
         # Save file reference to DB
-        site_obj.generated_file.name = f"sites/site_{site_obj.id}.zip"
+        site_obj.generated_file.name = archive_name
         site_obj.status = "completed"
         site_obj.save()
         
+        print(f"📦 Site {site_obj.id} ({artifact.kind}) stage timings: {artifact.timings}")
+        
     except (IOError, OSError, zipfile.BadZipFile) as e:
         print(f"Error creating zip file for site {site_obj.id}: {e}")
         site_obj.status = "failed"
@@ -180,15 +295,6 @@ This website was generated by AI Website Generator.
         site_obj.status = "failed"
         site_obj.save()
         raise Exception(f"Failed to save website: {str(e)}")
-        
-    finally:
-        # Clean up temp directory
-        try:
-            if 'temp_dir' in locals() and temp_dir.exists():
-                import shutil
-                shutil.rmtree(temp_dir, ignore_errors=True)
-        except Exception as e:
-            print(f"Warning: Failed to clean up temp directory: {e}")
 
 
 def extract_embedded_assets(html_code: str) -> tuple:
@@ -230,11 +336,10 @@ def test_generate_simple_website():
     test_prompt = "Create a simple landing page for a coffee shop called 'Mauli Café' with a hero section, menu, and contact information."
     
     try:
-        code = generate_website_code(test_prompt)
-        print(f"Generated {len(code)} characters of code")
-        print(f"Code starts with: {code[:100]}...")
-        print(f"Code ends with: ...{code[-100:]}")
-        return code
+        artifact = generate_website_code(test_prompt)
+        print(f"Generated {len(artifact.files)} {artifact.kind} files: {', '.join(artifact.files)}")
+        print(f"Stage timings: {artifact.timings}")
+        return artifact
     except Exception as e:
         print(f"Test generation failed: {e}")
         return None
@@ -569,54 +674,11 @@ def extract_business_name(prompt: str) -> str:
     """
     Extract business name from prompt or generate a default one.
     """
-    import re
-    
-    # Look for common patterns like "for [business name]" or "called [business name]"
-    patterns = [
-        r'for\s+([A-Z][\w\s&]+?)(?:\s+with|\s+that|\.|$)',
-        r'called\s+["\']([^"\']+)["\']',
-        r'called\s+([A-Z][\w\s&]+?)(?:\s+with|\s+that|\.|$)',
-        r'named\s+([A-Z][\w\s&]+?)(?:\s+with|\s+that|\.|$)',
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, prompt, re.IGNORECASE)
-        if match:
-            name = match.group(1).strip()
-            if len(name) > 2 and len(name) < 50:
-                return name
-    
-    # If no business name found, generate based on business type
-    business_type = extract_business_type(prompt)
-    if 'restaurant' in business_type.lower() or 'food' in business_type.lower():
-        return "Delicious Eats"
-    elif 'coffee' in business_type.lower() or 'caf' in business_type.lower():
-        return "Mauli Café"
-    elif 'shop' in business_type.lower() or 'store' in business_type.lower():
-        return "Quality Store"
-    else:
-        return "Professional Business"
+    return classify(prompt).business_name
 
 
 def extract_business_type(prompt: str) -> str:
     """
     Extract business type from prompt.
     """
-    prompt_lower = prompt.lower()
-    
-    business_types = {
-        'restaurant': ['restaurant', 'dining', 'food', 'cuisine', 'menu'],
-        'coffee shop': ['coffee', 'café', 'cafe', 'espresso', 'latte'],
-        'retail store': ['shop', 'store', 'retail', 'boutique', 'market'],
-        'consulting firm': ['consulting', 'consultant', 'advisory', 'services'],
-        'tech company': ['tech', 'software', 'app', 'digital', 'technology'],
-        'healthcare': ['medical', 'healthcare', 'clinic', 'doctor', 'health'],
-        'fitness center': ['gym', 'fitness', 'workout', 'exercise', 'training'],
-        'salon': ['salon', 'beauty', 'hair', 'spa', 'cosmetic'],
-    }
-    
-    for business_type, keywords in business_types.items():
-        if any(keyword in prompt_lower for keyword in keywords):
-            return business_type
-    
-    return "business"
+    return classify(prompt).business_type
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class GeneratorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'generator'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from .search import ensure_sqlite_triggers
+        post_migrate.connect(ensure_sqlite_triggers, sender=self)
+        from . import counters, profiles, quota  # noqa: F401  (signal receivers)
@@ -0,0 +1,65 @@
+"""
+In-memory representation of a generated website project.
+
+A ProjectArtifact is built once by the generator and handed as-is to zip
+creation and persistence, so no stage ever has to regenerate the files.
+"""
+import json
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+# generated_code of Flask sites holds a summary starting with this prefix
+FLASK_SUMMARY_PREFIX = "Flask Project with"
+
+
+@dataclass(frozen=True)
+class RenderedFile:
+    """A file's content as text, UTF-8 bytes and a pre-deflated blob ready for zipping"""
+    text: str
+    data: bytes
+    crc32: int
+    deflated: bytes
+
+    @classmethod
+    def from_text(cls, text: str) -> 'RenderedFile':
+        data = text.encode('utf-8')
+        # Raw deflate stream (no zlib header), exactly what a zip entry stores
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        deflated = compressor.compress(data) + compressor.flush()
+        return cls(text=text, data=data, crc32=zlib.crc32(data), deflated=deflated)
+
+
+@dataclass
+class ProjectArtifact:
+    """Generated project files plus metadata about how they were built"""
+    kind: str                      # 'flask' or 'html'
+    files: Dict[str, RenderedFile]  # archive path -> rendered file
+    app_type: str = 'general'
+    project_name: str = ''
+    source_code: str = ''          # raw HTML for the 'html' kind
+    timings: Dict[str, float] = field(default_factory=dict)  # stage -> seconds
+
+    @property
+    def is_flask(self) -> bool:
+        return self.kind == 'flask'
+
+    def summary(self) -> str:
+        """Short description stored for projects without a single source file"""
+        return f"{FLASK_SUMMARY_PREFIX} {len(self.files)} files: {', '.join(list(self.files.keys())[:10])}..."
+
+    def stored_text(self) -> str:
+        """Summary line followed by every file as JSON, enough to rebuild the archive as delivered"""
+        files = {path: rendered.text for path, rendered in self.files.items()}
+        return f"{self.summary()}\n{json.dumps(files)}"
+
+    def record_timing(self, stage: str, seconds: float):
+        self.timings[stage] = round(self.timings.get(stage, 0) + seconds, 4)
+
+
+def stored_files(text: str) -> Optional[Dict[str, RenderedFile]]:
+    """Files saved by ProjectArtifact.stored_text, or None for a bare summary"""
+    _, newline, payload = text.partition('\n')
+    if not newline:
+        return None
+    return {path: RenderedFile.from_text(content) for path, content in json.loads(payload).items()}
@@ -0,0 +1,53 @@
+"""
+Bulk generation helpers.
+
+A batch renders its prompts one after another in the worker. Rendering a
+Flask project takes well under a millisecond, so even a full batch costs
+less than starting a process pool would.
+"""
+import os
+import shutil
+import zipfile
+from pathlib import Path
+
+from django.conf import settings
+
+from .ai_service import build_flask_artifact
+from .downloads import generated_archive_entries
+from .zipstream import iter_zip
+
+
+def render_many(prompts):
+    """
+    Build Flask artifacts for ``prompts``, in order. Failed items come back as
+    the exception instead of an artifact.
+    """
+    results = []
+    for prompt in prompts:
+        try:
+            results.append(build_flask_artifact(prompt))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def save_combined_archive(batch, sites):
+    """Write one zip holding each completed site's archive as website_<id>.zip"""
+    archive_name = f"sites/batches/batch_{batch.id}.zip"
+    zip_path = Path(settings.MEDIA_ROOT) / archive_name
+    zip_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = zip_path.with_name(f"{zip_path.name}.{os.getpid()}.tmp")
+
+    # Site archives are already deflated, so store them as-is
+    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED) as combined:
+        for site in sites:
+            with combined.open(f"website_{site.id}.zip", 'w') as member:
+                if site.generated_file:
+                    with site.generated_file.open('rb') as source:
+                        shutil.copyfileobj(source, member, 64 * 1024)
+                else:
+                    for chunk in iter_zip(generated_archive_entries(site), site.created_at.timestamp()):
+                        member.write(chunk)
+    os.replace(tmp_path, zip_path)
+
+    batch.archive.name = archive_name
@@ -0,0 +1,183 @@
+"""
+Prompt classifier shared by the Flask generator and the HTML fallback.
+
+Every keyword of every taxonomy (Flask app types and business types) is
+compiled into one alternation regex, so a prompt is scanned once and every
+category is scored by its number of keyword hits. The highest score wins;
+ties go to the category declared first, which keeps the old priorities for
+prompts that only hit one category. Keywords match at the start of a word
+("shop" matches "shopping" but "app" no longer matches "happy").
+
+Results are cached by prompt hash, so repeated prompts skip the scan and the
+name patterns altogether.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List
+
+APP_TYPES: Dict[str, List[str]] = {
+    'ecommerce': ['shop', 'store', 'ecommerce', 'commerce', 'product', 'cart'],
+    'blog': ['blog', 'news', 'article', 'post', 'content'],
+    'task_manager': ['task', 'todo', 'project', 'manage', 'organize'],
+    'social': ['chat', 'message', 'social', 'friend', 'community'],
+    'crm': ['customer', 'crm', 'client', 'contact', 'lead'],
+    'portfolio': ['portfolio', 'showcase', 'gallery', 'work'],
+    'dashboard': ['dashboard', 'analytics', 'admin', 'panel'],
+}
+
+BUSINESS_TYPES: Dict[str, List[str]] = {
+    'restaurant': ['restaurant', 'dining', 'food', 'cuisine', 'menu'],
+    'coffee shop': ['coffee', 'café', 'cafe', 'espresso', 'latte'],
+    'retail store': ['shop', 'store', 'retail', 'boutique', 'market'],
+    'consulting firm': ['consulting', 'consultant', 'advisory', 'services'],
+    'tech company': ['tech', 'software', 'app', 'digital', 'technology'],
+    'healthcare': ['medical', 'healthcare', 'clinic', 'doctor', 'health'],
+    'fitness center': ['gym', 'fitness', 'workout', 'exercise', 'training'],
+    'salon': ['salon', 'beauty', 'hair', 'spa', 'cosmetic'],
+}
+
+TAXONOMIES = {'app_type': APP_TYPES, 'business_type': BUSINESS_TYPES}
+DEFAULTS = {'app_type': 'general', 'business_type': 'business'}
+
+PROJECT_NAME_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(?:for|called|named)\s+["\']([^"\']+)["\']',
+    r'(?:for|called|named)\s+([A-Z][a-zA-Z\s&]+?)(?:\s+(?:with|that|app)|[.,]|$)',
+    r'(?:build|create|make)\s+(?:a|an)?\s*([A-Z][a-zA-Z\s]+?)(?:\s+(?:app|application|website))',
+)]
+
+BUSINESS_NAME_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'for\s+([A-Z][\w\s&]+?)(?:\s+with|\s+that|\.|$)',
+    r'called\s+["\']([^"\']+)["\']',
+    r'called\s+([A-Z][\w\s&]+?)(?:\s+with|\s+that|\.|$)',
+    r'named\s+([A-Z][\w\s&]+?)(?:\s+with|\s+that|\.|$)',
+)]
+
+DEFAULT_PROJECT_NAMES = {
+    'ecommerce': "E-Commerce Store",
+    'blog': "Blog Platform",
+    'task_manager': "Task Manager",
+    'social': "Social Platform",
+}
+
+DEFAULT_BUSINESS_NAMES = {
+    'restaurant': "Delicious Eats",
+    'coffee shop': "Mauli Café",
+    'retail store': "Quality Store",
+}
+
+CACHE_SIZE = 8192
+
+
+@dataclass(frozen=True)
+class PromptClassification:
+    app_type: str
+    business_type: str
+    project_name: str
+    business_name: str
+
+
+def _trie_pattern(words) -> str:
+    """
+    Alternation regex factored by common prefixes ("ca(?:fe|rt)"), which the
+    backtracking re engine scans far faster than a flat list of keywords.
+    Optional suffixes are greedy, so the longest keyword at a position wins.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f"(?:{body})?" if '' in node else body
+
+    return build(trie)
+
+
+def _build_index():
+    """keyword -> [(taxonomy, category)] and the single regex over all keywords"""
+    index = {}
+    for taxonomy, categories in TAXONOMIES.items():
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                index.setdefault(keyword, []).append((taxonomy, category))
+    # Keywords are lowercase and the prompt is lowered once, so no IGNORECASE
+    return index, re.compile(r'\b' + _trie_pattern(index))
+
+
+KEYWORD_INDEX, KEYWORD_RE = _build_index()
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def score(prompt: str) -> Dict[str, Dict[str, int]]:
+    """Keyword hits per category of every taxonomy, from a single scan"""
+    scores = {taxonomy: {} for taxonomy in TAXONOMIES}
+    for keyword in KEYWORD_RE.findall(prompt.lower()):
+        for taxonomy, category in KEYWORD_INDEX[keyword]:
+            scores[taxonomy][category] = scores[taxonomy].get(category, 0) + 1
+    return scores
+
+
+def _best(taxonomy: str, scores: Dict[str, int]) -> str:
+    best, best_score = DEFAULTS[taxonomy], 0
+    # Declared order breaks ties
+    for category in TAXONOMIES[taxonomy]:
+        if scores.get(category, 0) > best_score:
+            best, best_score = category, scores[category]
+    return best
+
+
+def _match_name(patterns, prompt: str, min_length: int, max_length: int):
+    for pattern in patterns:
+        match = pattern.search(prompt)
+        if match:
+            name = match.group(1).strip()
+            if min_length <= len(name) <= max_length:
+                return name
+    return None
+
+
+def _classify(prompt: str) -> PromptClassification:
+    scores = score(prompt)
+    app_type = _best('app_type', scores['app_type'])
+    business_type = _best('business_type', scores['business_type'])
+    project_name = (_match_name(PROJECT_NAME_PATTERNS, prompt, 3, 30)
+                    or DEFAULT_PROJECT_NAMES.get(app_type, "Flask Application"))
+    business_name = (_match_name(BUSINESS_NAME_PATTERNS, prompt, 3, 49)
+                     or DEFAULT_BUSINESS_NAMES.get(business_type, "Professional Business"))
+    return PromptClassification(app_type, business_type, project_name, business_name)
+
+
+def classify(prompt: str, use_cache: bool = True) -> PromptClassification:
+    """Classify a prompt, reusing the result for prompts seen recently"""
+    if not use_cache:
+        return _classify(prompt)
+
+    key = hashlib.blake2b(prompt.encode('utf-8'), digest_size=16).digest()
+    with _cache_lock:
+        result = _cache.get(key)
+        if result is not None:
+            _cache.move_to_end(key)
+            return result
+
+    result = _classify(prompt)
+    with _cache_lock:
+        _cache[key] = result
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
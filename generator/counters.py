@@ -0,0 +1,97 @@
+"""
+Global counters and cached page fragments for the public pages.
+
+Counters (e.g. completed websites on the About page) live in the cache.
+Signals adjust them as rows change, and ``refresh_counters`` recomputes
+them on Celery beat before they expire, so a page view reads one cache key
+and runs no query. On a miss, e.g. a cold cache, the counter is recomputed
+inline. With a per-process cache the signal updates only reach the process
+that made the change, and the periodic recompute bounds the drift.
+
+Rendered fragments are cached with ``{% cache %}`` in the templates and
+deleted here when the rows they show change.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import GeneratedSite, Suggestion
+
+# name -> function computing the value from the database
+COUNTERS = {
+    'completed_sites': lambda: GeneratedSite.objects.filter(status='completed').count(),
+}
+
+# Fragment names used with {% cache %}, and the models whose changes invalidate them
+FRAGMENTS = {
+    'implemented_suggestions': Suggestion,
+}
+
+
+def counter_key(name) -> str:
+    return f"counters:{name}"
+
+
+def get(name) -> int:
+    value = cache.get(counter_key(name))
+    if value is None:
+        value = recompute(name)
+    return value
+
+
+def recompute(name) -> int:
+    value = COUNTERS[name]()
+    cache.set(counter_key(name), value, getattr(settings, 'COUNTER_CACHE_TTL', 900))
+    return value
+
+
+def recompute_all():
+    return {name: recompute(name) for name in COUNTERS}
+
+
+def adjust(name, delta):
+    """Add ``delta`` once the current transaction commits (a missing key is left to recompute)"""
+    def apply():
+        try:
+            cache.incr(counter_key(name), delta)
+        except ValueError:
+            pass
+    transaction.on_commit(apply)
+
+
+def invalidate_fragment(name):
+    cache.delete(make_template_fragment_key(name))
+
+
+@receiver(post_save, sender=GeneratedSite)
+def count_completed_site(sender, instance, created, **kwargs):
+    if created:
+        previous = None
+    elif hasattr(instance, '_counted'):
+        # save() still holds the previously counted (user, status) at this point
+        previous = instance._counted[1]
+    else:
+        return  # Loaded without its status, so the save can't have changed it
+    if previous == instance.status:
+        return
+    if instance.status == 'completed':
+        adjust('completed_sites', 1)
+    elif previous == 'completed':
+        adjust('completed_sites', -1)
+
+
+@receiver(post_delete, sender=GeneratedSite)
+def uncount_deleted_site(sender, instance, **kwargs):
+    if instance.status == 'completed':
+        adjust('completed_sites', -1)
+
+
+@receiver(post_save, sender=Suggestion)
+@receiver(post_delete, sender=Suggestion)
+def suggestion_changed(sender, instance, **kwargs):
+    for name, model in FRAGMENTS.items():
+        if model is sender:
+            invalidate_fragment(name)
@@ -0,0 +1,247 @@
+"""
+Streaming responses for generated website archives.
+
+Stored zips are served as chunked FileResponses with ETag/If-None-Match and
+single-range (Range: bytes=...) support. Sites generated in the on-the-fly
+archive mode have no stored zip; their archive is rebuilt from the files saved
+with the site and streamed entry by entry. Either way a download uses constant
+memory per connection.
+
+With SITE_DOWNLOAD_BACKEND set to 'x-accel' (nginx) or 'x-sendfile'
+(Apache/lighttpd), Django only checks permissions and hands the stored file to
+the front proxy, so no archive bytes pass through the Python workers.
+
+Download counts are bumped with an atomic F() update, or buffered per process
+and flushed in batches (and on a timer) when DOWNLOAD_COUNTER_MODE is 'buffered'.
+"""
+import atexit
+import re
+import threading
+import time
+from collections import Counter
+from urllib.parse import quote
+
+from django.conf import settings
+from django import db
+from django.db import transaction
+from django.db.models import F
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
+
+from .ai_service import build_flask_artifact, build_html_artifact
+from .artifacts import FLASK_SUMMARY_PREFIX, stored_files
+from .models import GeneratedSite, UserSiteStats
+from .zipstream import iter_zip, zip_size
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def archive_filename(site) -> str:
+    return f"website_{site.id}.zip"
+
+
+def serve_archive(request, site):
+    """Response for a site's archive, stored or built on the fly"""
+    if not site.generated_file:
+        return stream_generated_archive(site)
+
+    backend = getattr(settings, 'SITE_DOWNLOAD_BACKEND', 'django')
+    if backend in ('x-accel', 'x-sendfile'):
+        return offload_archive(site.generated_file, archive_filename(site), backend)
+    return serve_stored_archive(request, site.generated_file, archive_filename(site))
+
+
+def offload_archive(field_file, filename, backend):
+    """Empty response telling the front proxy which file to send"""
+    response = HttpResponse(content_type='application/zip')
+    if backend == 'x-accel':
+        prefix = getattr(settings, 'SITE_DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(field_file.name)
+    else:
+        response['X-Sendfile'] = field_file.path
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def serve_stored_archive(request, field_file, filename):
+    """Chunked FileResponse with conditional GET and byte-range support"""
+    storage = field_file.storage
+    size = storage.size(field_file.name)
+    modified = storage.get_modified_time(field_file.name)
+    etag = f'"{size:x}-{int(modified.timestamp()):x}"'
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    byte_range = _parse_range(request.headers.get('Range'), size)
+    if byte_range == 'invalid':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+        return response
+
+    if byte_range is None:
+        response = FileResponse(field_file.open('rb'), as_attachment=True, filename=filename,
+                                content_type='application/zip')
+        response.block_size = CHUNK_SIZE
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _iter_file_range(field_file.open('rb'), start, end - start + 1),
+            status=206,
+            content_type='application/zip',
+        )
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def generated_archive_entries(site):
+    """(path, RenderedFile) entries of a site that has no stored archive"""
+    code = site.generated_code
+    if code and not code.startswith(FLASK_SUMMARY_PREFIX):
+        return list(build_html_artifact(code, site.prompt, generated_on=site.created_at).files.items())
+    files = stored_files(code) if code else None
+    if files is None:
+        # Sites saved before their files were stored: re-render from the prompt
+        files = build_flask_artifact(site.prompt).files
+    return list(files.items())
+
+
+def stream_generated_archive(site):
+    """Stream a zip built entry by entry from the generator's file map"""
+    entries = generated_archive_entries(site)
+    response = StreamingHttpResponse(iter_zip(entries, site.created_at.timestamp()), content_type='application/zip')
+    response['Content-Length'] = str(zip_size(entries))
+    response['Content-Disposition'] = f'attachment; filename="{archive_filename(site)}"'
+    return response
+
+
+def is_new_download(request, response) -> bool:
+    """Whether a response starts a new download rather than resuming one"""
+    if response.status_code not in (200, 206):
+        return False
+    byte_range = request.headers.get('Range', '')
+    return not byte_range or byte_range.replace(' ', '').startswith('bytes=0-')
+
+
+def record_download(site):
+    """Count a download without rewriting the whole GeneratedSite row"""
+    if getattr(settings, 'DOWNLOAD_COUNTER_MODE', 'atomic') == 'buffered':
+        _buffered_downloads.add(site.id)
+    else:
+        increment_download_counts({site.id: 1})
+
+
+def increment_download_counts(counts):
+    """Apply {site_id: n} download increments (and the owners' stats) with atomic F() updates"""
+    per_user = Counter()
+    with transaction.atomic():
+        for site_id, count in counts.items():
+            GeneratedSite.objects.filter(id=site_id).update(downloads_count=F('downloads_count') + count)
+        for site_id, user_id in GeneratedSite.objects.filter(id__in=list(counts), user__isnull=False).values_list('id', 'user_id'):
+            per_user[user_id] += counts[site_id]
+        for user_id, count in per_user.items():
+            UserSiteStats.apply(user_id, total_downloads=count)
+
+
+class BufferedDownloadCounter:
+    """
+    Per-process download counter flushed to the database in batches.
+    Each flush adds the buffered deltas with F() updates, so several
+    processes can buffer independently without losing increments.
+
+    A full batch is flushed by the request that fills it; anything less
+    is flushed by a daemon thread every DOWNLOAD_COUNTER_FLUSH_INTERVAL
+    seconds, so quiet sites still see their counts within that window.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._flusher = None
+
+    def add(self, site_id):
+        with self._lock:
+            self._pending[site_id] += 1
+            due = sum(self._pending.values()) >= getattr(settings, 'DOWNLOAD_COUNTER_BATCH_SIZE', 50)
+            self._start_flusher()
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return
+        try:
+            increment_download_counts(pending)
+        except Exception as e:
+            print(f"Warning: failed to flush download counts, will retry: {e}")
+            with self._lock:
+                self._pending.update(pending)
+
+    def _start_flusher(self):
+        # Threads do not survive a fork, so prefork workers start their own
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_periodically,
+                                             name='download-counter-flush', daemon=True)
+            self._flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(getattr(settings, 'DOWNLOAD_COUNTER_FLUSH_INTERVAL', 30))
+            self.flush()
+            db.connections.close_all()
+
+
+_buffered_downloads = BufferedDownloadCounter()
+atexit.register(_buffered_downloads.flush)
+
+
+def flush_download_counts():
+    """Write any buffered download counts of this process to the database"""
+    _buffered_downloads.flush()
+
+
+def _parse_range(header, size):
+    """Return (start, end) for a single satisfiable byte range, None or 'invalid'"""
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match or not any(match.groups()):
+        # Multiple ranges or other units: fall back to the full file
+        return None
+
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+
+    if start >= size or start > end:
+        return 'invalid'
+    return start, end
+
+
+def _iter_file_range(file_obj, start, length):
+    try:
+        file_obj.seek(start)
+        while length > 0:
+            chunk = file_obj.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file_obj.close()
@@ -1,118 +1,38 @@
 """
 Flask project template generator for creating complete fullstack applications
 """
-import os
-import re
-from typing import Dict, Tuple
+from typing import Dict, Optional
+
+from .classifier import classify
+
+# Bump whenever template output changes so cached projects are not reused
+GENERATOR_VERSION = '3'
 
 
-def generate_flask_project(prompt: str) -> Dict[str, str]:
+def generate_flask_project(prompt: str, project_name: Optional[str] = None, app_type: Optional[str] = None) -> Dict[str, str]:
     """
     Generate a complete Flask project structure with all necessary files
     Returns a dictionary with file paths as keys and file contents as values
     """
-    # Extract project details from prompt
-    project_name = extract_project_name(prompt)
-    app_type = extract_app_type(prompt)
-    
-    # Generate all project files
-    files = {}
-    
-    # Main application file
-    files['app.py'] = generate_app_py(project_name, app_type, prompt)
-    
-    # Configuration
-    files['config.py'] = generate_config_py()
-    
-    # Database models
-    files['models.py'] = generate_models_py(app_type, prompt)
-    
-    # Forms
-    files['forms.py'] = generate_forms_py(app_type, prompt)
-    
-    # Routes/Views
-    files['routes.py'] = generate_routes_py(app_type, prompt)
-    
-    # Templates
-    files['templates/base.html'] = generate_base_template(project_name)
-    files['templates/index.html'] = generate_index_template(project_name, app_type, prompt)
-    files['templates/auth/login.html'] = generate_login_template()
-    files['templates/auth/register.html'] = generate_register_template()
-    files['templates/dashboard.html'] = generate_dashboard_template(app_type)
+    from .template_registry import render_project
     
-    # Static files
-    files['static/css/style.css'] = generate_main_css(app_type)
-    files['static/js/main.js'] = generate_main_js()
+    # Extract project details from prompt unless the caller already did
+    project_name = project_name or extract_project_name(prompt)
+    app_type = app_type or extract_app_type(prompt)
     
-    # API routes
-    files['api.py'] = generate_api_routes(app_type, prompt)
-    
-    # Database initialization
-    files['init_db.py'] = generate_init_db()
-    
-    # Requirements
-    files['requirements.txt'] = generate_requirements()
-    
-    # Environment configuration
-    files['.env.example'] = generate_env_example()
-    
-    # Run script
-    files['run.py'] = generate_run_script()
-    
-    # README with setup instructions
-    files['README.md'] = generate_readme(project_name, app_type)
-    
-    return files
+    # Prompt-independent files come pre-rendered from the template registry
+    files = render_project(prompt, project_name, app_type)
+    return {path: rendered.text for path, rendered in files.items()}
 
 
 def extract_project_name(prompt: str) -> str:
     """Extract project name from prompt or generate default"""
-    patterns = [
-        r'(?:for|called|named)\s+["\']([^"\']+)["\']',
-        r'(?:for|called|named)\s+([A-Z][a-zA-Z\s&]+?)(?:\s+(?:with|that|app)|[.,]|$)',
-        r'(?:build|create|make)\s+(?:a|an)?\s*([A-Z][a-zA-Z\s]+?)(?:\s+(?:app|application|website))',
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, prompt, re.IGNORECASE)
-        if match:
-            name = match.group(1).strip()
-            if 3 <= len(name) <= 30:
-                return name
-    
-    # Default names based on content
-    prompt_lower = prompt.lower()
-    if any(word in prompt_lower for word in ['ecommerce', 'shop', 'store']):
-        return "E-Commerce Store"
-    elif any(word in prompt_lower for word in ['blog', 'news', 'article']):
-        return "Blog Platform"
-    elif any(word in prompt_lower for word in ['task', 'todo', 'project']):
-        return "Task Manager"
-    elif any(word in prompt_lower for word in ['chat', 'message', 'social']):
-        return "Social Platform"
-    else:
-        return "Flask Application"
+    return classify(prompt).project_name
 
 
 def extract_app_type(prompt: str) -> str:
     """Extract application type from prompt"""
-    prompt_lower = prompt.lower()
-    
-    app_types = {
-        'ecommerce': ['shop', 'store', 'ecommerce', 'commerce', 'product', 'cart'],
-        'blog': ['blog', 'news', 'article', 'post', 'content'],
-        'task_manager': ['task', 'todo', 'project', 'manage', 'organize'],
-        'social': ['chat', 'message', 'social', 'friend', 'community'],
-        'crm': ['customer', 'crm', 'client', 'contact', 'lead'],
-        'portfolio': ['portfolio', 'showcase', 'gallery', 'work'],
-        'dashboard': ['dashboard', 'analytics', 'admin', 'panel'],
-    }
-    
-    for app_type, keywords in app_types.items():
-        if any(keyword in prompt_lower for keyword in keywords):
-            return app_type
-    
-    return 'general'
+    return classify(prompt).app_type
 
 
 def generate_app_py(project_name: str, app_type: str, prompt: str) -> str:
@@ -0,0 +1,171 @@
+"""
+Content-addressed cache of generated Flask projects.
+
+Flask projects are rendered deterministically from the prompt, so the zip for
+a given normalized prompt (and generator version) only has to be built once.
+Later requests for the same prompt point their GeneratedSite at the existing
+archive instead of rendering and zipping it again.
+
+Entries are evicted by TTL, by count and by total archive size, least recently
+used first. Archives are only removed from disk once no site references them.
+
+Hits and misses are counted on the entries themselves (``hit_count``, and
+``miss_count`` for the renders that stored them), so ``stats`` reads the
+same totals from every worker. They cover the entries currently cached.
+"""
+import hashlib
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .flask_templates import GENERATOR_VERSION
+from .models import GeneratedSite, GenerationCacheEntry
+
+def is_enabled() -> bool:
+    # In the on-the-fly archive mode there are no stored zips to share
+    return getattr(settings, 'GENERATION_CACHE_ENABLED', True) and getattr(settings, 'SITE_ARCHIVE_MODE', 'file') == 'file'
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace and trailing punctuation that doesn't change the output"""
+    return re.sub(r'\s+', ' ', prompt).strip().rstrip('.!?,;: ')
+
+
+def cache_key(prompt: str) -> str:
+    payload = f"{GENERATOR_VERSION}\0{normalize_prompt(prompt)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def archive_name(key: str) -> str:
+    """Storage name of the shared archive for a cache key"""
+    return f"sites/cache/{key}.zip"
+
+
+def lookup(prompt: str):
+    """Return a live cache entry for the prompt, or None on a miss"""
+    if not is_enabled():
+        return None
+
+    entry = GenerationCacheEntry.objects.filter(key=cache_key(prompt)).first()
+    if entry is not None and (_is_expired(entry) or not entry.archive.storage.exists(entry.archive.name)):
+        _delete_entry(entry)
+        entry = None
+
+    if entry is None:
+        return None  # Counted by store() once the prompt has been rendered
+
+    GenerationCacheEntry.objects.filter(pk=entry.pk).update(
+        hit_count=F('hit_count') + 1,
+        last_used_at=timezone.now(),
+    )
+    return entry
+
+
+def attach(site, entry):
+    """Complete a GeneratedSite using a cached archive"""
+    site.generated_file.name = entry.archive.name
+    site.generated_code = entry.summary
+    site.generation_time = 0
+    site.status = "completed"
+    site.save()
+
+
+def store(prompt: str, site, artifact):
+    """Register the archive just written for ``site`` under the prompt's key"""
+    if not is_enabled():
+        return None
+
+    key = cache_key(prompt)
+    try:
+        size = site.generated_file.size
+    except (IOError, OSError):
+        size = 0
+
+    fields = {
+        'generator_version': GENERATOR_VERSION,
+        'archive': site.generated_file.name,
+        'summary': site.generated_code or artifact.summary(),
+        'size_bytes': size,
+        'last_used_at': timezone.now(),
+    }
+    try:
+        # Storing follows a render, so it records the miss that caused it
+        entry, created = GenerationCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={**fields, 'miss_count': F('miss_count') + 1},
+            create_defaults={**fields, 'miss_count': 1},
+        )
+    except IntegrityError:
+        # Another worker registered the same prompt concurrently
+        GenerationCacheEntry.objects.filter(key=key).update(miss_count=F('miss_count') + 1)
+        return GenerationCacheEntry.objects.filter(key=key).first()
+
+    evict()
+    return entry
+
+
+def evict():
+    """Drop expired entries, then least recently used ones above the caps"""
+    ttl = getattr(settings, 'GENERATION_CACHE_TTL', 7 * 24 * 60 * 60)
+    max_entries = getattr(settings, 'GENERATION_CACHE_MAX_ENTRIES', 500)
+    max_bytes = getattr(settings, 'GENERATION_CACHE_MAX_BYTES', 200 * 1024 * 1024)
+
+    for entry in GenerationCacheEntry.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=ttl)):
+        _delete_entry(entry)
+
+    entries = GenerationCacheEntry.objects.order_by('-last_used_at')
+    for entry in entries[max_entries:]:
+        _delete_entry(entry)
+
+    total = entries.aggregate(total=Sum('size_bytes'))['total'] or 0
+    if total > max_bytes:
+        for entry in entries.reverse().only('id', 'archive', 'size_bytes'):
+            if total <= max_bytes:
+                break
+            total -= entry.size_bytes
+            _delete_entry(entry)
+
+
+def archive_in_use(name: str, exclude_site_id=None) -> bool:
+    """Whether a cache entry or another site still references the archive"""
+    if GenerationCacheEntry.objects.filter(archive=name).exists():
+        return True
+    sites = GeneratedSite.objects.filter(generated_file=name)
+    if exclude_site_id is not None:
+        sites = sites.exclude(id=exclude_site_id)
+    return sites.exists()
+
+
+def stats() -> dict:
+    """Hit/miss counters and current cache footprint"""
+    totals = GenerationCacheEntry.objects.aggregate(
+        entries=Count('id'), bytes=Sum('size_bytes'), hits=Sum('hit_count'), misses=Sum('miss_count'),
+    )
+    hits, misses = totals['hits'] or 0, totals['misses'] or 0
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        'entries': totals['entries'],
+        'bytes': totals['bytes'] or 0,
+    }
+
+
+def _is_expired(entry) -> bool:
+    ttl = getattr(settings, 'GENERATION_CACHE_TTL', 7 * 24 * 60 * 60)
+    return entry.created_at < timezone.now() - timedelta(seconds=ttl)
+
+
+def _delete_entry(entry):
+    name = entry.archive.name
+    entry.delete()
+    if name and not archive_in_use(name):
+        try:
+            entry.archive.storage.delete(name)
+        except (IOError, OSError) as e:
+            print(f"Warning: could not delete cached archive {name}: {e}")
+
@@ -0,0 +1,84 @@
+import random
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+from generator import classifier
+
+SUBJECTS = [
+    "an online shop for handmade jewelry", "a blog about vegan cooking", "a todo app for remote teams",
+    "a community forum for gamers", "a CRM to track client leads", "a portfolio to showcase my photography",
+    "an analytics dashboard for sales", "a restaurant with an online menu", "a coffee shop in the old town",
+    "a boutique retail store", "a consulting firm offering advisory services", "a software startup",
+    "a medical clinic", "a gym with personal training", "a beauty salon and spa", "a local bakery",
+]
+EXTRAS = [
+    "", " with user accounts", " that lets customers post reviews", " with a contact form and newsletter",
+    " and an admin panel", " with product search and a shopping cart", " to organize projects",
+]
+NAMES = ["", " called 'Sunrise'", " named Blue Harbor", " for Acme Corp."]
+
+
+def build_corpus(size, seed=42):
+    rng = random.Random(seed)
+    verbs = ["Build", "Create", "Make", "I need", "Design"]
+    return [f"{rng.choice(verbs)} {rng.choice(SUBJECTS)}{rng.choice(NAMES)}{rng.choice(EXTRAS)} #{i}" for i in range(size)]
+
+
+def legacy_classify(prompt):
+    """The keyword loops and per-call patterns the classifier replaced"""
+    prompt_lower = prompt.lower()
+    app_type = 'general'
+    for category, keywords in classifier.APP_TYPES.items():
+        if any(keyword in prompt_lower for keyword in keywords):
+            app_type = category
+            break
+    business_type = 'business'
+    for category, keywords in classifier.BUSINESS_TYPES.items():
+        if any(keyword in prompt_lower for keyword in keywords):
+            business_type = category
+            break
+    for patterns in (classifier.PROJECT_NAME_PATTERNS, classifier.BUSINESS_NAME_PATTERNS):
+        for pattern in patterns:
+            if re.search(pattern.pattern, prompt, re.IGNORECASE):
+                break
+    return app_type, business_type
+
+
+class Command(BaseCommand):
+    help = "Benchmark prompt classification: legacy keyword loops vs the compiled classifier"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prompts', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=3, help="Passes over the corpus (later passes hit the cache)")
+
+    def handle(self, *args, **options):
+        corpus = build_corpus(options['prompts'])
+        repeat = options['repeat']
+
+        def legacy():
+            for prompt in corpus:
+                legacy_classify(prompt)
+
+        def compiled_uncached():
+            for prompt in corpus:
+                classifier.classify(prompt, use_cache=False)
+
+        def compiled_cached():
+            for prompt in corpus:
+                classifier.classify(prompt)
+
+        results = {}
+        classifier.clear_cache()
+        for label, func in (('legacy loops', legacy), ('single scan', compiled_uncached), ('single scan + cache', compiled_cached)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                func()
+            elapsed = time.perf_counter() - start
+            results[label] = len(corpus) * repeat / elapsed
+            self.stdout.write(f"{label:<22} {results[label]:>12,.0f} prompts/s")
+
+        baseline = results['legacy loops']
+        for label in ('single scan', 'single scan + cache'):
+            self.stdout.write(self.style.SUCCESS(f"{label}: {results[label] / baseline:.1f}x legacy throughput"))
@@ -0,0 +1,56 @@
+import base64
+import io
+import time
+
+import qrcode
+from django.core.management.base import BaseCommand
+
+from generator import qr
+
+PLANS = [('999.00', 'Basic Plan'), ('1999.00', 'Premium Plan'), ('4999.00', 'Enterprise Plan')]
+
+
+def payload(index):
+    amount, name = PLANS[index % len(PLANS)]
+    return (f"upi://pay?pa=runner.abhi01-1@okaxis&pn=AI Website Generator&am={amount}&cu=INR"
+            f"&tn=Payment for {name} - {index:012X}")
+
+
+def legacy_png(data):
+    # Previous payment_page behaviour: qrcode draws every box with PIL, then base64 for a data URI
+    code = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
+    code.add_data(data)
+    code.make(fit=True)
+    buffer = io.BytesIO()
+    code.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue())
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark payment QR rendering: legacy PNG data URI vs generator.qr PNG and SVG"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        payloads = [payload(i) for i in range(iterations)]
+
+        # Every payment has its own transaction id, so every render encodes a new payload
+        cases = [
+            ('legacy PNG + base64', legacy_png),
+            ('PNG', qr.render_png),
+            ('SVG', qr.render_svg),
+        ]
+        results = {}
+        for label, render in cases:
+            render(payload(iterations))  # warm imports
+            start = time.perf_counter()
+            for data in payloads:
+                body = render(data)
+            results[label] = (time.perf_counter() - start) / iterations * 1000
+            self.stdout.write(f"{label:<22} {results[label]:8.3f} ms/render {len(body):>8,} bytes")
+
+        baseline = results['legacy PNG + base64']
+        for label in ('PNG', 'SVG'):
+            self.stdout.write(self.style.SUCCESS(f"{label}: {baseline / results[label]:.1f}x faster than the legacy PNG"))
@@ -0,0 +1,81 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from generator import search
+from generator.models import GeneratedSite, UserSiteStats
+
+BENCH_USERNAME = 'bench-search'
+WORDS = (
+    "bakery shop blog portfolio dashboard crm gym salon clinic restaurant coffee store travel agency "
+    "photography wedding music school course booking rental fitness yoga dental legal consulting "
+    "startup landing newsletter recipes reviews gallery events tickets marketplace inventory invoices "
+    "analytics chat community forum podcast video streaming charity nonprofit church hotel spa"
+).split()
+QUERIES = ['bakery', 'wedding photography', 'yoga studio booking', 'invoices', 'zzz-no-match']
+
+
+class Command(BaseCommand):
+    help = "Benchmark prompt search (icontains vs the full-text index) on a seeded GeneratedSite table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Rows to seed for the benchmark user')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded rows afterwards')
+
+    def handle(self, *args, **options):
+        # A million seeded rows (and a raw DELETE on cleanup) have no place
+        # next to real accounts: only run on a database holding nothing else
+        others = User.objects.exclude(username=BENCH_USERNAME)
+        if others.exists() or GeneratedSite.objects.exclude(user__username=BENCH_USERNAME).exists():
+            raise CommandError(
+                f"{connection.settings_dict['NAME']} has users or sites of its own. Point DATABASE_URL at a "
+                "scratch database (created and migrated for the benchmark) and run the command there."
+            )
+
+        user, created = User.objects.get_or_create(username=BENCH_USERNAME, defaults={'is_active': False})
+        existing = GeneratedSite.objects.filter(user=user).count()
+        if existing < options['rows']:
+            self._seed(user, options['rows'] - existing)
+
+        self.stdout.write(f"Backend: {search.backend()} on {connection.vendor}, {options['rows']:,} rows")
+        base = GeneratedSite.objects.filter(user=user)
+        for query in QUERIES:
+            icontains = self._time(lambda: list(base.filter(prompt__icontains=query).values_list('id', flat=True)[:12]), options['repeat'])
+            unranked = self._time(lambda: list(search.search_sites(base, query, ranked=False).values_list('id', flat=True)[:12]), options['repeat'])
+            ranked = self._time(lambda: list(search.search_sites(base, query).values_list('id', flat=True)[:12]), options['repeat'])
+            self.stdout.write(f"{query!r:<24} icontains {icontains * 1000:8.1f} ms   full-text {unranked * 1000:8.1f} ms   "
+                              f"ranked {ranked * 1000:8.1f} ms")
+
+        if options['cleanup']:
+            with transaction.atomic(), connection.cursor() as cursor:
+                # Raw delete: the seeded rows have no related content and one
+                # post_delete signal per row would take far longer
+                cursor.execute(f"DELETE FROM {GeneratedSite._meta.db_table} WHERE user_id = %s", [user.id])
+                UserSiteStats.objects.filter(user=user).delete()
+                user.delete()
+            self.stdout.write("Removed the seeded rows")
+
+    def _seed(self, user, count):
+        self.stdout.write(f"Seeding {count:,} rows...")
+        rng = random.Random(7)
+        batch = 10_000
+        for start in range(0, count, batch):
+            GeneratedSite.objects.bulk_create([
+                GeneratedSite(user=user, status='completed',
+                              prompt=f"A {' '.join(rng.choices(WORDS, k=rng.randint(4, 12)))} website #{start + i}")
+                for i in range(min(batch, count - start))
+            ])
+        UserSiteStats.rebuild(user.id)
+
+    @staticmethod
+    def _time(func, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best
@@ -0,0 +1,58 @@
+import time
+import zipfile
+import io
+
+from django.core.management.base import BaseCommand
+
+from generator import template_registry
+from generator.flask_templates import extract_app_type, extract_project_name
+from generator.zipstream import iter_zip
+
+PROMPTS = [
+    "Build an e-commerce store for selling handmade jewelry",
+    "Create a blog called 'Tech Talk' for software articles",
+    "Make a task manager app for small teams with projects",
+    "Build a social community for book lovers to chat",
+    "A CRM for tracking customers and leads",
+    "Portfolio website to showcase my photography work",
+    "Analytics dashboard for an admin panel",
+    "A simple website for my bakery",
+]
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark per-request Flask project rendering with and without the template registry"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        requests = [(p, extract_project_name(p), extract_app_type(p)) for p in PROMPTS]
+        template_registry.warm()
+
+        def baseline():
+            # Previous behaviour: render every file, then let zipfile deflate it
+            for prompt, name, app_type in requests:
+                files = template_registry.render_project(prompt, name, app_type, use_registry=False)
+                buffer = io.BytesIO()
+                with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+                    for path, rendered in files.items():
+                        zipf.writestr(path, rendered.text)
+
+        def registry():
+            for prompt, name, app_type in requests:
+                files = template_registry.render_project(prompt, name, app_type)
+                b''.join(iter_zip(files.items()))
+
+        results = {}
+        for label, func in (('full render + zipfile', baseline), ('registry + pre-deflated', registry)):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                func()
+            elapsed = time.perf_counter() - start
+            results[label] = elapsed / (iterations * len(requests)) * 1000
+            self.stdout.write(f"{label:<26} {results[label]:.3f} ms/request")
+
+        before, after = results.values()
+        self.stdout.write(self.style.SUCCESS(f"Speed-up: {before / after:.1f}x ({(1 - after / before):.0%} less time per request)"))
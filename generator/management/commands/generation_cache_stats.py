@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from generator import generation_cache
+
+
+class Command(BaseCommand):
+    help = "Show generation cache hit/miss counters and size, optionally running eviction first"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--evict', action='store_true', help='Evict expired and over-cap entries first')
+
+    def handle(self, *args, **options):
+        if options['evict']:
+            generation_cache.evict()
+
+        stats = generation_cache.stats()
+        self.stdout.write(f"Entries:        {stats['entries']}")
+        self.stdout.write(f"Archive bytes:  {stats['bytes']}")
+        self.stdout.write(f"Hits:           {stats['hits']}")
+        self.stdout.write(f"Misses:         {stats['misses']}")
+        self.stdout.write(f"Hit rate:       {stats['hit_rate']:.2%}")
@@ -0,0 +1,54 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from generator import views  # noqa: F401  (registers the cached pages)
+from generator.page_cache import CACHED_PAGES, CSRF_INPUT_RE, clear_page_cache
+
+
+class Command(BaseCommand):
+    help = ("Render the cached public pages as an anonymous visitor: warms the page cache and "
+            "writes static copies under PRERENDER_ROOT for whitenoise")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', help='Host the pages are served on (default: first ALLOWED_HOSTS entry)')
+        parser.add_argument('--secure', action='store_true', help='Render as https requests')
+        parser.add_argument('--clear', action='store_true', help='Drop every cached page first (e.g. after a deploy)')
+        parser.add_argument('--no-write', action='store_true', help='Only warm the cache')
+
+    def handle(self, *args, **options):
+        host = options['host'] or next((h for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost')
+        root = Path(settings.PRERENDER_ROOT)
+        if options['clear']:
+            clear_page_cache()
+            self.stdout.write("🧹 Page cache cleared")
+
+        client = Client(HTTP_HOST=host.lstrip('.'))
+        failures = []
+        for name in CACHED_PAGES:
+            path = reverse(f'generator:{name}')
+            response = client.get(path, secure=options['secure'])
+            if response.status_code != 200:
+                failures.append(f"{path}: HTTP {response.status_code}")
+                continue
+            if options['no_write']:
+                self.stdout.write(f"🔥 {path} cached")
+                continue
+            if CSRF_INPUT_RE.search(response.content.decode(response.charset)):
+                # A form needs a per-visitor token, so only the page cache can serve it
+                self.stdout.write(f"🔥 {path} cached (not written: it has a CSRF form)")
+                continue
+            target = root / path.strip('/') / 'index.html'
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(response.content)
+            self.stdout.write(f"📄 {path} -> {target}")
+
+        if settings.CACHES['default']['BACKEND'].endswith('LocMemCache'):
+            self.stdout.write(self.style.WARNING(
+                "⚠️ Local-memory cache: warming only reached this process, set CACHE_URL to share it"))
+        if failures:
+            raise CommandError("Some pages did not render:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS(f"✅ {len(CACHED_PAGES)} pages rendered"))
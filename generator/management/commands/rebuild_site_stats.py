@@ -0,0 +1,22 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from generator.models import UserSiteStats
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-user dashboard counters (UserSiteStats) from GeneratedSite rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild the counters of this username')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(generatedsite__isnull=False).distinct()
+        if options['user']:
+            users = User.objects.filter(username=options['user'])
+
+        count = 0
+        for user_id in users.values_list('id', flat=True).iterator():
+            UserSiteStats.rebuild(user_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt site stats for {count} users"))
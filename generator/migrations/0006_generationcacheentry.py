@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0005_add_otp_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('generator_version', models.CharField(max_length=20)),
+                ('archive', models.FileField(upload_to='sites/cache/')),
+                ('summary', models.TextField(blank=True)),
+                ('size_bytes', models.IntegerField(default=0)),
+                ('hit_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'Generation cache entries',
+                'ordering': ['-last_used_at'],
+            },
+        ),
+    ]
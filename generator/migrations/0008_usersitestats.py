@@ -0,0 +1,59 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_site_stats(apps, schema_editor):
+    GeneratedSite = apps.get_model('generator', 'GeneratedSite')
+    UserSiteStats = apps.get_model('generator', 'UserSiteStats')
+    rows = (
+        GeneratedSite.objects.filter(user__isnull=False)
+        .values('user_id')
+        .annotate(
+            total_sites=Count('id'),
+            completed_sites=Count('id', filter=Q(status='completed')),
+            failed_sites=Count('id', filter=Q(status='failed')),
+            total_downloads=Sum('downloads_count'),
+        )
+        .order_by()
+    )
+    UserSiteStats.objects.bulk_create([
+        UserSiteStats(
+            user_id=row['user_id'],
+            total_sites=row['total_sites'],
+            completed_sites=row['completed_sites'],
+            failed_sites=row['failed_sites'],
+            total_downloads=row['total_downloads'] or 0,
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0007_generationbatch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSiteStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_sites', models.IntegerField(default=0)),
+                ('completed_sites', models.IntegerField(default=0)),
+                ('failed_sites', models.IntegerField(default=0)),
+                ('total_downloads', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='site_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'User site stats',
+            },
+        ),
+        migrations.RunPython(backfill_site_stats, migrations.RunPython.noop),
+    ]
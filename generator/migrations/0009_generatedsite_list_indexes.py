@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0008_usersitestats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='generatedsite',
+            index=models.Index(fields=['user', '-created_at'], name='gensite_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='generatedsite',
+            index=models.Index(fields=['user', 'status', '-created_at'], name='gensite_user_status_idx'),
+        ),
+    ]
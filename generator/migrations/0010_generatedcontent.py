@@ -0,0 +1,61 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:09
+
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def move_generated_code(apps, schema_editor):
+    """Copy generated_code into compressed GeneratedContent rows, in batches by id"""
+    GeneratedSite = apps.get_model('generator', 'GeneratedSite')
+    GeneratedContent = apps.get_model('generator', 'GeneratedContent')
+    last_id = 0
+    while True:
+        rows = list(
+            GeneratedSite.objects.filter(id__gt=last_id, generated_code__isnull=False)
+            .order_by('id')
+            .values_list('id', 'generated_code')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        contents = []
+        for site_id, code in rows:
+            raw = code.encode('utf-8')
+            contents.append(GeneratedContent(site_id=site_id, data=zlib.compress(raw, 6), compression='zlib', size=len(raw)))
+        GeneratedContent.objects.bulk_create(contents, ignore_conflicts=True)
+        last_id = rows[-1][0]
+
+
+def restore_generated_code(apps, schema_editor):
+    GeneratedSite = apps.get_model('generator', 'GeneratedSite')
+    GeneratedContent = apps.get_model('generator', 'GeneratedContent')
+    for content in GeneratedContent.objects.order_by('site_id').iterator(chunk_size=BATCH_SIZE):
+        data = bytes(content.data)
+        if content.compression == 'zlib':
+            data = zlib.decompress(data)
+        GeneratedSite.objects.filter(id=content.site_id).update(generated_code=data.decode('utf-8'))
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own so large tables aren't copied in one transaction
+    atomic = False
+
+    dependencies = [
+        ('generator', '0009_generatedsite_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeneratedContent',
+            fields=[
+                ('site', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='content', serialize=False, to='generator.generatedsite')),
+                ('data', models.BinaryField()),
+                ('compression', models.CharField(default='zlib', max_length=10)),
+                ('size', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(move_generated_code, restore_generated_code),
+    ]
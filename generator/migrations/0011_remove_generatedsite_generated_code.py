@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:09
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0010_generatedcontent'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='generatedsite',
+            name='generated_code',
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:20
+
+from django.db import migrations
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE generator_generatedsite
+    ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', coalesce(prompt, ''))) STORED
+    """,
+    "CREATE INDEX gensite_search_vector_gin ON generator_generatedsite USING GIN (search_vector)",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS gensite_search_vector_gin",
+    "ALTER TABLE generator_generatedsite DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE generator_generatedsite_fts USING fts5(
+        prompt, content='generator_generatedsite', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER generator_generatedsite_fts_insert AFTER INSERT ON generator_generatedsite BEGIN
+        INSERT INTO generator_generatedsite_fts(rowid, prompt) VALUES (new.id, new.prompt);
+    END
+    """,
+    """
+    CREATE TRIGGER generator_generatedsite_fts_delete AFTER DELETE ON generator_generatedsite BEGIN
+        INSERT INTO generator_generatedsite_fts(generator_generatedsite_fts, rowid, prompt) VALUES ('delete', old.id, old.prompt);
+    END
+    """,
+    """
+    CREATE TRIGGER generator_generatedsite_fts_update AFTER UPDATE OF prompt ON generator_generatedsite BEGIN
+        INSERT INTO generator_generatedsite_fts(generator_generatedsite_fts, rowid, prompt) VALUES ('delete', old.id, old.prompt);
+        INSERT INTO generator_generatedsite_fts(rowid, prompt) VALUES (new.id, new.prompt);
+    END
+    """,
+    # Index the existing rows
+    "INSERT INTO generator_generatedsite_fts(generator_generatedsite_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS generator_generatedsite_fts_insert",
+    "DROP TRIGGER IF EXISTS generator_generatedsite_fts_delete",
+    "DROP TRIGGER IF EXISTS generator_generatedsite_fts_update",
+    "DROP TABLE IF EXISTS generator_generatedsite_fts",
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_FORWARD)
+    elif vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                print("\n  SQLite was built without FTS5; prompt search will use icontains")
+                return
+        _run(schema_editor, SQLITE_FORWARD)
+    # Other databases keep the icontains fallback
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_REVERSE)
+    elif vendor == 'sqlite':
+        _run(schema_editor, SQLITE_REVERSE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0011_remove_generatedsite_generated_code'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0012_generatedsite_fulltext_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='generatedsite',
+            name='gensite_user_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='generatedsite',
+            name='gensite_user_status_idx',
+        ),
+        migrations.AddIndex(
+            model_name='generatedsite',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='gensite_user_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='generatedsite',
+            index=models.Index(fields=['user', 'status', '-created_at', '-id'], name='gensite_user_status_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0013_generatedsite_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedsite',
+            name='quota_hold',
+            field=models.CharField(blank=True, choices=[('', 'None'), ('plan', 'Paid plan'), ('free', 'Free website')], default='', max_length=10),
+        ),
+    ]
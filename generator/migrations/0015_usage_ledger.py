@@ -0,0 +1,81 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+# generator.models.PLAN_LIMITS when this migration was written
+PLAN_LIMITS = {'basic': 10, 'premium': 50, 'enterprise': 999}
+
+
+def backfill_current_period(apps, schema_editor):
+    """Open this month's rollup from the sites already delivered, with matching ledger events"""
+    GeneratedSite = apps.get_model('generator', 'GeneratedSite')
+    UserProfile = apps.get_model('generator', 'UserProfile')
+    UsagePeriod = apps.get_model('generator', 'UsagePeriod')
+    UsageEvent = apps.get_model('generator', 'UsageEvent')
+
+    period = timezone.localdate().replace(day=1)
+    month_start = timezone.make_aware(timezone.datetime(period.year, period.month, 1))
+    delivered = dict(
+        GeneratedSite.objects.filter(user__isnull=False, status='completed', created_at__gte=month_start)
+        .values('user_id').annotate(count=Count('id')).order_by().values_list('user_id', 'count')
+    )
+    plans = dict(UserProfile.objects.filter(user_id__in=delivered).values_list('user_id', 'subscription_plan'))
+
+    periods, events = [], []
+    for user_id, count in delivered.items():
+        plan = plans.get(user_id, 'free')
+        periods.append(UsagePeriod(user_id=user_id, period=period, plan=plan, limit=PLAN_LIMITS.get(plan),
+                                   used=count, generated=count))
+        events.append(UsageEvent(user_id=user_id, period=period, kind='reserve', quantity=count))
+        events.append(UsageEvent(user_id=user_id, period=period, kind='commit', quantity=count))
+    UsagePeriod.objects.bulk_create(periods, batch_size=1000)
+    UsageEvent.objects.bulk_create(events, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0014_generatedsite_quota_hold'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField()),
+                ('kind', models.CharField(choices=[('reserve', 'Reserved'), ('commit', 'Delivered'), ('release', 'Released')], max_length=10)),
+                ('quantity', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('site', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='generator.generatedsite')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'period'], name='usageevent_user_period_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UsagePeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField()),
+                ('plan', models.CharField(max_length=20)),
+                ('limit', models.IntegerField(blank=True, null=True)),
+                ('used', models.IntegerField(default=0)),
+                ('generated', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_periods', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-period'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'period'), name='usageperiod_user_period_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_current_period, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 21:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0015_usage_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedsite',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
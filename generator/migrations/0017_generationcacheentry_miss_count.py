@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 21:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0016_generatedsite_started_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationcacheentry',
+            name='miss_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
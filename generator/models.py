@@ -1,7 +1,27 @@
-from django.db import models
+import zlib
+from collections import Counter
+
+from django.db import models, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+# Websites per monthly usage period for each paid plan (the free plan has a
+# lifetime allowance in UserProfile.free_websites_remaining instead)
+PLAN_LIMITS = {
+    'basic': 10,
+    'premium': 50,
+    'enterprise': 999,
+}
+
+
+def period_start(when=None):
+    """First day of the usage period (calendar month) containing ``when``"""
+    return timezone.localdate(when).replace(day=1)
+
+
 class UserProfile(models.Model):
     """Extended user profile for tracking usage and subscriptions"""
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -39,94 +59,96 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.subscription_plan}"
 
+    def subscription_active(self):
+        return bool(self.subscription_plan != 'free' and self.subscription_expires
+                    and self.subscription_expires > timezone.now())
+
     def can_generate_website(self):
         """Check if user can generate a new website"""
         if self.subscription_plan != 'free':
             # Check if subscription is active
-            if self.subscription_expires and self.subscription_expires > timezone.now():
-                return True
+            if self.subscription_active():
+                return self.get_remaining_websites() > 0
             # If subscription expired, revert to free plan
-            if self.subscription_expires and self.subscription_expires <= timezone.now():
-                self.subscription_plan = 'free'
-                self.save()
+            if self.subscription_expires:
+                self.expire_subscription()
         
         # Free plan users
         return self.free_websites_remaining > 0
 
+    def expire_subscription(self):
+        """
+        Revert a lapsed paid plan to free. A single conditional UPDATE of the
+        plan column, done once, rather than a full save from inside a read.
+        """
+        from .profiles import invalidate_quota
+        UserProfile.objects.filter(
+            pk=self.pk, subscription_expires__lte=timezone.now(),
+        ).exclude(subscription_plan='free').update(subscription_plan='free', updated_at=timezone.now())
+        self.subscription_plan = 'free'
+        invalidate_quota(self.user_id)
+
+    def quota_state(self):
+        """Plan and quota as a plain dict, cacheable between requests"""
+        can_generate = self.can_generate_website()
+        return {
+            'plan': self.subscription_plan,
+            'can_generate': can_generate,
+            'remaining': self.get_remaining_websites(),
+            'subscription_active': self.subscription_active(),
+        }
+
     def get_remaining_websites(self):
         """Get number of remaining websites user can generate"""
         if self.subscription_plan == 'free':
             return self.free_websites_remaining
-        elif self.subscription_plan == 'basic':
-            return 10  # Basic plan: 10 websites per month
-        elif self.subscription_plan == 'premium':
-            return 50  # Premium plan: 50 websites per month
-        elif self.subscription_plan == 'enterprise':
-            return 999  # Enterprise: virtually unlimited
+        if self.subscription_plan in PLAN_LIMITS:
+            # Paid plans: what is left of this month's allowance
+            return UsagePeriod.peek(self.user_id, self.subscription_plan).remaining
         return 0
-
-    def decrement_usage(self):
-        """Decrement usage count when a website is generated"""
-        if self.subscription_plan == 'free':
-            if self.free_websites_remaining > 0:
-                self.free_websites_remaining -= 1
-        self.websites_generated += 1
-        self.save()
     
+    # Codes live in the OTP store (accounts/otp.py), not on this row; the
+    # email_otp* columns are no longer written
+
     def generate_email_otp(self):
         """Generate a new 6-digit OTP for email verification"""
-        import random
-        from django.utils import timezone
-        
-        self.email_otp = str(random.randint(100000, 999999))
-        self.email_otp_created_at = timezone.now()
-        self.email_otp_attempts = 0
-        self.save()
-        return self.email_otp
+        from accounts import otp
+        return otp.issue_email_otp(self.user)
     
     def verify_email_otp(self, otp):
         """Verify the provided OTP for email verification"""
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        # Check if OTP exists and hasn't expired (10 minutes)
-        if not self.email_otp or not self.email_otp_created_at:
-            return False, "No OTP found. Please request a new one."
-        
-        # Check expiration (10 minutes)
-        if timezone.now() - self.email_otp_created_at > timedelta(minutes=10):
-            return False, "OTP has expired. Please request a new one."
-        
-        # Check attempts limit (max 5 attempts)
-        if self.email_otp_attempts >= 5:
-            return False, "Too many attempts. Please request a new OTP."
-        
-        # Verify OTP
-        if self.email_otp == otp:
+        from accounts.otp import verify_email_otp
+        success, message = verify_email_otp(self.user, otp)
+        if success:
             self.email_verified = True
-            self.email_otp = None
-            self.email_otp_created_at = None
-            self.email_otp_attempts = 0
-            self.user.is_active = True  # Activate the user account
-            self.user.save()
-            self.save()
-            return True, "Email verified successfully!"
-        else:
-            self.email_otp_attempts += 1
-            self.save()
-            remaining = 5 - self.email_otp_attempts
-            return False, f"Invalid OTP. {remaining} attempts remaining."
+        return success, message
     
     def can_request_new_otp(self):
         """Check if user can request a new OTP (rate limiting)"""
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        if not self.email_otp_created_at:
-            return True
-        
-        # Allow new OTP request after 2 minutes
-        return timezone.now() - self.email_otp_created_at > timedelta(minutes=2)
+        from accounts import otp
+        return otp.can_request_new_otp(self.user)
+
+class GenerationBatch(models.Model):
+    """A group of sites requested together through the bulk generation API"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(
+        max_length=20,
+        choices=[("pending", "Pending"), ("completed", "Completed"), ("failed", "Failed")],
+        default="pending"
+    )
+    total_items = models.IntegerField(default=0)
+    combined_archive = models.BooleanField(default=False)  # Also build one zip with every site
+    archive = models.FileField(upload_to="sites/batches/", null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Batch {self.id} - {self.user.username} - {self.status}"
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = 'Generation batches'
+
 
 class GeneratedSite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
@@ -138,17 +160,276 @@ class GeneratedSite(models.Model):
         default="pending"
     )
     generated_file = models.FileField(upload_to="sites/", null=True, blank=True)  # zip file of generated website
-    generated_code = models.TextField(null=True, blank=True)  # HTML code
+    # generated_code (HTML code) lives compressed in GeneratedContent, see the property below
     is_premium = models.BooleanField(default=False)  # Track if this was a premium generation
     generation_time = models.FloatField(null=True, blank=True)  # Time taken to generate
     downloads_count = models.IntegerField(default=0)  # Track download count
+    batch = models.ForeignKey(GenerationBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name='sites')
+    # When a worker (or the stream) began generating; stale pending jobs are swept by fail_stale_generations
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Quota held for this site until it is delivered or fails, see generator/quota.py
+    quota_hold = models.CharField(
+        max_length=10,
+        choices=[("", "None"), ("plan", "Paid plan"), ("free", "Free website")],
+        default="",
+        blank=True
+    )
 
     def __str__(self):
         username = self.user.username if self.user else "Anonymous"
         return f"{username} - {self.status} - {self.created_at}"
 
+    @property
+    def generated_code(self):
+        """Generated HTML (or Flask summary), loaded from GeneratedContent on first access"""
+        if not hasattr(self, '_generated_code'):
+            content = GeneratedContent.objects.filter(site_id=self.pk).first() if self.pk else None
+            self._generated_code = content.text if content else None
+        return self._generated_code
+
+    @generated_code.setter
+    def generated_code(self, value):
+        # Written to GeneratedContent by the next save()
+        self._generated_code = value
+        self._generated_code_changed = True
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        if not kwargs.get('fields'):
+            self.__dict__.pop('_generated_code', None)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the stats counters currently include for this row
+        if 'status' in field_names and 'user_id' in field_names:
+            instance._counted = (instance.user_id, instance.status)
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Save and keep the owner's UserSiteStats in step, in the same transaction"""
+        # Rows loaded without status/user (e.g. via .only()) can't change them
+        previous = (None, None) if self._state.adding else getattr(self, '_counted', None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if getattr(self, '_generated_code_changed', False):
+                GeneratedContent.store(self.pk, self._generated_code)
+                self._generated_code_changed = False
+            if previous is not None:
+                current = (self.user_id, self.status)
+                if previous[0] == current[0] and previous[1] != current[1]:
+                    # Status change: one update moving the site between counters
+                    deltas = Counter(UserSiteStats.contribution(current[1], 1))
+                    deltas.update(UserSiteStats.contribution(previous[1], -1))
+                    UserSiteStats.apply(current[0], **deltas)
+                elif previous != current:
+                    UserSiteStats.apply(previous[0], **UserSiteStats.contribution(previous[1], -1))
+                    UserSiteStats.apply(current[0], **UserSiteStats.contribution(current[1], 1))
+                self._counted = current
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Dashboard listing, and listing filtered by status; id completes
+            # the (created_at, id) keyset so cursor pages need no sort
+            models.Index(fields=['user', '-created_at', '-id'], name='gensite_user_created_id_idx'),
+            models.Index(fields=['user', 'status', '-created_at', '-id'], name='gensite_user_status_id_idx'),
+        ]
+
+
+class GeneratedContent(models.Model):
+    """
+    Compressed generated body of a GeneratedSite, kept out of the hot
+    generator_generatedsite row so list queries and status saves stay small.
+    """
+    site = models.OneToOneField(GeneratedSite, on_delete=models.CASCADE, primary_key=True, related_name='content')
+    data = models.BinaryField()
+    compression = models.CharField(max_length=10, default='zlib')
+    size = models.IntegerField(default=0)  # Uncompressed size in bytes
+
+    def __str__(self):
+        return f"Content of site {self.site_id} ({self.size} bytes)"
+
+    @property
+    def text(self) -> str:
+        data = bytes(self.data)
+        if self.compression == 'zlib':
+            data = zlib.decompress(data)
+        return data.decode('utf-8')
+
+    @classmethod
+    def store(cls, site_id, text):
+        """Save (or with ``None`` remove) the body of a site"""
+        if text is None:
+            cls.objects.filter(site_id=site_id).delete()
+            return
+        raw = text.encode('utf-8')
+        cls.objects.update_or_create(
+            site_id=site_id,
+            defaults={'data': zlib.compress(raw, 6), 'compression': 'zlib', 'size': len(raw)},
+        )
+
+
+class UserSiteStats(models.Model):
+    """
+    Per-user site counters for the dashboard, maintained alongside every
+    GeneratedSite create, status change, download and delete so the dashboard
+    never has to scan the user's sites. ``manage.py rebuild_site_stats``
+    recomputes them from scratch.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='site_stats')
+    total_sites = models.IntegerField(default=0)
+    completed_sites = models.IntegerField(default=0)
+    failed_sites = models.IntegerField(default=0)
+    total_downloads = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.total_sites} sites"
+
+    class Meta:
+        verbose_name_plural = 'User site stats'
+
+    @staticmethod
+    def contribution(status, sign=1):
+        """Counter deltas for one site with ``status`` (None: not counted)"""
+        if status is None:
+            return {}
+        deltas = {'total_sites': sign}
+        if status == 'completed':
+            deltas['completed_sites'] = sign
+        elif status == 'failed':
+            deltas['failed_sites'] = sign
+        return deltas
+
+    @classmethod
+    def apply(cls, user_id, create=True, **deltas):
+        """Add counter deltas with an F() update; a missing row is computed from scratch"""
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not user_id or not deltas:
+            return
+        updates = {field: F(field) + delta for field, delta in deltas.items()}
+        if cls.objects.filter(user_id=user_id).update(**updates) or not create:
+            return
+        # The computed totals already include the change being recorded
+        stats, created = cls.objects.get_or_create(user_id=user_id, defaults=cls.compute(user_id))
+        if not created:
+            cls.objects.filter(user_id=user_id).update(**updates)
+
+    @staticmethod
+    def compute(user_id) -> dict:
+        """Counters for a user in one conditional-aggregate query"""
+        totals = GeneratedSite.objects.filter(user_id=user_id).aggregate(
+            total_sites=Count('id'),
+            completed_sites=Count('id', filter=Q(status='completed')),
+            failed_sites=Count('id', filter=Q(status='failed')),
+            total_downloads=Sum('downloads_count'),
+        )
+        totals['total_downloads'] = totals['total_downloads'] or 0
+        return totals
+
+    @classmethod
+    def rebuild(cls, user_id):
+        stats, created = cls.objects.update_or_create(user_id=user_id, defaults=cls.compute(user_id))
+        return stats
+
+    @classmethod
+    def for_user(cls, user_id):
+        return cls.objects.filter(user_id=user_id).first() or cls.rebuild(user_id)
+
+    def count_for_status(self, status=None) -> int:
+        """Number of sites with ``status`` (all sites for None/'all'), from the counters"""
+        if status == 'completed':
+            return self.completed_sites
+        if status == 'failed':
+            return self.failed_sites
+        if status == 'pending':
+            return max(self.total_sites - self.completed_sites - self.failed_sites, 0)
+        return self.total_sites
+
+
+class UsagePeriod(models.Model):
+    """
+    Monthly rollup of a user's UsageEvents, updated in the same transaction
+    as every event so remaining quota is a single-row read. ``used`` counts
+    reserved and delivered websites against ``limit``; ``generated`` only the
+    delivered ones. Rows for a new month are opened by the
+    ``open_usage_periods`` scheduled task (or by the first reservation).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='usage_periods')
+    period = models.DateField()  # First day of the month
+    plan = models.CharField(max_length=20)
+    limit = models.IntegerField(null=True, blank=True)  # None: not metered per period (free plan)
+    used = models.IntegerField(default=0)
+    generated = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.period:%Y-%m} - {self.used}/{self.limit}"
+
+    class Meta:
+        ordering = ['-period']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period'], name='usageperiod_user_period_uniq'),
+        ]
+
+    @property
+    def remaining(self):
+        if self.limit is None:
+            return 0
+        return max(self.limit - self.used, 0)
+
+    @classmethod
+    def current(cls, user_id, plan):
+        """This month's row for the user, following plan changes made mid-month"""
+        limit = PLAN_LIMITS.get(plan)
+        usage, created = cls.objects.get_or_create(
+            user_id=user_id, period=period_start(), defaults={'plan': plan, 'limit': limit},
+        )
+        if usage.plan != plan:
+            cls.objects.filter(pk=usage.pk).update(plan=plan, limit=limit)
+            usage.plan, usage.limit = plan, limit
+        return usage
+
+    @classmethod
+    def peek(cls, user_id, plan):
+        """Like ``current`` but read-only: a missing row is returned unsaved and a plan change is not written"""
+        limit = PLAN_LIMITS.get(plan)
+        usage = cls.objects.filter(user_id=user_id, period=period_start()).first()
+        if usage is None:
+            return cls(user_id=user_id, period=period_start(), plan=plan, limit=limit)
+        usage.plan, usage.limit = plan, limit
+        return usage
+
+
+class UsageEvent(models.Model):
+    """Append-only ledger of quota movements (see generator/quota.py)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='usage_events')
+    site = models.ForeignKey(GeneratedSite, on_delete=models.SET_NULL, null=True, blank=True)
+    period = models.DateField()  # Usage period the movement counts against
+    kind = models.CharField(
+        max_length=10,
+        choices=[("reserve", "Reserved"), ("commit", "Delivered"), ("release", "Released")]
+    )
+    quantity = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.kind} {self.quantity} ({self.period:%Y-%m})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'period'], name='usageevent_user_period_idx'),
+        ]
+
+
+@receiver(post_delete, sender=GeneratedSite)
+def remove_site_from_stats(sender, instance, **kwargs):
+    deltas = UserSiteStats.contribution(instance.status, -1)
+    deltas['total_downloads'] = -instance.downloads_count
+    # The user itself may be going away in the same cascade
+    UserSiteStats.apply(instance.user_id, create=False, **deltas)
 
 
 class Suggestion(models.Model):
@@ -231,3 +512,23 @@ class Payment(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+
+
+class GenerationCacheEntry(models.Model):
+    """Zip archive shared by every GeneratedSite built from the same normalized prompt"""
+    key = models.CharField(max_length=64, unique=True)  # sha256 of generator version + normalized prompt
+    generator_version = models.CharField(max_length=20)
+    archive = models.FileField(upload_to="sites/cache/")
+    summary = models.TextField(blank=True)
+    size_bytes = models.IntegerField(default=0)
+    hit_count = models.IntegerField(default=0)
+    miss_count = models.IntegerField(default=0)  # Renders of this key, i.e. lookups that missed
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.key[:12]} - {self.hit_count} hits"
+
+    class Meta:
+        ordering = ['-last_used_at']
+        verbose_name_plural = 'Generation cache entries'
@@ -0,0 +1,276 @@
+"""
+Resilient access to the OpenAI API.
+
+One OpenAIClientManager per process wraps the OpenAI SDK with:
+- a shared keep-alive httpx connection pool
+- per-call deadlines and bounded retries with full-jitter backoff
+- a circuit breaker that rejects calls immediately while the upstream keeps
+  failing, so callers can serve generate_fallback_website instead of hanging
+- latency and error metrics, printed periodically by each process
+"""
+import random
+import threading
+import time
+
+import httpx
+import openai
+from django.conf import settings
+from openai import OpenAI
+
+# Upstream trouble worth retrying (and counting against the breaker)
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling OpenAI while the circuit breaker is open"""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a streamed completion is still running at the call's deadline"""
+
+
+class CircuitBreaker:
+    """
+    Opens after ``threshold`` consecutive failures. After ``cooldown`` seconds
+    one caller is let through as a probe; everyone else is still rejected
+    until the probe records a success (closed) or a failure (open again).
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        """False to reject the call, 'closed' for a normal call, 'probe' for the half-open probe"""
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if self._probing or time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self._probing = True
+            return 'probe'
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                print("✅ OpenAI circuit breaker closed")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            half_open = self._opened_at is not None
+            if half_open or self._failures >= self.threshold:
+                if not half_open:
+                    print(f"⚠️  OpenAI circuit breaker opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """End the probe when it told nothing about upstream health (client error, abandoned stream)"""
+        with self._lock:
+            self._probing = False
+
+
+class ClientMetrics:
+    """
+    Thread-safe counters and latency stats for OpenAI calls in this process.
+    Every ``log_interval`` seconds (0 disables) the next call prints a snapshot,
+    so each web and worker process reports its own numbers in its log.
+    """
+
+    def __init__(self, log_interval: float = 0):
+        self._lock = threading.Lock()
+        self.log_interval = log_interval
+        self._logged_at = time.monotonic()
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.rejected = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.errors = {}
+
+    def record(self, outcome: str, latency: float = 0.0, error: Exception = None):
+        with self._lock:
+            self._count(outcome, latency, error)
+            due = self.log_interval and time.monotonic() - self._logged_at >= self.log_interval
+            if due:
+                self._logged_at = time.monotonic()
+        if due:
+            print(f"📊 OpenAI client metrics: {self.snapshot()}")
+
+    def _count(self, outcome, latency, error):
+        if outcome == 'rejected':
+            self.rejected += 1
+            return
+        if outcome == 'retry':
+            self.retries += 1
+        else:
+            self.calls += 1
+            if outcome == 'success':
+                self.successes += 1
+            else:
+                self.failures += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+        if error is not None:
+            name = type(error).__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'successes': self.successes,
+                'failures': self.failures,
+                'retries': self.retries,
+                'rejected_by_breaker': self.rejected,
+                'latency_avg_ms': round(self.latency_total / self.calls * 1000, 1) if self.calls else 0.0,
+                'latency_max_ms': round(self.latency_max * 1000, 1),
+                'errors': dict(self.errors),
+            }
+
+
+class OpenAIClientManager:
+    """OpenAI client with pooling, deadlines, retries, circuit breaking and metrics"""
+
+    def __init__(self, api_key, base_url=None, timeout=60.0, connect_timeout=5.0, deadline=120.0,
+                 max_retries=2, pool_size=10, breaker_threshold=5, breaker_cooldown=30.0, metrics_log_interval=0):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size, keepalive_expiry=30),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        )
+        # Retries are handled here so they respect the deadline and the breaker
+        self.client = OpenAI(api_key=api_key, base_url=base_url, http_client=self.http_client,
+                             max_retries=0, timeout=httpx.Timeout(timeout, connect=connect_timeout))
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.metrics = ClientMetrics(metrics_log_interval)
+
+    def chat_completion(self, **kwargs):
+        """client.chat.completions.create with deadline, retries and circuit breaking"""
+        response, probe = self._call(lambda timeout: self.client.chat.completions.create(timeout=timeout, **kwargs))
+        return response
+
+    def stream_chat_completion(self, **kwargs):
+        """
+        Yield streamed chat completion chunks. Retries only cover opening the
+        stream; once tokens have been relayed a failure is final. The deadline
+        covers the whole stream, and the response is closed however it ends.
+        """
+        start = time.monotonic()
+        stream, probe = self._call(
+            lambda timeout: self.client.chat.completions.create(stream=True, timeout=timeout, **kwargs),
+            record_success=False,
+        )
+        settled = False
+        try:
+            for chunk in stream:
+                if time.monotonic() - start > self.deadline:
+                    raise DeadlineExceeded(f"OpenAI stream still running after {self.deadline:.0f}s")
+                yield chunk
+            self.breaker.record_success()
+            settled = True
+            self.metrics.record('success', time.monotonic() - start)
+        except (*RETRYABLE_ERRORS, httpx.HTTPError, DeadlineExceeded) as e:
+            # Mid-stream failures surface as raw httpx errors (ReadTimeout, RemoteProtocolError)
+            self.breaker.record_failure()
+            settled = True
+            self.metrics.record('failure', time.monotonic() - start, e)
+            raise
+        except Exception as e:
+            self.metrics.record('failure', time.monotonic() - start, e)
+            raise
+        finally:
+            stream.close()
+            if probe and not settled:
+                # Abandoned or failed on our side: the probe proved nothing
+                self.breaker.release()
+
+    def _call(self, request, record_success=True):
+        """(result, whether this call is the breaker's half-open probe)"""
+        allowed = self.breaker.allow()
+        if not allowed:
+            self.metrics.record('rejected')
+            raise CircuitOpenError("OpenAI is unavailable (circuit breaker open)")
+        probe = allowed == 'probe'
+
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            remaining = self.deadline - (time.monotonic() - started)
+            attempt_start = time.monotonic()
+            try:
+                result = request(min(self.timeout, max(remaining, 1.0)))
+            except RETRYABLE_ERRORS as e:
+                remaining = self.deadline - (time.monotonic() - started)
+                backoff = random.uniform(0, min(8.0, 0.5 * 2 ** attempt))  # full jitter
+                # A probe gets one attempt; nobody retries into an open breaker
+                if probe or attempt >= self.max_retries or backoff >= remaining or self.breaker.state == 'open':
+                    self.breaker.record_failure()
+                    self.metrics.record('failure', time.monotonic() - attempt_start, e)
+                    raise
+                self.metrics.record('retry', error=e)
+                attempt += 1
+                time.sleep(backoff)
+                continue
+            except Exception as e:
+                # Client-side errors (bad request, auth) say nothing about upstream health
+                if probe:
+                    self.breaker.release()
+                self.metrics.record('failure', time.monotonic() - attempt_start, e)
+                raise
+
+            if record_success:
+                self.breaker.record_success()
+                self.metrics.record('success', time.monotonic() - attempt_start)
+            return result, probe
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_openai_manager():
+    """Process-wide OpenAIClientManager, or None when no API key is configured"""
+    global _manager
+    if _manager is None and settings.OPENAI_API_KEY:
+        with _manager_lock:
+            if _manager is None:
+                _manager = OpenAIClientManager(
+                    api_key=settings.OPENAI_API_KEY,
+                    base_url=getattr(settings, 'OPENAI_BASE_URL', None) or None,
+                    timeout=getattr(settings, 'OPENAI_TIMEOUT', 60.0),
+                    connect_timeout=getattr(settings, 'OPENAI_CONNECT_TIMEOUT', 5.0),
+                    deadline=getattr(settings, 'OPENAI_DEADLINE', 120.0),
+                    max_retries=getattr(settings, 'OPENAI_MAX_RETRIES', 2),
+                    pool_size=getattr(settings, 'OPENAI_POOL_SIZE', 10),
+                    breaker_threshold=getattr(settings, 'OPENAI_BREAKER_THRESHOLD', 5),
+                    breaker_cooldown=getattr(settings, 'OPENAI_BREAKER_COOLDOWN', 30.0),
+                    metrics_log_interval=getattr(settings, 'OPENAI_METRICS_LOG_INTERVAL', 0),
+                )
+    return _manager
@@ -0,0 +1,94 @@
+"""
+Full-page cache for the static marketing and legal pages.
+
+``@cache_public_page(timeout)`` serves a cached copy of a GET page to
+anonymous visitors. Logged-in users and requests with pending flash messages
+always get a fresh render, since their pages differ from everyone else's.
+Nothing user-specific can leak into the shared copy.
+
+A CSRF token rendered by ``{% csrf_token %}`` is stored as a placeholder and
+replaced with the visitor's own token on every hit, so cached forms still
+post. Pages must not embed the token any other way.
+
+Entries are keyed by a cache "generation" as well as the URL path. None of
+the cached pages read the query string, and keying on it would let
+``?x=<random>`` add a new entry on every request. ``clear_page_cache()``
+bumps the generation after a deploy instead of deleting keys one by one.
+``manage.py prerender_pages`` warms the cache and can also write the pages
+out as static HTML for whitenoise.
+"""
+import hashlib
+import re
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_vary_headers
+
+GENERATION_KEY = 'page:generation'
+CSRF_PLACEHOLDER = '__csrf_token_placeholder__'
+CSRF_INPUT_RE = re.compile(r'(<input type="hidden" name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+# Names of the decorated views (their URL names in generator/urls.py) -> TTL
+CACHED_PAGES = {}
+
+
+def page_cache_key(request) -> str:
+    generation = cache.get_or_set(GENERATION_KEY, 1, None)
+    path = hashlib.md5(request.path.encode('utf-8')).hexdigest()
+    return f"page:{generation}:{path}"
+
+
+def clear_page_cache():
+    """Invalidate every cached page at once"""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def is_cacheable(request) -> bool:
+    if not getattr(settings, 'PAGE_CACHE_ENABLED', True) or request.method not in ('GET', 'HEAD'):
+        return False
+    # len() peeks at pending messages without marking them as shown
+    return not request.user.is_authenticated and not len(get_messages(request))
+
+
+def cache_public_page(timeout):
+    """Cache the anonymous render of a page for ``timeout`` seconds"""
+    def decorator(view):
+        CACHED_PAGES[view.__name__] = timeout
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_cacheable(request):
+                return view(request, *args, **kwargs)
+
+            key = page_cache_key(request)
+            cached = cache.get(key)
+            if cached is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming or response.cookies:
+                    return response
+                content = response.content.decode(response.charset)
+                uses_csrf = bool(request.META.get('CSRF_COOKIE_NEEDS_UPDATE'))
+                if uses_csrf:
+                    content = CSRF_INPUT_RE.sub(rf'\g<1>{CSRF_PLACEHOLDER}\g<2>', content)
+                cache.set(key, (content, response['Content-Type'], uses_csrf), timeout)
+                patch_vary_headers(response, ('Cookie',))
+                response['X-Page-Cache'] = 'miss'
+                return response
+
+            content, content_type, uses_csrf = cached
+            if uses_csrf:
+                # get_token also makes the CSRF middleware set the cookie
+                content = content.replace(CSRF_PLACEHOLDER, get_token(request))
+            response = HttpResponse(content, content_type=content_type)
+            patch_vary_headers(response, ('Cookie',))
+            response['X-Page-Cache'] = 'hit'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,105 @@
+"""
+Keyset (cursor) pagination for GeneratedSite lists.
+
+Pages are ordered newest first on (created_at, id) and a cursor is the key of
+the last (or first) row of the current page, so fetching any page is one
+index range scan of ``per_page + 1`` rows: no COUNT(*) and no OFFSET, however
+deep the page. The redundant ``created_at`` bound next to the (created_at,
+id) comparison lets the database seek into the index instead of filtering
+from its start. Cursors are opaque url-safe strings; a malformed cursor just
+starts from the first page.
+"""
+import base64
+import binascii
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+from django.db.models import Q
+
+DEFAULT_PER_PAGE = 12
+MAX_PER_PAGE = 100
+
+
+def encode_cursor(created_at: datetime, pk: int) -> str:
+    raw = f"{created_at.isoformat()}|{pk}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]):
+    """(created_at, id) from a cursor, or None if it is missing or invalid"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+@dataclass
+class KeysetPage:
+    items: List = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    previous_cursor: Optional[str] = None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def seek(queryset, key=None, backwards=False):
+    """
+    ``queryset`` ordered on the keyset and limited to rows older than ``key``
+    (or, ``backwards``, newer than it and oldest first)
+    """
+    if backwards:
+        created_at, pk = key
+        return queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk),
+                               created_at__gte=created_at).order_by('created_at', 'id')
+    if key:
+        created_at, pk = key
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk),
+                                   created_at__lte=created_at)
+    return queryset.order_by('-created_at', '-id')
+
+
+def paginate(queryset, after: Optional[str] = None, before: Optional[str] = None,
+             per_page: int = DEFAULT_PER_PAGE) -> KeysetPage:
+    """
+    One page of ``queryset`` newest first. ``after`` continues past an older
+    page boundary (next page); ``before`` goes back towards newer rows.
+    """
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    after_key, before_key = decode_cursor(after), decode_cursor(before)
+
+    if before_key:
+        rows = list(seek(queryset, before_key, backwards=True)[:per_page + 1])
+        has_more_newer = len(rows) > per_page
+        items = rows[:per_page][::-1]
+        # Going back always leaves the page we came from as the next one
+        has_more_older = True
+    else:
+        rows = list(seek(queryset, after_key)[:per_page + 1])
+        has_more_older = len(rows) > per_page
+        items = rows[:per_page]
+        has_more_newer = after_key is not None
+
+    page = KeysetPage(items)
+    if items:
+        if has_more_older:
+            page.next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+        if has_more_newer:
+            page.previous_cursor = encode_cursor(items[0].created_at, items[0].id)
+    return page
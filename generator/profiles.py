@@ -0,0 +1,85 @@
+"""
+Per-request UserProfile and quota lookups.
+
+ProfileMiddleware puts a lazy ``request.profile`` and ``request.quota`` on
+every request: the profile is loaded at most once, and only by views that
+use it. The quota (plan, remaining websites, whether the user can generate)
+can also be cached in the cache backend for QUOTA_CACHE_TIMEOUT seconds;
+every profile save or quota update invalidates it.
+
+New users get their profile from a post_save signal on User.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.functional import SimpleLazyObject, empty
+
+from .models import UserProfile
+
+
+def quota_cache_key(user_id) -> str:
+    return f"quota:{user_id}"
+
+
+def get_profile(user):
+    """The user's profile (None for anonymous users); created for accounts that predate the signal"""
+    if not user.is_authenticated:
+        return None
+    try:
+        return user.userprofile
+    except UserProfile.DoesNotExist:
+        profile, created = UserProfile.objects.get_or_create(user=user)
+        return profile
+
+
+def get_quota(user, profile=None) -> dict:
+    """Quota state of the user, from the cache when enabled"""
+    if not user.is_authenticated:
+        return {}
+    timeout = getattr(settings, 'QUOTA_CACHE_TIMEOUT', 0)
+    if timeout:
+        quota = cache.get(quota_cache_key(user.id))
+        if quota is not None:
+            return quota
+    quota = (profile or get_profile(user)).quota_state()
+    if timeout:
+        cache.set(quota_cache_key(user.id), quota, timeout)
+    return quota
+
+
+def invalidate_quota(user_id):
+    if getattr(settings, 'QUOTA_CACHE_TIMEOUT', 0):
+        cache.delete(quota_cache_key(user_id))
+
+
+class ProfileMiddleware:
+    """Lazy ``request.profile`` and ``request.quota`` (needs AuthenticationMiddleware)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.profile = SimpleLazyObject(lambda: get_profile(request.user))
+        request.quota = SimpleLazyObject(lambda: get_quota(request.user, _loaded_profile(request)))
+        return self.get_response(request)
+
+
+def _loaded_profile(request):
+    """The profile if the view already loaded it, so a quota cache miss needs no query"""
+    wrapped = request.profile._wrapped
+    return None if wrapped is empty else wrapped
+
+
+@receiver(post_save, sender=User)
+def create_profile(sender, instance, created, raw=False, **kwargs):
+    """Every new account gets its profile up front instead of on first page view"""
+    if created and not raw:
+        UserProfile.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def profile_changed(sender, instance, **kwargs):
+    invalidate_quota(instance.user_id)
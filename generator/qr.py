@@ -0,0 +1,84 @@
+"""
+QR codes for payment pages.
+
+Every payment's UPI string carries its own transaction id, so each payload
+is encoded once, when its image is first fetched; repeat fetches are
+answered by the browser cache and the ETag. The module matrix is drawn
+directly:
+
+- SVG: one ``<path>`` stroking each run of dark modules; no rasterizing
+  at all, about 3 KB (under 1 KB gzipped) for a UPI payload.
+- PNG: a 1-bit Pillow image of one pixel per module, scaled up with
+  nearest-neighbour, instead of drawing every box.
+
+``manage.py bench_qr`` compares both with the previous qrcode/PIL path.
+"""
+import io
+
+import qrcode
+from PIL import Image
+
+BOX_SIZE = 10
+BORDER = 4
+
+CONTENT_TYPES = {
+    'svg': 'image/svg+xml',
+    'png': 'image/png',
+}
+
+
+def qr_matrix(data: str) -> tuple:
+    """Rows of booleans (True = dark) for ``data``, quiet zone included"""
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L, border=BORDER)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return tuple(tuple(row) for row in qr.get_matrix())
+
+
+def render_svg(data: str, box_size: int = BOX_SIZE) -> bytes:
+    matrix = qr_matrix(data)
+    size = len(matrix)
+    # Each run of dark modules is a 1-unit-wide horizontal stroke through the
+    # middle of its row, written with relative moves to keep the path short
+    path = []
+    for y, row in enumerate(matrix):
+        pen = None
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            path.append(f"M{start} {y}.5h{x - start}" if pen is None else f"m{start - pen} 0h{x - start}")
+            pen = x
+    pixels = size * box_size
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" height="{pixels}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{"".join(path)}" fill="none" stroke="#000"/></svg>'
+    ).encode('ascii')
+
+
+def render_png(data: str, box_size: int = BOX_SIZE) -> bytes:
+    matrix = qr_matrix(data)
+    size = len(matrix)
+    image = Image.new('1', (size, size))
+    # Mode '1': 0 is black, 255 white
+    image.putdata([0 if dark else 255 for row in matrix for dark in row])
+    image = image.resize((size * box_size, size * box_size), Image.NEAREST)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+RENDERERS = {
+    'svg': render_svg,
+    'png': render_png,
+}
+
+
+def render(data: str, fmt: str = 'svg') -> bytes:
+    return RENDERERS[fmt](data)
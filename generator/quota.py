@@ -0,0 +1,158 @@
+"""
+Reserve / commit / release protocol for website quota.
+
+A generation request reserves its websites before any work starts, with a
+conditional UPDATE, so parallel requests from one account can never
+overspend and no profile is read, modified and saved back:
+
+- free plan: ``free_websites_remaining >= n`` on the UserProfile
+- paid plans: ``used + n <= limit`` on this month's UsagePeriod
+
+Each GeneratedSite records what it holds in ``quota_hold`` (``'free'`` or
+``'plan'``). Delivered sites are committed, failed or deleted ones are
+released (their units refunded). Both clear the hold with a conditional
+UPDATE first, so a redelivered task or a retry can't charge or refund twice.
+
+Every movement is appended to the UsageEvent ledger and rolled up into the
+UsagePeriod of the month it was reserved in, in the same transaction.
+"""
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import GeneratedSite, UsageEvent, UsagePeriod, UserProfile, period_start
+from .profiles import get_profile, invalidate_quota
+
+
+class QuotaExceeded(Exception):
+    """The account has no websites left for this request"""
+
+
+def reserve(user, count=1) -> str:
+    """
+    Hold ``count`` websites for ``user``; returns the hold to store on the sites.
+    Callers wrapping this in a transaction should load the profile first
+    (``get_profile``): in SQLite's default deferred mode, a read before the
+    first write makes concurrent writers fail with "database is locked"
+    instead of queueing them (the bundled settings use IMMEDIATE).
+    """
+    if not user.is_authenticated:
+        return ''
+    profile = get_profile(user)
+    if profile.subscription_plan != 'free' and not profile.subscription_active():
+        profile.expire_subscription()
+    plan, period = profile.subscription_plan, period_start()
+
+    # Every statement below starts with a write: the conditional UPDATE is the
+    # whole check, and SQLite never has to upgrade a read lock mid-transaction
+    with transaction.atomic():
+        if plan == 'free':
+            hold = 'free'
+            taken = UserProfile.objects.filter(pk=profile.pk, free_websites_remaining__gte=count).update(
+                free_websites_remaining=F('free_websites_remaining') - count, updated_at=timezone.now(),
+            )
+            if taken:
+                _add_usage(user.id, plan, period, count)
+        else:
+            hold = 'plan'
+            taken = _add_usage(user.id, plan, period, count, enforce_limit=True)
+        if not taken:
+            raise QuotaExceeded()
+        UsageEvent.objects.create(user_id=user.id, period=period, kind='reserve', quantity=count)
+
+    invalidate_quota(user.id)
+    return hold
+
+
+def _add_usage(user_id, plan, period, count, enforce_limit=False) -> int:
+    """Add ``count`` to the period's ``used`` (within its limit); returns the rows updated"""
+    def update():
+        rows = UsagePeriod.objects.filter(user_id=user_id, period=period, plan=plan)
+        if enforce_limit:
+            rows = rows.filter(used__lte=F('limit') - count)
+        return rows.update(used=F('used') + count, updated_at=timezone.now())
+
+    updated = update()
+    if not updated:
+        # First reservation of the month or a plan change: open or fix the row, then retry
+        usage = UsagePeriod.current(user_id, plan)
+        if not enforce_limit or usage.remaining >= count:
+            updated = update()
+    return updated
+
+
+def commit(user_id, sites):
+    """Charge delivered sites: their holds are consumed and usage is counted"""
+    with transaction.atomic():
+        cleared = _clear_holds(sites)
+        charged = sum(cleared.values())
+        if charged:
+            UserProfile.objects.filter(user_id=user_id).update(
+                websites_generated=F('websites_generated') + charged,
+                updated_at=timezone.now(),
+            )
+        for (hold, period), count in cleared.items():
+            _record(user_id, period, 'commit', count, sites)
+            UsagePeriod.objects.filter(user_id=user_id, period=period).update(
+                generated=F('generated') + count, updated_at=timezone.now(),
+            )
+    if charged:
+        invalidate_quota(user_id)
+
+
+def release(user_id, sites):
+    """Give back the units held by sites that were not delivered"""
+    with transaction.atomic():
+        for (hold, period), count in _clear_holds(sites).items():
+            _refund(user_id, hold, period, count, sites)
+
+
+def _clear_holds(sites) -> dict:
+    """Clear the holds of ``sites``; returns {(hold, period): number that were still held}"""
+    groups = defaultdict(list)
+    for site in sites:
+        if site.quota_hold:
+            groups[(site.quota_hold, period_start(site.created_at))].append(site.id)
+        site.quota_hold = ''
+    cleared = {}
+    for (hold, period), site_ids in groups.items():
+        count = GeneratedSite.objects.filter(id__in=site_ids, quota_hold=hold).update(quota_hold='')
+        if count:
+            cleared[(hold, period)] = count
+    return cleared
+
+
+def _refund(user_id, hold, period, count, sites=()):
+    now = timezone.now()
+    if hold == 'free':
+        UserProfile.objects.filter(user_id=user_id).update(
+            free_websites_remaining=F('free_websites_remaining') + count, updated_at=now,
+        )
+    UsagePeriod.objects.filter(user_id=user_id, period=period).update(used=F('used') - count, updated_at=now)
+    _record(user_id, period, 'release', count, sites)
+    invalidate_quota(user_id)
+
+
+def _record(user_id, period, kind, count, sites):
+    # Single-site movements point at their site; batches are one event
+    site_id = sites[0].id if len(sites) == 1 else None
+    UsageEvent.objects.create(user_id=user_id, site_id=site_id, period=period, kind=kind, quantity=count)
+
+
+@receiver(post_delete, sender=GeneratedSite)
+def release_deleted_site(sender, instance, **kwargs):
+    # A site deleted before its job ran would otherwise keep its unit forever
+    if instance.quota_hold and instance.user_id:
+        hold, period = instance.quota_hold, period_start(instance.created_at)
+        transaction.on_commit(lambda: _refund_deleted_site(instance.user_id, hold, period))
+
+
+def _refund_deleted_site(user_id, hold, period):
+    # Nothing to give back when the site went with its account
+    if User.objects.filter(pk=user_id).exists():
+        _refund(user_id, hold, period, 1)
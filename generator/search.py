@@ -0,0 +1,139 @@
+"""
+Full-text search over GeneratedSite prompts.
+
+PostgreSQL: a generated ``search_vector`` tsvector column with a GIN index,
+queried with websearch_to_tsquery and ranked with ts_rank.
+SQLite: an FTS5 external-content table (generator_generatedsite_fts) kept in
+sync by triggers, queried with MATCH and ranked with bm25().
+
+Both are created by migration 0012. Other databases, or SQLite builds without
+FTS5, fall back to an unranked ``prompt__icontains`` filter.
+"""
+import re
+
+from django.db import connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'generator_generatedsite_fts'
+SEARCH_CONFIG = 'english'
+
+# Same triggers as migration 0012. SQLite rebuilds a table for most ALTERs,
+# which drops its triggers, so they are re-created after every migrate.
+SQLITE_TRIGGERS = {
+    'generator_generatedsite_fts_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS generator_generatedsite_fts_insert AFTER INSERT ON generator_generatedsite BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, prompt) VALUES (new.id, new.prompt);
+        END""",
+    'generator_generatedsite_fts_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS generator_generatedsite_fts_delete AFTER DELETE ON generator_generatedsite BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, prompt) VALUES ('delete', old.id, old.prompt);
+        END""",
+    'generator_generatedsite_fts_update': f"""
+        CREATE TRIGGER IF NOT EXISTS generator_generatedsite_fts_update AFTER UPDATE OF prompt ON generator_generatedsite BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, prompt) VALUES ('delete', old.id, old.prompt);
+            INSERT INTO {FTS_TABLE}(rowid, prompt) VALUES (new.id, new.prompt);
+        END""",
+}
+
+_fts_available = {}
+
+
+def backend() -> str:
+    """'postgresql', 'fts5' or 'icontains' for the current database"""
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite':
+        if connection.alias not in _fts_available:
+            _fts_available[connection.alias] = FTS_TABLE in connection.introspection.table_names()
+        if _fts_available[connection.alias]:
+            return 'fts5'
+    return 'icontains'
+
+
+def ensure_sqlite_triggers(sender=None, using='default', **kwargs):
+    """post_migrate hook: restore FTS5 sync triggers dropped by a table rebuild, then reindex"""
+    db = connections[using]
+    if db.vendor != 'sqlite' or FTS_TABLE not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'generator_generatedsite'")
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [name for name in SQLITE_TRIGGERS if name not in existing]
+        if not missing:
+            return
+        for name in missing:
+            cursor.execute(SQLITE_TRIGGERS[name])
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def search_sites(queryset, query: str, ranked: bool = True):
+    """
+    Filter a GeneratedSite queryset to prompts matching ``query``.
+    With ``ranked`` the best matches come first (newest first among equals).
+    """
+    query = (query or '').strip()
+    if not query:
+        return queryset
+
+    engine = backend()
+    if engine == 'postgresql':
+        return _search_postgresql(queryset, query, ranked)
+    if engine == 'fts5':
+        match = fts5_query(query)
+        if match:
+            return _search_fts5(queryset, match, ranked)
+    return queryset.filter(prompt__icontains=query)
+
+
+def fts5_query(query: str) -> str:
+    """Quote user input into an FTS5 MATCH expression: every term must match, the last as a prefix"""
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return ''
+    quoted = ['"{}"'.format(term.replace('"', '""')) for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _search_postgresql(queryset, query, ranked):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    # Params as a list: SearchQuery's lookup concatenates them with its own list
+    vector = RawSQL(f'{queryset.model._meta.db_table}.search_vector', [], output_field=SearchVectorField())
+    queryset = queryset.annotate(search_vector=vector).filter(search_vector=search_query)
+    if ranked:
+        queryset = queryset.annotate(rank=SearchRank(vector, search_query)).order_by('-rank', '-created_at')
+    return queryset
+
+
+def _search_fts5(queryset, match, ranked):
+    if not ranked:
+        matches = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,))
+        return queryset.filter(id__in=matches)
+    # Join the FTS table so MATCH drives the query and bm25() is computed once
+    # per hit (lower is better); the ORM has no other way to express this join.
+    # Only for ranked results: ordered by created_at instead, SQLite would walk
+    # the site index and re-run MATCH for every row.
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+        params=[match],
+        select={'rank': f'bm25({FTS_TABLE})'},
+        order_by=['rank', f'-{table}.created_at'],
+    )
+
+
+def search_admin_sites(queryset, search_term: str):
+    """Admin search: username substring or full-text prompt match"""
+    search_term = (search_term or '').strip()
+    if not search_term:
+        return queryset
+    if backend() == 'icontains':
+        prompt_match = Q(prompt__icontains=search_term)
+    else:
+        matching = search_sites(queryset.model.objects.all(), search_term, ranked=False)
+        prompt_match = Q(id__in=matching.values('id'))
+    return queryset.filter(prompt_match | Q(user__username__icontains=search_term))
@@ -0,0 +1,205 @@
+"""
+Background jobs for website generation.
+
+``generate_api`` only creates the pending GeneratedSite and enqueues
+``run_generation``; classification, the LLM call, zipping and status changes
+all happen here on a Celery worker. ``run_batch`` does the same for a bulk
+GenerationBatch, rendering its prompts one after another.
+``open_usage_periods`` runs on Celery beat at the start of every month and
+``refresh_counters`` every few minutes.
+
+A job that hits CELERY_TASK_SOFT_TIME_LIMIT fails its site(s) and refunds
+the quota itself. One killed outright (hard time limit, OOM, SIGKILL) can't,
+and late acks don't redeliver it, so ``fail_stale_generations`` sweeps up
+pending sites whose worker is gone.
+"""
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from celery import shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import counters, generation_cache, quota
+from .bulk import render_many, save_combined_archive
+from .models import PLAN_LIMITS, GeneratedSite, GenerationBatch, UsagePeriod, UserProfile, period_start
+from .profiles import invalidate_quota
+from .ai_service import GenerationError, generate_website_code, save_website_as_zip
+
+
+@shared_task(ignore_result=True)
+def run_generation(site_id):
+    """Generate the website for a pending GeneratedSite and store its zip"""
+    site = GeneratedSite.objects.filter(id=site_id, status="pending").select_related("user").first()
+    if site is None:
+        # Already processed (e.g. redelivered after a worker restart) or deleted
+        return
+    site.started_at = timezone.now()
+    GeneratedSite.objects.filter(id=site.id).update(started_at=site.started_at)
+
+    start_time = time.time()
+    try:
+        cached = generation_cache.lookup(site.prompt)
+        if cached is not None:
+            # Identical project already built - share its archive
+            generation_cache.attach(site, cached)
+        else:
+            artifact = generate_website_code(site.prompt)
+
+            site.generation_time = time.time() - start_time
+            deliver_artifact(site, artifact)
+
+        # Charge the user only once the website is actually delivered
+        quota.commit(site.user_id, [site])
+
+    except GenerationError as e:
+        print(f"❌ Generation failed for site {site.id}: {e}")
+        site.status = "failed"
+        site.save()
+        quota.release(site.user_id, [site])
+
+    except SoftTimeLimitExceeded:
+        print(f"⏱️  Generation for site {site.id} hit its time limit")
+        site.status = "failed"
+        site.save()
+        quota.release(site.user_id, [site])
+
+    except Exception as e:
+        print(f"❌ Generation job for site {site.id} failed: {e}")
+        site.status = "failed"
+        site.save()
+        quota.release(site.user_id, [site])
+
+
+def deliver_artifact(site, artifact):
+    """Save a generated project for ``site``, sharing Flask archives through the cache"""
+    if artifact.is_flask and generation_cache.is_enabled():
+        key = generation_cache.cache_key(site.prompt)
+        save_website_as_zip(site, artifact, archive_name=generation_cache.archive_name(key))
+        generation_cache.store(site.prompt, site, artifact)
+    else:
+        save_website_as_zip(site, artifact)
+
+
+@shared_task(ignore_result=True)
+def run_batch(batch_id):
+    """Generate every pending site of a bulk batch, then settle its quota reservation"""
+    batch = GenerationBatch.objects.filter(id=batch_id, status="pending").select_related("user").first()
+    if batch is None:
+        return
+
+    sites = list(batch.sites.filter(status="pending").order_by("id"))
+    start_time = time.time()
+    batch.sites.filter(status="pending").update(started_at=timezone.now())
+
+    try:
+        # Cache hits are attached straight away; only misses are rendered
+        to_render = []
+        for site in sites:
+            cached = generation_cache.lookup(site.prompt)
+            if cached is not None:
+                generation_cache.attach(site, cached)
+            else:
+                to_render.append(site)
+
+        results = render_many([site.prompt for site in to_render])
+        elapsed = (time.time() - start_time) / max(len(to_render), 1)
+
+        for site, result in zip(to_render, results):
+            try:
+                artifact = result
+                if isinstance(result, Exception):
+                    # Same fallback as single generations
+                    print(f"⚠️  Bulk render failed for site {site.id}: {result}")
+                    artifact = generate_website_code(site.prompt)
+                site.generation_time = elapsed
+                deliver_artifact(site, artifact)
+            except SoftTimeLimitExceeded:
+                raise
+            except Exception as e:
+                print(f"❌ Bulk generation failed for site {site.id}: {e}")
+                site.status = "failed"
+                site.save()
+
+    except SoftTimeLimitExceeded:
+        # Settle what was delivered; the rest fails and is refunded below
+        print(f"⏱️  Bulk batch {batch.id} hit its time limit")
+        for site in sites:
+            if site.status == "pending":
+                site.status = "failed"
+                site.save()
+
+    completed = [site for site in sites if site.status == "completed"]
+    failed = [site for site in sites if site.status != "completed"]
+
+    if batch.combined_archive and completed:
+        try:
+            save_combined_archive(batch, completed)
+        except (IOError, OSError) as e:
+            print(f"Error creating combined archive for batch {batch.id}: {e}")
+
+    # Charge what the batch delivered, refund the rest of the reservation
+    quota.commit(batch.user_id, completed)
+    quota.release(batch.user_id, failed)
+
+    batch.status = "completed" if completed else "failed"
+    batch.completed_at = timezone.now()
+    batch.save()
+
+
+@shared_task(ignore_result=True)
+def fail_stale_generations():
+    """Fail and refund pending sites whose job was lost: started too long ago, or never picked up"""
+    now = timezone.now()
+    stale = GeneratedSite.objects.filter(status="pending").filter(
+        Q(started_at__lt=now - timedelta(seconds=settings.GENERATION_STALE_AFTER))
+        | Q(started_at__isnull=True, created_at__lt=now - timedelta(seconds=settings.GENERATION_QUEUE_TIMEOUT))
+    )
+    by_user = defaultdict(list)
+    batch_ids = set()
+    for site in stale:
+        site.status = "failed"
+        site.save()
+        by_user[site.user_id].append(site)
+        if site.batch_id:
+            batch_ids.add(site.batch_id)
+    for user_id, sites in by_user.items():
+        quota.release(user_id, sites)
+
+    # Batches left with nothing pending are finished by what they delivered
+    for batch in GenerationBatch.objects.filter(id__in=batch_ids, status="pending").exclude(sites__status="pending"):
+        batch.status = "completed" if batch.sites.filter(status="completed").exists() else "failed"
+        batch.completed_at = now
+        batch.save()
+
+    count = sum(len(sites) for sites in by_user.values())
+    if count:
+        print(f"🧹 Failed {count} stale generations")
+    return count
+
+
+@shared_task(ignore_result=True)
+def open_usage_periods():
+    """Open this month's usage period for every active paid subscriber (their allowance resets)"""
+    period = period_start()
+    subscribers = list(UserProfile.objects.filter(
+        subscription_plan__in=PLAN_LIMITS, subscription_expires__gt=timezone.now(),
+    ).values_list('user_id', 'subscription_plan'))
+    UsagePeriod.objects.bulk_create(
+        [UsagePeriod(user_id=user_id, period=period, plan=plan, limit=PLAN_LIMITS[plan]) for user_id, plan in subscribers],
+        batch_size=1000,
+        ignore_conflicts=True,  # Rows already opened on first use this month
+    )
+    # Cached quota state still holds last month's remaining count
+    for user_id, plan in subscribers:
+        invalidate_quota(user_id)
+    print(f"📅 Opened usage periods for {len(subscribers)} subscribers ({period:%Y-%m})")
+
+
+@shared_task(ignore_result=True)
+def refresh_counters():
+    """Recompute the public page counters before they expire from the cache"""
+    counters.recompute_all()
@@ -0,0 +1,79 @@
+"""
+Registry of pre-rendered Flask project files.
+
+Most files of a generated Flask project do not depend on the prompt at all,
+and many others depend only on the app type. Rebuilding their (large) string
+literals on every request is wasted work, so the registry renders each of them
+once per process (per app type where needed) and keeps the result as text,
+UTF-8 bytes and a pre-deflated blob. Only the prompt-specific files are
+rendered per request.
+"""
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple
+
+from .artifacts import RenderedFile
+from . import flask_templates as templates
+
+# Render scopes
+STATIC = 'static'        # same for every project
+APP_TYPE = 'app_type'    # depends only on app_type
+REQUEST = 'request'      # depends on the prompt / project name
+
+# (archive path, scope, renderer(project_name, app_type, prompt)) in archive order
+PROJECT_LAYOUT: List[Tuple[str, str, Callable[[str, str, str], str]]] = [
+    ('app.py', REQUEST, lambda name, app_type, prompt: templates.generate_app_py(name, app_type, prompt)),
+    ('config.py', STATIC, lambda name, app_type, prompt: templates.generate_config_py()),
+    ('models.py', APP_TYPE, lambda name, app_type, prompt: templates.generate_models_py(app_type, prompt)),
+    ('forms.py', APP_TYPE, lambda name, app_type, prompt: templates.generate_forms_py(app_type, prompt)),
+    ('routes.py', APP_TYPE, lambda name, app_type, prompt: templates.generate_routes_py(app_type, prompt)),
+    ('templates/base.html', REQUEST, lambda name, app_type, prompt: templates.generate_base_template(name)),
+    ('templates/index.html', REQUEST, lambda name, app_type, prompt: templates.generate_index_template(name, app_type, prompt)),
+    ('templates/auth/login.html', STATIC, lambda name, app_type, prompt: templates.generate_login_template()),
+    ('templates/auth/register.html', STATIC, lambda name, app_type, prompt: templates.generate_register_template()),
+    ('templates/dashboard.html', APP_TYPE, lambda name, app_type, prompt: templates.generate_dashboard_template(app_type)),
+    ('static/css/style.css', APP_TYPE, lambda name, app_type, prompt: templates.generate_main_css(app_type)),
+    ('static/js/main.js', STATIC, lambda name, app_type, prompt: templates.generate_main_js()),
+    ('api.py', APP_TYPE, lambda name, app_type, prompt: templates.generate_api_routes(app_type, prompt)),
+    ('init_db.py', STATIC, lambda name, app_type, prompt: templates.generate_init_db()),
+    ('requirements.txt', STATIC, lambda name, app_type, prompt: templates.generate_requirements()),
+    ('.env.example', STATIC, lambda name, app_type, prompt: templates.generate_env_example()),
+    ('run.py', STATIC, lambda name, app_type, prompt: templates.generate_run_script()),
+    ('README.md', REQUEST, lambda name, app_type, prompt: templates.generate_readme(name, app_type)),
+]
+
+_RENDERERS = {path: (scope, renderer) for path, scope, renderer in PROJECT_LAYOUT}
+
+
+@lru_cache(maxsize=None)
+def shared_file(path: str, app_type: str = '') -> RenderedFile:
+    """Render a prompt-independent file once per process (per app_type for APP_TYPE files)"""
+    scope, renderer = _RENDERERS[path]
+    if scope == REQUEST:
+        raise ValueError(f"{path} depends on the prompt and cannot be shared")
+    return RenderedFile.from_text(renderer('', app_type, ''))
+
+
+def render_project(prompt: str, project_name: str, app_type: str, use_registry: bool = True) -> Dict[str, RenderedFile]:
+    """
+    Build every file of a Flask project. Shared files come from the registry;
+    with ``use_registry=False`` everything is rendered from scratch.
+    """
+    files = {}
+    for path, scope, renderer in PROJECT_LAYOUT:
+        if use_registry and scope == STATIC:
+            files[path] = shared_file(path)
+        elif use_registry and scope == APP_TYPE:
+            files[path] = shared_file(path, app_type)
+        else:
+            files[path] = RenderedFile.from_text(renderer(project_name, app_type, prompt))
+    return files
+
+
+def warm(app_types=('ecommerce', 'blog', 'task_manager', 'social', 'crm', 'portfolio', 'dashboard', 'general')):
+    """Pre-render every shared file, e.g. when a worker starts"""
+    for path, scope, renderer in PROJECT_LAYOUT:
+        if scope == STATIC:
+            shared_file(path)
+        elif scope == APP_TYPE:
+            for app_type in app_types:
+                shared_file(path, app_type)
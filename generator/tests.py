@@ -1,3 +1,1684 @@
-from django.test import TestCase
+import base64
+import importlib
+import io
+import json
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+import zlib
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import openai
+from celery.exceptions import SoftTimeLimitExceeded
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import (
+    ai_service, classifier, counters, downloads, generation_cache, openai_client, quota, search, tasks, template_registry,
+)
+from .models import (
+    GeneratedContent, GeneratedSite, GenerationBatch, GenerationCacheEntry, Payment, UsageEvent, UsagePeriod,
+    Suggestion, UserProfile, UserSiteStats,
+)
+from .pagination import paginate, seek
+from .profiles import ProfileMiddleware, get_profile
+from .tasks import fail_stale_generations, run_generation
+from .zipstream import iter_zip, zip_size
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='generator-tests-')
+
+PROMPT = 'A landing page for my coffee shop with a menu'
+
+FAKE_HTML = '<!DOCTYPE html><html><head><title>Fake coffee</title></head><body><h1>Fake coffee</h1></body></html>'
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        fault = self.server.next_fault()
+        self.server.requests.append(request)
+        time.sleep(fault.get('delay', 0))
+        if 'status' in fault:
+            self._send_json(fault['status'], {'error': {'message': 'Injected failure', 'type': 'server_error'}})
+        elif request.get('stream'):
+            self._stream(fault)
+        else:
+            self._send_json(200, {
+                'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': 0, 'model': request['model'],
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': FAKE_HTML}, 'finish_reason': 'stop'}],
+            })
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, fault):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        pieces = [FAKE_HTML[i:i + 16] for i in range(0, len(FAKE_HTML), 16)]
+        for index, piece in enumerate(pieces):
+            if index == fault.get('drop_after'):
+                # Hang up mid-body: the client sees an incomplete chunked response
+                self.close_connection = True
+                return
+            time.sleep(fault.get('chunk_delay', 0))
+            self._write_event({'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]})
+        self._write_event({'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+        self._write_chunk(b'data: [DONE]\n\n')
+        self._write_chunk(b'')
+
+    def _write_event(self, chunk):
+        chunk.update({'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'fake'})
+        self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+
+    def _write_chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+
+class FakeOpenAI(ThreadingHTTPServer):
+    """
+    OpenAI-compatible chat completions server on localhost. Queue faults with
+    ``inject``: ``status`` (error response), ``delay`` (before responding),
+    ``chunk_delay`` (between streamed chunks), ``drop_after`` (hang up after
+    that many chunks). Requests without a queued fault succeed.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeOpenAIHandler)
+        self.url = f"http://127.0.0.1:{self.server_address[1]}/v1"
+        self.requests = []
+        self.faults = []
+        self._lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def inject(self, *faults):
+        with self._lock:
+            self.faults.extend(faults)
+
+    def next_fault(self):
+        with self._lock:
+            return self.faults.pop(0) if self.faults else {}
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        pass  # Clients hanging up mid-response (timeouts, closed streams) are expected
+
+
+class FakeOpenAIMixin:
+    """Points the OpenAI client at a FakeOpenAI server through OPENAI_BASE_URL"""
+
+    openai_settings = {}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.openai = FakeOpenAI()
+        cls.addClassCleanup(cls.openai.stop)
+
+    def setUp(self):
+        super().setUp()
+        self.openai.requests.clear()
+        self.openai.faults.clear()
+        override = override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=self.openai.url, **self.openai_settings)
+        override.enable()
+        self.addCleanup(override.disable)
+        # A fresh manager (pool, breaker, metrics) for every test
+        openai_client._manager = None
+        self.manager = openai_client.get_openai_manager()
+        self.addCleanup(self.manager.http_client.close)
+        self.addCleanup(setattr, openai_client, '_manager', None)
+        patcher = mock.patch.object(ai_service, 'client', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, OPENAI_API_KEY=None)
+class GenerateStreamTests(TransactionTestCase):
+    # Closing a streamed response fires request_finished, which closes the connection
+
+    def setUp(self):
+        self.user = User.objects.create_user('streamer', 'streamer@example.com')
+        self.client.force_login(self.user)
+
+    def remaining(self):
+        return UserProfile.objects.get(user=self.user).free_websites_remaining
+
+    def test_stream_saves_site_and_commits_quota(self):
+        before = self.remaining()
+        response = self.client.post('/api/generate/stream/', {'prompt': PROMPT})
+        body = b''.join(response.streaming_content).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(body.startswith('event: start\n'))
+        self.assertIn('event: token\n', body)
+        self.assertIn('event: done\n', body)
+        site = GeneratedSite.objects.get()
+        self.assertEqual(site.status, 'completed')
+        self.assertEqual(site.quota_hold, '')
+        self.assertEqual(self.remaining(), before - 1)
+
+    def test_client_disconnect_fails_site_and_releases_quota(self):
+        before = self.remaining()
+        response = self.client.post('/api/generate/stream/', {'prompt': PROMPT})
+        self.assertEqual(self.remaining(), before - 1)
+
+        next(iter(response.streaming_content))  # 'start' reaches the client, then it goes away
+        response.close()
+
+        site = GeneratedSite.objects.get()
+        self.assertEqual(site.status, 'failed')
+        self.assertEqual(site.quota_hold, '')
+        self.assertEqual(self.remaining(), before)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class GenerateStreamOpenAITests(FakeOpenAIMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('streamer', 'streamer@example.com')
+        self.client.force_login(self.user)
+
+    def events(self, response):
+        body = b''.join(response.streaming_content).decode()
+        return [
+            (block.split('\n')[0][len('event: '):], json.loads(block.split('\n')[1][len('data: '):]))
+            for block in body.strip().split('\n\n')
+        ]
+
+    def test_relays_openai_chunks_as_they_arrive(self):
+        response = self.client.post('/api/generate/stream/', {'prompt': PROMPT})
+        events = self.events(response)
+
+        self.assertTrue(self.openai.requests[0]['stream'])
+        tokens = [data for name, data in events if name == 'token']
+        self.assertGreater(len(tokens), 1)
+        self.assertEqual(''.join(tokens), FAKE_HTML)
+        self.assertEqual(events[-1][0], 'done')
+        self.assertEqual(events[-1][1]['status'], 'completed')
+        site = GeneratedSite.objects.get()
+        self.assertEqual(site.status, 'completed')
+        self.assertIn('Fake coffee', site.generated_code)
+
+    def test_upstream_failure_mid_stream_fails_site_and_releases_quota(self):
+        before = UserProfile.objects.get(user=self.user).free_websites_remaining
+        self.openai.inject({'drop_after': 2})
+
+        events = self.events(self.client.post('/api/generate/stream/', {'prompt': PROMPT}))
+
+        self.assertEqual([name for name, data in events], ['start', 'token', 'token', 'error'])
+        site = GeneratedSite.objects.get()
+        self.assertEqual(site.status, 'failed')
+        self.assertEqual(UserProfile.objects.get(user=self.user).free_websites_remaining, before)
+
+
+class UsageEventAdminTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com')
+        self.client.force_login(self.admin)
+        self.user = User.objects.create_user('customer', 'customer@example.com')
+        hold = quota.reserve(self.user)
+        GeneratedSite.objects.create(user=self.user, prompt=PROMPT, status='pending', quota_hold=hold)
+
+    def test_deleting_user_cascades_to_ledger(self):
+        self.assertTrue(UsageEvent.objects.filter(user=self.user).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/admin/auth/user/{self.user.pk}/delete/', {'post': 'yes'})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(UsageEvent.objects.exists())
+
+    def test_ledger_is_read_only(self):
+        event = UsageEvent.objects.get(user=self.user)
+
+        self.assertEqual(self.client.get(f'/admin/generator/usageevent/{event.pk}/delete/').status_code, 403)
+        self.assertEqual(self.client.get('/admin/generator/usageevent/add/').status_code, 403)
+        response = self.client.post(f'/admin/generator/usageevent/{event.pk}/change/', {'quantity': 5})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(UsageEvent.objects.get(pk=event.pk).quantity, 1)
+
+
+class PaymentSuccessTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('payer', 'payer@example.com')
+        self.client.force_login(self.user)
+        Payment.objects.create(
+            user=self.user, amount=Decimal('999.00'), payment_method='upi',
+            transaction_id='TXN-PREMIUM', subscription_plan='premium',
+        )
+
+    def test_plan_allowance_does_not_become_free_allowance(self):
+        response = self.client.get('/payment-success/', {'txn_id': 'TXN-PREMIUM'})
+
+        self.assertEqual(response.context['websites_included'], 50)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.subscription_plan, 'premium')
+        self.assertEqual(profile.free_websites_remaining, 2)
+        self.assertEqual(profile.get_remaining_websites(), 50)
+
+        # After the subscription lapses only the free allowance is left
+        UserProfile.objects.filter(user=self.user).update(subscription_expires=timezone.now() - timedelta(days=1))
+        self.user.refresh_from_db()
+        for _ in range(2):
+            quota.reserve(self.user)
+        with self.assertRaises(quota.QuotaExceeded):
+            quota.reserve(self.user)
+
+
+class PaymentQRTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('qr', 'qr@example.com')
+        self.client.force_login(self.user)
+
+    def test_payment_page_links_its_own_qr_image(self):
+        first = self.client.get('/payment/basic/').context['payment']
+        second = self.client.get('/payment/basic/').context['payment']
+
+        # Each page view is a new transaction with its own payload
+        self.assertNotEqual(first.qr_code_data, second.qr_code_data)
+        self.assertIn(first.transaction_id, first.qr_code_data)
+
+        response = self.client.get(f'/payment/qr/{first.transaction_id}.svg')
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertTrue(response.content.startswith(b'<svg '))
+        self.assertIn('private', response['Cache-Control'])
+
+        response = self.client.get(f'/payment/qr/{first.transaction_id}.png')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+
+    def test_repeat_fetch_is_not_modified(self):
+        payment = self.client.get('/payment/premium/').context['payment']
+        url = f'/payment/qr/{payment.transaction_id}.svg'
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_other_users_and_formats_are_not_found(self):
+        payment = self.client.get('/payment/basic/').context['payment']
+        self.assertEqual(self.client.get(f'/payment/qr/{payment.transaction_id}.gif').status_code, 404)
+
+        self.client.force_login(User.objects.create_user('snoop', 'snoop@example.com'))
+        self.assertEqual(self.client.get(f'/payment/qr/{payment.transaction_id}.svg').status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, OPENAI_API_KEY=None)
+class QuotaConcurrencyTests(TransactionTestCase):
+    """Parallel requests from one account never overspend its quota"""
+
+    requests = 20
+    allowance = 5
+
+    def setUp(self):
+        self.user = User.objects.create_user('concurrent', 'concurrent@example.com')
+        UserProfile.objects.filter(user=self.user).update(free_websites_remaining=self.allowance)
+        # Drop the profile cached on the instance by the signal, then load it
+        # up front as the views do
+        self.user = User.objects.get(pk=self.user.pk)
+        get_profile(self.user)
+
+    def fire(self, request):
+        """Run ``request`` in parallel threads; returns (outcomes, errors)"""
+        barrier = threading.Barrier(self.requests)
+        outcomes, errors = [], []
+
+        def run():
+            try:
+                barrier.wait()
+                outcomes.append(request())
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(self.requests)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes, errors
+
+    def accounted(self):
+        """Websites still available, held by pending sites and charged"""
+        profile = UserProfile.objects.get(user=self.user)
+        held = GeneratedSite.objects.filter(user=self.user).exclude(quota_hold='').count()
+        return profile.free_websites_remaining, held, profile.websites_generated
+
+    def reserve(self):
+        try:
+            with transaction.atomic():
+                hold = quota.reserve(self.user)
+                GeneratedSite.objects.create(user=self.user, prompt=PROMPT, quota_hold=hold)
+            return True
+        except quota.QuotaExceeded:
+            return False
+
+    def generate(self):
+        client = Client()
+        client.force_login(self.user)
+        response = client.post('/api/generate/', {'prompt': PROMPT}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        if response.status_code not in (202, 403):
+            raise AssertionError(f"HTTP {response.status_code}")
+        return response.status_code == 202
+
+    def test_parallel_reservations(self):
+        outcomes, errors = self.fire(self.reserve)
+
+        granted = outcomes.count(True)
+        self.assertLessEqual(granted, self.allowance)
+        available, held, charged = self.accounted()
+        self.assertGreaterEqual(available, 0)
+        self.assertEqual((available, held, charged), (self.allowance - granted, granted, 0))
+        self.assertEqual(errors, [])
+        self.assertEqual(granted, self.allowance)
+
+        # Failing every pending site gives all of its reservations back
+        quota.release(self.user.id, list(GeneratedSite.objects.filter(user=self.user).exclude(quota_hold='')))
+        self.assertEqual(self.accounted(), (self.allowance, 0, 0))
+
+    def test_parallel_generate_requests(self):
+        outcomes, errors = self.fire(self.generate)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(outcomes.count(True), self.allowance)
+        # Every granted job is delivered and charged; none lost to a locked database
+        sites = GeneratedSite.objects.filter(user=self.user)
+        self.assertEqual(list(sites.values_list('status', flat=True)), ['completed'] * self.allowance)
+        self.assertEqual(self.accounted(), (0, 0, self.allowance))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, OPENAI_API_KEY=None, GENERATION_STALE_AFTER=360, GENERATION_QUEUE_TIMEOUT=3600)
+class LostGenerationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('unlucky', 'unlucky@example.com')
+        UserProfile.objects.filter(user=self.user).update(free_websites_remaining=10)
+        self.user = User.objects.get(pk=self.user.pk)
+        self.before = self.remaining()
+
+    def remaining(self):
+        return UserProfile.objects.get(user=self.user).free_websites_remaining
+
+    def pending_site(self, created_ago=0, started_ago=None, **fields):
+        hold = quota.reserve(self.user)
+        site = GeneratedSite.objects.create(user=self.user, prompt=PROMPT, quota_hold=hold, **fields)
+        now = timezone.now()
+        GeneratedSite.objects.filter(pk=site.pk).update(
+            created_at=now - timedelta(seconds=created_ago),
+            started_at=None if started_ago is None else now - timedelta(seconds=started_ago),
+        )
+        return site
+
+    def test_soft_time_limit_fails_site_and_releases_quota(self):
+        site = self.pending_site()
+
+        with mock.patch('generator.tasks.generate_website_code', side_effect=SoftTimeLimitExceeded()):
+            run_generation(site.id)
+
+        site.refresh_from_db()
+        self.assertEqual(site.status, 'failed')
+        self.assertIsNotNone(site.started_at)
+        self.assertEqual(site.quota_hold, '')
+        self.assertEqual(self.remaining(), self.before)
+
+    def test_sweeps_sites_whose_worker_died_or_never_came(self):
+        killed = self.pending_site(created_ago=400, started_ago=390)
+        lost_in_queue = self.pending_site(created_ago=4000)
+        running = self.pending_site(created_ago=400, started_ago=60)
+        queued = self.pending_site(created_ago=600)
+        self.assertEqual(self.remaining(), self.before - 4)
+
+        self.assertEqual(fail_stale_generations(), 2)
+
+        statuses = dict(GeneratedSite.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[killed.id], 'failed')
+        self.assertEqual(statuses[lost_in_queue.id], 'failed')
+        self.assertEqual(statuses[running.id], 'pending')
+        self.assertEqual(statuses[queued.id], 'pending')
+        self.assertEqual(self.remaining(), self.before - 2)
+        # Refunds happen once
+        self.assertEqual(fail_stale_generations(), 0)
+        self.assertEqual(self.remaining(), self.before - 2)
+
+    def test_settles_batch_of_swept_sites(self):
+        batch = GenerationBatch.objects.create(user=self.user, total_items=2)
+        GeneratedSite.objects.create(user=self.user, prompt=PROMPT, batch=batch, status='completed')
+        self.pending_site(created_ago=400, started_ago=390, batch=batch)
+
+        fail_stale_generations()
+
+        batch.refresh_from_db()
+        self.assertEqual(batch.status, 'completed')
+        self.assertIsNotNone(batch.completed_at)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, OPENAI_API_KEY=None)
+class GenerateApiTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('queuer', 'queuer@example.com')
+        self.client.force_login(self.user)
+        self.before = UserProfile.objects.get(user=self.user).free_websites_remaining
+
+    def post(self, **headers):
+        return self.client.post('/api/generate/', {'prompt': PROMPT}, HTTP_X_REQUESTED_WITH='XMLHttpRequest', **headers)
+
+    def test_queues_job_and_answers_202(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.post()
+
+        self.assertEqual(response.status_code, 202)
+        site = GeneratedSite.objects.get()
+        self.assertEqual(response.json(), {
+            'job_id': site.id,
+            'site_id': site.id,
+            'status': 'pending',
+            'status_url': f'/api/jobs/{site.id}/',
+        })
+        self.assertEqual(site.quota_hold, 'free')
+        self.assertEqual(len(callbacks), 1)  # run_generation is only enqueued once the site is committed
+
+    def test_job_payload_once_completed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post()
+        site = GeneratedSite.objects.get()
+
+        payload = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(payload['status'], 'completed')
+        self.assertEqual(payload['download_url'], f'/download/{site.id}/')
+        self.assertEqual(payload['redirect_url'], f'/generation-result/{site.id}/')
+        self.assertIn('generation_time', payload)
+        self.assertEqual(GeneratedSite.objects.get().quota_hold, '')
+        self.assertEqual(UserProfile.objects.get(user=self.user).websites_generated, 1)
+
+    def test_failed_job_releases_quota(self):
+        with mock.patch('generator.tasks.generate_website_code', side_effect=ai_service.GenerationError('boom')):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.post()
+
+        payload = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(payload['status'], 'failed')
+        self.assertEqual(payload['error'], 'Generation failed. Please try again.')
+        self.assertNotIn('download_url', payload)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.free_websites_remaining, self.before)
+        self.assertEqual(profile.websites_generated, 0)
+        self.assertEqual(
+            list(UsageEvent.objects.order_by('id').values_list('kind', flat=True)), ['reserve', 'release'],
+        )
+
+    def test_form_post_redirects_to_result_page(self):
+        response = self.client.post('/api/generate/', {'prompt': PROMPT})
+        site = GeneratedSite.objects.get()
+        self.assertRedirects(response, f'/generation-result/{site.id}/', fetch_redirect_response=False)
+
+    def test_status_is_private_to_the_owner(self):
+        with self.captureOnCommitCallbacks():
+            status_url = self.post().json()['status_url']
+        self.client.force_login(User.objects.create_user('other', 'other@example.com'))
+        self.assertEqual(self.client.get(status_url).status_code, 404)
+
+
+class OpenAIClientTests(FakeOpenAIMixin, SimpleTestCase):
+    openai_settings = {
+        'OPENAI_TIMEOUT': 0.5,
+        'OPENAI_DEADLINE': 5,
+        'OPENAI_MAX_RETRIES': 2,
+        'OPENAI_BREAKER_THRESHOLD': 2,
+        'OPENAI_BREAKER_COOLDOWN': 30,
+    }
+
+    def complete(self):
+        return self.manager.chat_completion(model='fake', messages=[{'role': 'user', 'content': PROMPT}])
+
+    def stream(self):
+        return self.manager.stream_chat_completion(model='fake', messages=[{'role': 'user', 'content': PROMPT}])
+
+    def capture_streams(self):
+        """The SDK streams opened through the manager, to check they get closed"""
+        streams = []
+        create = self.manager.client.chat.completions.create
+
+        def spy(*args, **kwargs):
+            streams.append(create(*args, **kwargs))
+            return streams[-1]
+        patcher = mock.patch.object(self.manager.client.chat.completions, 'create', spy)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return streams
+
+    def test_retries_server_errors(self):
+        self.openai.inject({'status': 500})
+
+        response = self.complete()
+
+        self.assertEqual(response.choices[0].message.content, FAKE_HTML)
+        self.assertEqual(len(self.openai.requests), 2)
+        metrics = self.manager.metrics.snapshot()
+        self.assertEqual((metrics['retries'], metrics['successes'], metrics['failures']), (1, 1, 0))
+
+    def test_slow_upstream_times_out(self):
+        self.manager.max_retries = 0
+        self.openai.inject({'delay': 1})
+
+        with self.assertRaises(openai.APITimeoutError):
+            self.complete()
+
+        metrics = self.manager.metrics.snapshot()
+        self.assertEqual(metrics['failures'], 1)
+        self.assertLess(metrics['latency_max_ms'], 1000)
+
+    def test_breaker_opens_after_repeated_failures(self):
+        self.manager.max_retries = 0
+        self.openai.inject({'status': 503}, {'status': 503})
+        for _ in range(2):
+            with self.assertRaises(openai.InternalServerError):
+                self.complete()
+
+        with self.assertRaises(openai_client.CircuitOpenError):
+            self.complete()
+
+        self.assertEqual(len(self.openai.requests), 2)
+        self.assertEqual(self.manager.breaker.state, 'open')
+        self.assertEqual(self.manager.metrics.snapshot()['rejected_by_breaker'], 1)
+
+    def test_stream_success_closes_response(self):
+        streams = self.capture_streams()
+
+        chunks = list(self.stream())
+
+        self.assertEqual(''.join(c.choices[0].delta.content or '' for c in chunks if c.choices), FAKE_HTML)
+        self.assertTrue(streams[0].response.is_closed)
+        self.assertEqual(self.manager.metrics.snapshot()['successes'], 1)
+
+    def test_stream_hang_up_counts_against_breaker(self):
+        streams = self.capture_streams()
+        self.openai.inject({'drop_after': 2})
+
+        with self.assertRaises(httpx.RemoteProtocolError):
+            list(self.stream())
+
+        self.assertTrue(streams[0].response.is_closed)
+        metrics = self.manager.metrics.snapshot()
+        self.assertEqual((metrics['failures'], metrics['errors']), (1, {'RemoteProtocolError': 1}))
+        self.assertEqual(self.manager.breaker._failures, 1)
+
+    def test_stream_stall_times_out(self):
+        self.openai.inject({'chunk_delay': 1})
+
+        with self.assertRaises(httpx.ReadTimeout):
+            list(self.stream())
+
+        self.assertEqual(self.manager.metrics.snapshot()['errors'], {'ReadTimeout': 1})
+        self.assertEqual(self.manager.breaker._failures, 1)
+
+    def test_stream_deadline_covers_iteration(self):
+        # Every chunk arrives within the read timeout, the whole stream doesn't
+        self.manager.deadline = 0.5
+        self.openai.inject({'chunk_delay': 0.2})
+        streams = self.capture_streams()
+
+        with self.assertRaises(openai_client.DeadlineExceeded):
+            list(self.stream())
+
+        self.assertTrue(streams[0].response.is_closed)
+        self.assertEqual(self.manager.breaker._failures, 1)
+
+    def test_abandoned_stream_is_closed_without_failure(self):
+        streams = self.capture_streams()
+
+        stream = self.stream()
+        next(stream)
+        stream.close()
+
+        self.assertTrue(streams[0].response.is_closed)
+        metrics = self.manager.metrics.snapshot()
+        self.assertEqual((metrics['successes'], metrics['failures']), (0, 0))
+
+
+    def open_breaker(self):
+        self.manager.breaker.record_failure()
+        self.manager.breaker.record_failure()
+        # Cooldown over: the next caller is the probe
+        self.manager.breaker._opened_at -= self.manager.breaker.cooldown
+        self.assertEqual(self.manager.breaker.state, 'half-open')
+
+    def test_half_open_lets_one_probe_through(self):
+        self.open_breaker()
+        self.openai.inject({'delay': 0.3})
+        outcomes = []
+
+        def call():
+            try:
+                self.complete()
+                outcomes.append('ok')
+            except openai_client.CircuitOpenError:
+                outcomes.append('rejected')
+        threads = [threading.Thread(target=call) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes), ['ok'] + ['rejected'] * 4)
+        self.assertEqual(len(self.openai.requests), 1)
+        self.assertEqual(self.manager.breaker.state, 'closed')
+
+    def test_failed_probe_reopens(self):
+        self.open_breaker()
+        self.openai.inject({'status': 503})
+
+        with self.assertRaises(openai.InternalServerError):
+            self.complete()
+
+        self.assertEqual(len(self.openai.requests), 1)  # The probe is not retried past the breaker
+        self.assertEqual(self.manager.breaker.state, 'open')
+        with self.assertRaises(openai_client.CircuitOpenError):
+            self.complete()
+
+    def test_probe_without_upstream_verdict_is_released(self):
+        self.open_breaker()
+        self.openai.inject({'status': 400})
+        with self.assertRaises(openai.BadRequestError):
+            self.complete()
+        self.assertEqual(self.manager.breaker.allow(), 'probe')
+        self.manager.breaker.release()
+
+        stream = self.stream()
+        next(stream)
+        stream.close()
+        self.assertEqual(self.manager.breaker.allow(), 'probe')
+
+    def test_metrics_are_printed_periodically(self):
+        self.manager.metrics.log_interval = 60
+        with mock.patch('builtins.print') as printed:
+            self.complete()
+            self.assertFalse(printed.called)
+            with mock.patch('time.monotonic', return_value=time.monotonic() + 61):
+                self.complete()
+
+        printed.assert_called_once()
+        self.assertIn("'calls': 2", printed.call_args[0][0])
+
+    def test_exhausted_retries_serve_the_fallback_website(self):
+        self.manager.max_retries = 1
+        self.openai.inject({'status': 503}, {'status': 503})
+
+        artifact = ai_service.generate_openai_website(PROMPT)
+
+        self.assertEqual(len(self.openai.requests), 2)
+        self.assertEqual(artifact.kind, 'html')
+        self.assertNotIn('Fake coffee', artifact.source_code)
+        self.assertIn('<html', artifact.source_code)
+
+    def test_stream_that_cannot_open_serves_the_fallback_website(self):
+        self.manager.max_retries = 0
+        self.openai.inject({'status': 503})
+
+        chunks = []
+        stream = ai_service.stream_openai_website(PROMPT)
+        with self.assertRaises(StopIteration) as done:
+            while True:
+                chunks.append(next(stream))
+
+        self.assertEqual(chunks, [done.exception.value])
+        self.assertNotIn('Fake coffee', done.exception.value)
+
+    def test_stream_failing_after_tokens_is_an_error(self):
+        self.openai.inject({'drop_after': 2})
+
+        with self.assertRaises(ai_service.GenerationError):
+            list(ai_service.stream_openai_website(PROMPT))
+
+class SiteListQueryPlanTests(TestCase):
+    """The dashboard list queries read the composite indexes, in order"""
+
+    @classmethod
+    def setUpClass(cls):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise unittest.SkipTest(f"No expected plans for {connection.vendor}")
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        # One heavy account among many light ones: the lists must not sort all of its sites
+        users = [User.objects.create_user(f'lister{i}', f'lister{i}@example.com') for i in range(50)]
+        statuses = ['completed', 'completed', 'completed', 'failed', 'pending']
+        GeneratedSite.objects.bulk_create(
+            GeneratedSite(user=user, prompt=PROMPT, status=statuses[n % len(statuses)])
+            for index, user in enumerate(users) for n in range(2000 if index == 0 else 20)
+        )
+        cls.user = users[0]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def plan(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Even seeded, the table is small enough that a scan would win
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, index, ordered=False):
+        plan = self.plan(queryset)
+        self.assertIn(index, plan)
+        if ordered:
+            # The index gives the (created_at, id) order; nothing is sorted afterwards
+            self.assertNotIn('TEMP B-TREE', plan)
+            self.assertNotRegex(plan, r'\bSort\b')
+
+    def test_dashboard_list(self):
+        sites = GeneratedSite.objects.filter(user=self.user).only('id', 'user', 'status', 'created_at')
+        self.assertUsesIndex(sites[:12], 'gensite_user_created_id_idx')
+
+    def test_dashboard_list_filtered_by_status(self):
+        sites = GeneratedSite.objects.filter(user=self.user, status='completed').only('id', 'user', 'status', 'created_at')
+        self.assertUsesIndex(sites[:12], 'gensite_user_status_id_idx')
+
+    def test_later_page(self):
+        sites = seek(GeneratedSite.objects.filter(user=self.user), (timezone.now(), 1))
+        self.assertUsesIndex(sites[:13], 'gensite_user_created_id_idx', ordered=True)
+
+    def test_later_page_filtered_by_status(self):
+        sites = seek(GeneratedSite.objects.filter(user=self.user, status='completed'), (timezone.now(), 1))
+        self.assertUsesIndex(sites[:13], 'gensite_user_status_id_idx', ordered=True)
+
+
+class SearchTests(TestCase):
+    """Prompt search on the backend's full-text index (migration 0012)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('searcher', 'searcher@example.com')
+        cls.other = User.objects.create_user('other', 'other@example.com')
+        cls.wedding = GeneratedSite.objects.create(user=cls.user, prompt='A wedding photography portfolio')
+        cls.bakery = GeneratedSite.objects.create(user=cls.user, prompt='A bakery with an online order form')
+        cls.weddings = GeneratedSite.objects.create(
+            user=cls.user, prompt='Wedding planner: weddings, wedding venues and wedding photography packages',
+        )
+        GeneratedSite.objects.create(user=cls.other, prompt='Wedding photography for another account')
+
+    def search(self, query, **kwargs):
+        return list(search.search_sites(GeneratedSite.objects.filter(user=self.user), query, **kwargs))
+
+    def test_backend_uses_the_full_text_index(self):
+        expected = {'postgresql': 'postgresql', 'sqlite': 'fts5'}.get(connection.vendor, 'icontains')
+        self.assertEqual(search.backend(), expected)
+
+    def test_every_term_must_match(self):
+        self.assertEqual(set(self.search('wedding photography')), {self.wedding, self.weddings})
+        self.assertEqual(self.search('bakery'), [self.bakery])
+        self.assertEqual(self.search('bakery wedding'), [])
+
+    def test_best_match_first(self):
+        self.assertEqual(self.search('wedding'), [self.weddings, self.wedding])
+
+    def test_unranked(self):
+        self.assertEqual(set(self.search('photography', ranked=False)), {self.wedding, self.weddings})
+
+    def test_blank_query_is_no_filter(self):
+        self.assertEqual(len(self.search('  ')), 3)
+
+    def test_index_follows_prompt_changes(self):
+        GeneratedSite.objects.filter(pk=self.bakery.pk).update(prompt='A gym with class booking')
+        self.wedding.delete()
+
+        self.assertEqual(self.search('bakery'), [])
+        self.assertEqual(self.search('gym'), [self.bakery])
+        self.assertEqual(self.search('portfolio'), [])
+
+    def test_admin_search_matches_prompt_or_username(self):
+        sites = GeneratedSite.objects.all()
+        self.assertEqual(search.search_admin_sites(sites, 'bakery').count(), 1)
+        self.assertEqual(search.search_admin_sites(sites, 'other').count(), 1)
+        self.assertEqual(search.search_admin_sites(sites, 'photography').count(), 3)
+
+    def test_dashboard_and_admin_search(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/dashboard/', {'search': 'bakery'})
+        self.assertEqual([site.pk for site in response.context['sites']], [self.bakery.pk])
+        self.assertEqual(response.context['total_sites'], 1)
+
+        admin = User.objects.create_superuser('admin', 'admin@example.com', None)
+        self.client.force_login(admin)
+        response = self.client.get('/admin/generator/generatedsite/', {'q': 'wedding'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'FTS5 query syntax')
+    def test_fts5_last_term_is_a_prefix_and_input_is_quoted(self):
+        self.assertEqual(self.search('bak'), [self.bakery])
+        self.assertEqual(self.search('bakery" NEAR('), [])
+        self.assertEqual(self.search('(bakery"'), [self.bakery])
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'tsvector stemming')
+    def test_postgresql_stems_and_reads_the_gin_index(self):
+        self.assertEqual(self.search('weddings portfolios'), [self.wedding])
+        self.assertEqual(self.search('bakery -order'), [])  # websearch syntax
+
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = search.search_sites(GeneratedSite.objects.all(), 'wedding').explain()
+        self.assertIn('gensite_search_vector_gin', plan)
+
+
+class BenchSearchCommandTests(TestCase):
+
+    def test_refuses_a_database_with_accounts(self):
+        User.objects.create_user('customer', 'customer@example.com')
+
+        with self.assertRaisesMessage(CommandError, 'scratch database'):
+            call_command('bench_search', rows=10, stdout=io.StringIO())
+        self.assertFalse(GeneratedSite.objects.exists())
+
+    def test_runs_on_an_empty_database(self):
+        out = io.StringIO()
+        call_command('bench_search', rows=50, repeat=1, cleanup=True, stdout=out)
+
+        self.assertIn('wedding photography', out.getvalue())
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(GeneratedSite.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, GENERATION_CACHE_ENABLED=True, SITE_ARCHIVE_MODE='file')
+class GenerationCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('cached', 'cached@example.com')
+
+    def generate(self, prompt):
+        site = GeneratedSite.objects.create(user=self.user, prompt=prompt)
+        run_generation(site.id)
+        site.refresh_from_db()
+        self.assertEqual(site.status, 'completed')
+        return site
+
+    def test_counters_are_shared_between_processes(self):
+        first = self.generate(PROMPT)
+        cache.clear()  # Another worker, or a restart, with a cache of its own
+        second = self.generate(f"  {PROMPT}. ")
+
+        self.assertEqual(second.generated_file.name, first.generated_file.name)
+        entry = GenerationCacheEntry.objects.get()
+        self.assertEqual((entry.hit_count, entry.miss_count), (1, 1))
+        stats = generation_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate'], stats['entries']), (1, 1, 0.5, 1))
+
+        out = io.StringIO()
+        call_command('generation_cache_stats', stdout=out)
+        self.assertIn('Hit rate:       50.00%', out.getvalue())
+
+    def test_render_after_expiry_counts_another_miss(self):
+        self.generate(PROMPT)
+        GenerationCacheEntry.objects.update(created_at=timezone.now() - timedelta(days=8))
+
+        self.generate(PROMPT)
+
+        entry = GenerationCacheEntry.objects.get()
+        self.assertEqual((entry.hit_count, entry.miss_count), (0, 1))
+        self.assertEqual(generation_cache.stats()['misses'], 1)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, OPENAI_API_KEY=None)
+class BulkBatchTests(TestCase):
+    """A batch reserves once, then charges what it delivered and refunds the rest"""
+
+    prompts = [PROMPT, 'A CRM for a small design agency', 'A portfolio for a wedding photographer']
+
+    def setUp(self):
+        self.user = User.objects.create_user('bulk', 'bulk@example.com')
+        UserProfile.objects.filter(user=self.user).update(
+            subscription_plan='enterprise', subscription_expires=timezone.now() + timedelta(days=30),
+        )
+        self.client.force_login(self.user)
+
+    def run_batch(self, fail=(), **data):
+        deliver = tasks.deliver_artifact
+
+        def flaky(site, artifact):
+            if site.prompt in fail:
+                raise OSError('Disk full')
+            deliver(site, artifact)
+        with mock.patch.object(tasks, 'deliver_artifact', flaky), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/generate/bulk/', json.dumps({'prompts': self.prompts, **data}), content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 202)
+        return GenerationBatch.objects.get(pk=response.json()['batch_id'])
+
+    def usage(self):
+        period = UsagePeriod.objects.get(user=self.user)
+        return period.used, period.generated
+
+    def events(self):
+        return list(UsageEvent.objects.filter(user=self.user).order_by('id').values_list('kind', 'quantity'))
+
+    def test_charges_delivered_sites_and_refunds_failed_ones(self):
+        batch = self.run_batch(fail=[self.prompts[1]])
+
+        self.assertEqual(batch.status, 'completed')
+        statuses = dict(batch.sites.values_list('prompt', 'status'))
+        self.assertEqual(statuses[self.prompts[1]], 'failed')
+        self.assertEqual(list(statuses.values()).count('completed'), 2)
+        self.assertFalse(batch.sites.exclude(quota_hold='').exists())
+        # One reservation for the batch, one charge and one refund
+        self.assertEqual(self.events(), [('reserve', 3), ('commit', 2), ('release', 1)])
+        self.assertEqual(self.usage(), (2, 2))
+        self.assertEqual(UserProfile.objects.get(user=self.user).get_remaining_websites(), 999 - 2)
+
+    def test_fully_failed_batch_is_refunded(self):
+        batch = self.run_batch(fail=self.prompts)
+
+        self.assertEqual(batch.status, 'failed')
+        self.assertEqual(self.events(), [('reserve', 3), ('release', 3)])
+        self.assertEqual(self.usage(), (0, 0))
+
+    def test_combined_archive_holds_delivered_sites(self):
+        batch = self.run_batch(fail=[self.prompts[0]], combined_archive=True)
+
+        with zipfile.ZipFile(batch.archive.path) as archive:
+            names = archive.namelist()
+        delivered = batch.sites.filter(status='completed').values_list('id', flat=True)
+        self.assertEqual(sorted(names), sorted(f'website_{site_id}.zip' for site_id in delivered))
+
+    def test_redelivered_task_does_not_charge_twice(self):
+        batch = self.run_batch()
+        GenerationBatch.objects.filter(pk=batch.pk).update(status='pending')
+
+        tasks.run_batch(batch.id)
+
+        self.assertEqual(self.usage(), (3, 3))
+        self.assertEqual([kind for kind, quantity in self.events()], ['reserve', 'commit'])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, OPENAI_API_KEY=None)
+class CsrfTests(TransactionTestCase):
+    """The session-authenticated generation endpoints require a CSRF token"""
+
+    token = 'f' * 32
+
+    def setUp(self):
+        self.user = User.objects.create_user('csrf', 'csrf@example.com')
+        UserProfile.objects.filter(user=self.user).update(
+            subscription_plan='enterprise', subscription_expires=timezone.now() + timedelta(days=30),
+        )
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.user)
+
+    def post(self, path, data, with_token, **kwargs):
+        if with_token:
+            self.client.cookies['csrftoken'] = self.token
+            kwargs['HTTP_X_CSRFTOKEN'] = self.token
+        return self.client.post(path, data, **kwargs)
+
+    def bulk(self, with_token):
+        data = json.dumps({'prompts': [PROMPT, 'A CRM for a small design agency']})
+        return self.post('/api/generate/bulk/', data, with_token, content_type='application/json')
+
+    def test_bulk_without_token_is_rejected(self):
+        response = self.bulk(with_token=False)
+
+        self.assertEqual(response.status_code, 403)
+        self.assertIn(b'CSRF', response.content)
+        self.assertFalse(GenerationBatch.objects.exists())
+
+    def test_bulk_with_token(self):
+        response = self.bulk(with_token=True)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(GeneratedSite.objects.filter(status='completed').count(), 2)
+
+    def test_stream_without_token_is_rejected(self):
+        response = self.post('/api/generate/stream/', {'prompt': PROMPT}, with_token=False)
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(GeneratedSite.objects.exists())
+
+    def test_stream_with_token(self):
+        response = self.post('/api/generate/stream/', {'prompt': PROMPT}, with_token=True)
+        body = b''.join(response.streaming_content).decode()
+
+        self.assertIn('event: done\n', body)
+        self.assertEqual(GeneratedSite.objects.get().status, 'completed')
+
+
+@override_settings(PAGE_CACHE_ENABLED=True)
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_page_is_cached_by_path(self):
+        self.assertEqual(self.client.get('/faq/')['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get('/faq/')['X-Page-Cache'], 'hit')
+
+        with mock.patch.object(cache, 'set', wraps=cache.set) as stored:
+            for n in range(5):
+                self.assertEqual(self.client.get('/faq/', {'x': n})['X-Page-Cache'], 'hit')
+        stored.assert_not_called()
+
+    def test_logged_in_users_get_a_fresh_render(self):
+        self.client.get('/pricing/')
+        self.client.force_login(User.objects.create_user('member', 'member@example.com'))
+
+        response = self.client.get('/pricing/')
+
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'Logout')
+
+    def test_pending_messages_get_a_fresh_render(self):
+        self.client.get('/contact/')
+
+        response = self.client.post('/contact/', {'name': 'A', 'email': 'a@example.com', 'message': 'Hi'}, follow=True)
+
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'Thank you for contacting us!')
+        # Shown once, so the next visit is the shared copy again
+        self.assertEqual(self.client.get('/contact/')['X-Page-Cache'], 'hit')
+
+    def test_cached_form_carries_the_visitors_own_csrf_token(self):
+        Client().get('/contact/')
+
+        client = Client(enforce_csrf_checks=True)
+        response = client.get('/contact/')
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        content = response.content.decode()
+        self.assertNotIn('__csrf_token_placeholder__', content)
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', content).group(1)
+
+        response = client.post('/contact/', {'csrfmiddlewaretoken': token, 'name': 'A', 'message': 'Hi'})
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DownloadTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('fetch', 'fetch@example.com')
+        self.client.force_login(self.user)
+        self.site = GeneratedSite.objects.create(user=self.user, prompt=PROMPT, status='completed')
+        self.site.generated_file.save('download.zip', ContentFile(b'PK' + bytes(range(256)) * 4))
+        self.url = f'/download/{self.site.id}/'
+
+    def tearDown(self):
+        downloads.flush_download_counts()
+
+    def downloads_count(self):
+        return GeneratedSite.objects.get(id=self.site.id).downloads_count
+
+    @override_settings(SITE_DOWNLOAD_BACKEND='x-accel', SITE_DOWNLOAD_ACCEL_PREFIX='/protected-media/')
+    def test_x_accel_hands_the_file_to_nginx(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.site.generated_file.name)
+        self.assertEqual(response.content, b'')
+        self.assertIn(f'website_{self.site.id}.zip', response['Content-Disposition'])
+        self.assertEqual(self.downloads_count(), 1)
+
+    @override_settings(SITE_DOWNLOAD_BACKEND='x-sendfile')
+    def test_x_sendfile_hands_the_file_path_to_the_server(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response['X-Sendfile'], self.site.generated_file.path)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.downloads_count(), 1)
+
+    @override_settings(DOWNLOAD_COUNTER_MODE='buffered', DOWNLOAD_COUNTER_BATCH_SIZE=3)
+    def test_buffered_counts_are_written_per_batch(self):
+        for _ in range(2):
+            b''.join(self.client.get(self.url).streaming_content)
+        self.assertEqual(self.downloads_count(), 0)
+
+        b''.join(self.client.get(self.url).streaming_content)
+        self.assertEqual(self.downloads_count(), 3)
+        self.assertEqual(UserSiteStats.objects.get(user=self.user).total_downloads, 3)
+
+    @override_settings(DOWNLOAD_COUNTER_FLUSH_INTERVAL=0.05, DOWNLOAD_COUNTER_BATCH_SIZE=50)
+    def test_partial_batch_is_flushed_on_a_timer(self):
+        counter = downloads.BufferedDownloadCounter()
+        flushed = threading.Event()
+        with mock.patch.object(downloads, 'increment_download_counts', side_effect=lambda counts: flushed.set()) as write:
+            counter.add(self.site.id)
+            counter.add(self.site.id)
+            self.assertTrue(flushed.wait(5))
+
+        write.assert_called_once_with({self.site.id: 2})
+
+    def test_failed_flush_keeps_the_counts_for_the_next_one(self):
+        counter = downloads.BufferedDownloadCounter()
+        counter._pending[self.site.id] = 2
+        with mock.patch.object(downloads, 'increment_download_counts', side_effect=DatabaseError('connection lost')):
+            counter.flush()
+
+        counter.flush()
+
+        self.assertEqual(self.downloads_count(), 2)
+
+    def test_range_request_returns_the_requested_bytes(self):
+        content = self.site.generated_file.open('rb').read()
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-9')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), content[2:10])
+        self.assertEqual(response['Content-Range'], f'bytes 2-9/{len(content)}')
+        # Resuming a download does not count it again
+        self.assertEqual(self.downloads_count(), 0)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), content[-4:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(content)}')
+
+    def test_matching_etag_is_not_modified(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        b''.join(response.streaming_content)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.downloads_count(), 1)
+
+    @override_settings(SITE_ARCHIVE_MODE='stream')
+    def test_streamed_flask_archive_holds_the_files_as_delivered(self):
+        site = GeneratedSite.objects.create(user=self.user, prompt='A blog about cooking')
+        artifact = ai_service.build_flask_artifact(site.prompt)
+        ai_service.save_website_as_zip(site, artifact)
+
+        # A later template or classifier change must not alter the archive
+        with mock.patch.object(downloads, 'build_flask_artifact', side_effect=AssertionError('re-rendered')):
+            response = self.client.get(f'/download/{site.id}/')
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+        self.assertEqual(sorted(archive.namelist()), sorted(artifact.files))
+        for path, rendered in artifact.files.items():
+            self.assertEqual(archive.read(path), rendered.data)
+
+    @override_settings(SITE_ARCHIVE_MODE='stream')
+    def test_streamed_archive_of_an_older_site_is_rendered_from_the_prompt(self):
+        site = GeneratedSite.objects.create(user=self.user, prompt='A blog about cooking', status='completed')
+        artifact = ai_service.build_flask_artifact(site.prompt)
+        site.generated_code = artifact.summary()
+        site.save()
+
+        response = self.client.get(f'/download/{site.id}/')
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+        self.assertEqual(sorted(archive.namelist()), sorted(artifact.files))
+
+
+class ClassifierTests(SimpleTestCase):
+
+    def setUp(self):
+        classifier.clear_cache()
+
+    def test_default_project_name_follows_the_app_type(self):
+        self.assertEqual(classifier.classify('a blog about cooking').project_name, 'Blog Platform')
+        self.assertEqual(classifier.classify('somewhere to sell my products').project_name, 'E-Commerce Store')
+        self.assertEqual(classifier.classify('a todo tracker').project_name, 'Task Manager')
+        self.assertEqual(classifier.classify('a simple website').project_name, 'Flask Application')
+
+    def test_named_project_keeps_its_name(self):
+        result = classifier.classify('A CRM called "Lead Magnet"')
+
+        self.assertEqual(result.app_type, 'crm')
+        self.assertEqual(result.project_name, 'Lead Magnet')
+
+    def test_keywords_match_at_the_start_of_a_word_only(self):
+        self.assertEqual(classifier.classify('my shopping site').app_type, 'ecommerce')
+        self.assertEqual(classifier.classify('a happy place').business_type, 'business')
+        self.assertEqual(classifier.classify('a reshop page').app_type, 'general')
+
+    def test_most_hits_win_and_ties_keep_the_declared_order(self):
+        self.assertEqual(classifier.score('a blog with a shop, cart and products')['app_type'],
+                         {'blog': 1, 'ecommerce': 3})
+        self.assertEqual(classifier.classify('a blog with a shop, cart and products').app_type, 'ecommerce')
+        self.assertEqual(classifier.classify('a blog shop').app_type, 'ecommerce')
+
+    def test_results_are_cached_per_prompt(self):
+        first = classifier.classify('a gallery of my work')
+        with mock.patch.object(classifier, '_classify', side_effect=AssertionError('scanned again')):
+            self.assertIs(classifier.classify('a gallery of my work'), first)
+
+
+class GeneratedContentTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('lazy', 'lazy@example.com')
+        self.site = GeneratedSite.objects.create(user=self.user, prompt=PROMPT, status='completed')
+        self.site.generated_code = FAKE_HTML
+        self.site.save()
+
+    def test_body_is_stored_compressed_and_loaded_on_access(self):
+        content = GeneratedContent.objects.get(site=self.site)
+        self.assertEqual((content.compression, content.size), ('zlib', len(FAKE_HTML)))
+        self.assertEqual(content.text, FAKE_HTML)
+
+        with self.assertNumQueries(1):
+            site = GeneratedSite.objects.get(id=self.site.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(site.generated_code, FAKE_HTML)
+            self.assertEqual(site.generated_code, FAKE_HTML)
+
+    def test_status_saves_leave_the_body_alone(self):
+        site = GeneratedSite.objects.get(id=self.site.id)
+        site.status = 'failed'
+
+        with mock.patch.object(GeneratedContent, 'store') as store:
+            site.save()
+        store.assert_not_called()
+
+    def test_refresh_reloads_the_body_and_none_removes_it(self):
+        GeneratedContent.store(self.site.id, 'updated')
+        self.site.refresh_from_db()
+        self.assertEqual(self.site.generated_code, 'updated')
+
+        self.site.generated_code = None
+        self.site.save()
+
+        self.assertFalse(GeneratedContent.objects.filter(site=self.site).exists())
+        self.assertIsNone(GeneratedSite.objects.get(id=self.site.id).generated_code)
+
+
+class GeneratedContentMigrationTests(TransactionTestCase):
+    """0010 copies generated_code into GeneratedContent in id batches, and back"""
+
+    before = [('generator', '0009_generatedsite_list_indexes')]
+    after = [('generator', '0010_generatedcontent')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_bodies_are_moved_in_batches_and_restored(self):
+        latest = MigrationExecutor(connection).loader.graph.leaf_nodes('generator')
+        old_apps = self.migrate(self.before)
+        self.addCleanup(self.migrate, latest)
+        OldSite = old_apps.get_model('generator', 'GeneratedSite')
+        bodies = {OldSite.objects.create(prompt=f'site {n}', generated_code=f'<p>{n}</p>' * n).id: f'<p>{n}</p>' * n
+                  for n in range(1, 6)}
+        OldSite.objects.create(prompt='no body yet')
+
+        migration = importlib.import_module('generator.migrations.0010_generatedcontent')
+        # Five bodies over batches of two
+        with mock.patch.object(migration, 'BATCH_SIZE', 2):
+            new_apps = self.migrate(self.after)
+
+        Content = new_apps.get_model('generator', 'GeneratedContent')
+        contents = {content.site_id: content for content in Content.objects.all()}
+        self.assertEqual(set(contents), set(bodies))
+        for site_id, body in bodies.items():
+            self.assertEqual(zlib.decompress(bytes(contents[site_id].data)).decode(), body)
+            self.assertEqual(contents[site_id].size, len(body))
+
+        old_apps = self.migrate(self.before)
+        restored = dict(old_apps.get_model('generator', 'GeneratedSite').objects
+                        .filter(generated_code__isnull=False).values_list('id', 'generated_code'))
+        self.assertEqual(restored, bodies)
+
+
+class UserSiteStatsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('stats', 'stats@example.com')
+
+    def counters(self, user=None):
+        stats = UserSiteStats.objects.get(user=user or self.user)
+        return stats.total_sites, stats.completed_sites, stats.failed_sites, stats.total_downloads
+
+    def test_creates_status_changes_and_deletes_keep_counters_in_step(self):
+        first = GeneratedSite.objects.create(user=self.user, prompt=PROMPT)
+        second = GeneratedSite.objects.create(user=self.user, prompt=PROMPT)
+        self.assertEqual(self.counters(), (2, 0, 0, 0))
+
+        first.status = 'completed'
+        first.save()
+        second.status = 'failed'
+        second.save()
+        self.assertEqual(self.counters(), (2, 1, 1, 0))
+
+        # Saving again without a status change counts nothing twice
+        first.save()
+        first.delete()
+        self.assertEqual(self.counters(), (1, 0, 1, 0))
+        self.assertEqual(UserSiteStats.objects.get(user=self.user).count_for_status('pending'), 0)
+
+    def test_moving_a_site_moves_its_counts(self):
+        other = User.objects.create_user('other', 'other@example.com')
+        site = GeneratedSite.objects.create(user=self.user, prompt=PROMPT, status='completed')
+
+        site.user = other
+        site.save()
+
+        self.assertEqual(self.counters(), (0, 0, 0, 0))
+        self.assertEqual(self.counters(other), (1, 1, 0, 0))
+
+    def test_partial_rows_do_not_touch_the_counters(self):
+        site = GeneratedSite.objects.create(user=self.user, prompt=PROMPT)
+        partial = GeneratedSite.objects.only('id', 'generation_time').get(id=site.id)
+
+        with self.assertNumQueries(3):  # savepoint, update, release
+            partial.generation_time = 1.5
+            partial.save(update_fields=['generation_time'])
+
+        self.assertEqual(self.counters(), (1, 0, 0, 0))
+
+    def test_missing_row_is_computed_from_the_sites(self):
+        site = GeneratedSite.objects.create(user=self.user, prompt=PROMPT, status='completed', downloads_count=4)
+        UserSiteStats.objects.filter(user=self.user).delete()
+
+        # As downloads do: bump the site, then record the delta for its owner
+        GeneratedSite.objects.filter(id=site.id).update(downloads_count=F('downloads_count') + 1)
+        UserSiteStats.apply(self.user.id, total_downloads=1)
+
+        # The computed totals already include that download, so it is not added twice
+        self.assertEqual(self.counters(), (1, 1, 0, 5))
+
+    def test_rebuild_command_repairs_drift(self):
+        GeneratedSite.objects.create(user=self.user, prompt=PROMPT, status='completed')
+        GeneratedSite.objects.create(user=self.user, prompt=PROMPT, status='failed')
+        UserSiteStats.objects.filter(user=self.user).update(total_sites=10, completed_sites=0)
+
+        out = io.StringIO()
+        call_command('rebuild_site_stats', stdout=out)
+
+        self.assertEqual(self.counters(), (2, 1, 1, 0))
+        self.assertIn('Rebuilt site stats for 1 users', out.getvalue())
+
+    def test_dashboard_reads_the_counters(self):
+        GeneratedSite.objects.create(user=self.user, prompt=PROMPT, status='completed')
+        UserSiteStats.objects.filter(user=self.user).update(completed_sites=7)
+        self.client.force_login(self.user)
+
+        response = self.client.get('/dashboard/')
+
+        self.assertEqual(response.context['completed_sites'], 7)
+
+
+class CountersTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('counted', 'counted@example.com')
+
+    def cached(self):
+        return cache.get(counters.counter_key('completed_sites'))
+
+    def test_miss_is_recomputed_once_then_read_from_the_cache(self):
+        GeneratedSite.objects.create(user=self.user, prompt=PROMPT, status='completed')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(counters.get('completed_sites'), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(counters.get('completed_sites'), 1)
+            self.client.get('/about/')
+
+    def test_signals_adjust_the_counter_after_commit(self):
+        counters.recompute_all()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            done = GeneratedSite.objects.create(user=self.user, prompt=PROMPT, status='completed')
+            pending = GeneratedSite.objects.create(user=self.user, prompt=PROMPT)
+        self.assertEqual(self.cached(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pending.status = 'completed'
+            pending.save()
+            done.status = 'failed'
+            done.save()
+            pending.save()
+        self.assertEqual(self.cached(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pending.delete()
+        self.assertEqual(self.cached(), 0)
+
+    def test_rolled_back_changes_are_not_counted(self):
+        counters.recompute_all()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                GeneratedSite.objects.create(user=self.user, prompt=PROMPT, status='completed')
+                raise DatabaseError('rolled back')
+
+        self.assertEqual(self.cached(), 0)
+
+    def test_refresh_task_repairs_drift(self):
+        GeneratedSite.objects.create(user=self.user, prompt=PROMPT, status='completed')
+        cache.set(counters.counter_key('completed_sites'), 42)
+
+        tasks.refresh_counters()
+
+        self.assertEqual(self.cached(), 1)
+
+    def test_suggestion_changes_clear_the_cached_fragment(self):
+        suggestion = Suggestion.objects.create(name='A', email='a@example.com', title='Dark mode',
+                                               description='Please')
+        self.assertNotContains(self.client.get('/suggestions/'), 'Dark mode')
+
+        suggestion.status = 'implemented'
+        suggestion.save()
+
+        self.assertContains(self.client.get('/suggestions/'), 'Dark mode')
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pager', 'pager@example.com')
+        sites = [GeneratedSite.objects.create(user=cls.user, prompt=f'Site {n}') for n in range(7)]
+        # Five sites share one timestamp, so only the id orders them
+        tie = timezone.now() - timedelta(hours=1)
+        GeneratedSite.objects.filter(id__in=[site.id for site in sites[1:6]]).update(created_at=tie)
+        GeneratedSite.objects.filter(id=sites[0].id).update(created_at=tie - timedelta(hours=1))
+        cls.expected = list(GeneratedSite.objects.filter(user=cls.user).order_by('-created_at', '-id')
+                            .values_list('id', flat=True))
+
+    def sites(self):
+        return GeneratedSite.objects.filter(user=self.user)
+
+    def test_pages_walk_through_ties_without_gaps_or_repeats(self):
+        pages, page = [], paginate(self.sites(), per_page=2)
+        while True:
+            pages.append([site.id for site in page])
+            if not page.has_next:
+                break
+            page = paginate(self.sites(), after=page.next_cursor, per_page=2)
+
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual([len(ids) for ids in pages], [2, 2, 2, 1])
+
+        # And back again from the last page
+        backwards = []
+        while page.has_previous:
+            page = paginate(self.sites(), before=page.previous_cursor, per_page=2)
+            backwards.insert(0, [site.id for site in page])
+        self.assertEqual(backwards, pages[:-1])
+
+    def test_exactly_one_full_page_has_no_next_cursor(self):
+        page = paginate(self.sites(), per_page=7)
+
+        self.assertEqual([site.id for site in page], self.expected)
+        self.assertFalse(page.has_next)
+        self.assertFalse(page.has_previous)
+
+    def test_invalid_cursor_starts_from_the_first_page(self):
+        malformed = [base64.urlsafe_b64encode(raw).decode('ascii') for raw in (b'2026-01-01|x', b'yesterday|3', b'\xff')]
+        for cursor in ['not-a-cursor', '!!!'] + malformed:
+            page = paginate(self.sites(), after=cursor, per_page=3)
+            self.assertEqual([site.id for site in page], self.expected[:3], cursor)
+            self.assertFalse(page.has_previous)
+
+    def test_sites_api_pages_by_cursor(self):
+        self.client.force_login(self.user)
+
+        first = self.client.get('/api/sites/', {'per_page': 4}).json()
+        second = self.client.get('/api/sites/', {'per_page': 4, 'after': first['next_cursor']}).json()
+
+        self.assertEqual([item['site_id'] for item in first['items'] + second['items']], self.expected)
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(first['approximate_total'], 7)
+        self.assertEqual(self.client.get('/api/sites/', {'per_page': 'many'}).status_code, 400)
+
+    def test_dashboard_search_counts_matches_once(self):
+        self.client.force_login(self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/dashboard/', {'search': 'site'})
+
+        self.assertEqual(response.context['total_sites'], 7)
+        self.assertEqual(len(response.context['sites']), 7)
+        self.assertEqual(sum('COUNT(' in query['sql'].upper() for query in queries.captured_queries), 1)
+
+
+class ProfileQuotaTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('member', 'member@example.com')
+
+    def make_request(self, user=None):
+        request = RequestFactory().get('/')
+        request.user = user or User.objects.get(id=self.user.id)
+        ProfileMiddleware(lambda request: None)(request)
+        return request
+
+    def subscribe(self, plan):
+        UserProfile.objects.filter(user=self.user).update(
+            subscription_plan=plan, subscription_expires=timezone.now() + timedelta(days=30),
+        )
+
+    def test_profile_and_quota_load_only_when_used(self):
+        user = User.objects.get(id=self.user.id)
+        with self.assertNumQueries(0):
+            request = self.make_request(user)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(request.profile.subscription_plan, 'free')
+            # The quota reuses the profile the view already loaded
+            self.assertEqual(dict(request.quota), {'plan': 'free', 'can_generate': True, 'remaining': 2,
+                                                   'subscription_active': False})
+
+    def test_account_without_a_profile_gets_one(self):
+        UserProfile.objects.filter(user=self.user).delete()
+
+        self.assertEqual(self.make_request().profile.user_id, self.user.id)
+        self.assertTrue(UserProfile.objects.filter(user=self.user).exists())
+
+    @override_settings(QUOTA_CACHE_TIMEOUT=60)
+    def test_cached_quota_is_invalidated_by_profile_and_quota_changes(self):
+        self.assertTrue(self.make_request().quota['can_generate'])
+        request = self.make_request()
+        with self.assertNumQueries(0):
+            self.assertTrue(request.quota['can_generate'])
+
+        quota.reserve(User.objects.get(id=self.user.id), 2)
+        self.assertFalse(self.make_request().quota['can_generate'])
+
+        profile = UserProfile.objects.get(user=self.user)
+        profile.free_websites_remaining = 3
+        profile.save()
+        self.assertEqual(self.make_request().quota['remaining'], 3)
+
+    def test_reading_a_paid_quota_writes_nothing(self):
+        self.subscribe('basic')
+
+        with CaptureQueriesContext(connection) as queries:
+            state = self.make_request().quota
+
+        self.assertEqual((state['plan'], state['remaining'], state['can_generate']), ('basic', 10, True))
+        self.assertEqual([q['sql'] for q in queries.captured_queries if not q['sql'].startswith('SELECT')], [])
+        self.assertFalse(UsagePeriod.objects.exists())
+
+    def test_plan_change_is_read_without_rewriting_the_period(self):
+        self.subscribe('basic')
+        quota.reserve(User.objects.get(id=self.user.id), 4)
+        self.subscribe('premium')
+
+        self.assertEqual(self.make_request().quota['remaining'], 46)
+        self.assertEqual(UsagePeriod.objects.get(user=self.user).plan, 'basic')
+
+
+class TemplateRegistryTests(SimpleTestCase):
+
+    def test_registry_output_matches_a_full_render(self):
+        for app_type in ('ecommerce', 'blog', 'general'):
+            shared = template_registry.render_project(PROMPT, 'Bean There', app_type)
+            fresh = template_registry.render_project(PROMPT, 'Bean There', app_type, use_registry=False)
+
+            self.assertEqual(list(shared), [path for path, scope, renderer in template_registry.PROJECT_LAYOUT])
+            self.assertEqual({path: f.text for path, f in shared.items()},
+                             {path: f.text for path, f in fresh.items()}, app_type)
+
+    def test_shared_files_are_rendered_once(self):
+        first = template_registry.render_project('A blog about cooking', 'Cook Book', 'blog')
+        second = template_registry.render_project('A blog about travel', 'Road Notes', 'blog')
+
+        self.assertIs(first['config.py'], second['config.py'])
+        self.assertIs(first['models.py'], second['models.py'])
+        self.assertIsNot(first['models.py'], template_registry.render_project(PROMPT, 'Shop', 'ecommerce')['models.py'])
+        self.assertNotEqual(first['README.md'].text, second['README.md'].text)
+        with self.assertRaises(ValueError):
+            template_registry.shared_file('app.py')
+
+    def test_pre_deflated_blobs_make_a_valid_zip(self):
+        files = template_registry.render_project(PROMPT, 'Bean There', 'ecommerce')
+        for rendered in files.values():
+            self.assertEqual(zlib.decompress(rendered.deflated, -zlib.MAX_WBITS), rendered.data)
+            self.assertEqual(zlib.crc32(rendered.data), rendered.crc32)
+
+        data = b''.join(iter_zip(list(files.items())))
+        self.assertEqual(len(data), zip_size(list(files.items())))
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.read('config.py'), files['config.py'].data)
@@ -11,6 +11,12 @@ urlpatterns = [
     
     # API endpoints
     path('api/generate/', views.generate_api, name='generate_api'),
+    path('api/generate/stream/', views.generate_stream, name='generate_stream'),
+    path('api/jobs/<int:site_id>/', views.generation_status, name='generation_status'),
+    path('api/sites/', views.sites_api, name='sites_api'),
+    path('api/generate/bulk/', views.generate_bulk_api, name='generate_bulk_api'),
+    path('api/batches/<int:batch_id>/', views.batch_status, name='batch_status'),
+    path('api/batches/<int:batch_id>/download/', views.download_batch, name='download_batch'),
     path('download/<int:site_id>/', views.download_site, name='download_site'),
     path('delete/<int:site_id>/', views.delete_site, name='delete_site'),
     
@@ -20,6 +26,7 @@ urlpatterns = [
     path('suggestions/', views.suggestion_box, name='suggestion'),
     path('pricing/', views.pricing, name='pricing'),
     path('subscription-plans/', views.pricing, name='subscription_plans'),
+    path('payment/qr/<str:transaction_id>.<str:fmt>', views.payment_qr, name='payment_qr'),
     path('payment/<str:plan>/', views.payment_page, name='payment_page'),
     path('payment-success/', views.payment_success, name='payment_success'),
     path('terms/', views.terms_conditions, name='terms_conditions'),
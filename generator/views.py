@@ -1,19 +1,36 @@
 from django.views.decorators.csrf import csrf_exempt
-import os, zipfile, time, uuid, qrcode, io, base64
+import os, zipfile, time, uuid, json, hashlib
 from decimal import Decimal
 from django.shortcuts import get_object_or_404, render, redirect
-from django.http import JsonResponse, Http404
+from django.http import JsonResponse, Http404, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Count, Sum, Q
-from .models import GeneratedSite, UserProfile, Suggestion, Payment
-from .ai_service import generate_website_code, save_website_as_zip
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, TextField, Value, When
+from django.db.models.functions import Substr
+from .models import PLAN_LIMITS, GeneratedSite, GenerationBatch, UsagePeriod, UserSiteStats, Suggestion, Payment
+from .tasks import run_generation, run_batch
+from . import counters, qr, quota
+from .page_cache import cache_public_page
+from .profiles import get_profile
+from .ai_service import stream_openai_website, build_html_artifact, save_website_as_zip
+from . import generation_cache
+from .search import search_sites
+from .pagination import DEFAULT_PER_PAGE, paginate
+from .downloads import serve_archive, serve_stored_archive, offload_archive, is_new_download, record_download
 from django.conf import settings
 from django.utils import timezone
 from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.urls import reverse
 
 
+# Large text columns that list and status queries should not load
+# (generated_code lives in GeneratedContent and is only loaded on access)
+SITE_BODY_FIELDS = ('prompt',)
+PROMPT_PREVIEW_LENGTH = 200
+
 
 def home(request):
     """Home page view"""
@@ -31,11 +48,10 @@ def generate_page(request):
     
     # If user is authenticated, add usage info
     if request.user.is_authenticated:
-        profile, created = UserProfile.objects.get_or_create(user=request.user)
         context.update({
-            'profile': profile,
-            'remaining_websites': profile.get_remaining_websites(),
-            'can_generate': profile.can_generate_website(),
+            'profile': request.profile,
+            'remaining_websites': request.quota['remaining'],
+            'can_generate': request.quota['can_generate'],
         })
     
     return render(request, 'generator/generate.html', context)
@@ -43,113 +59,376 @@ def generate_page(request):
 
 @csrf_exempt
 def generate_api(request):
-    """API endpoint for website generation"""
+    """API endpoint that queues a website generation job"""
     if request.method != "POST":
         return JsonResponse({"error": "Only POST allowed"}, status=405)
     
-    prompt = request.POST.get("prompt")
-    if not prompt:
-        return JsonResponse({"error": "No prompt provided"}, status=400)
+    prompt, error_response = _validate_generation_request(request)
+    if error_response:
+        return error_response
     
-    if len(prompt.strip()) < 10:
-        return JsonResponse({"error": "Prompt too short. Please provide more details."}, status=400)
+    # Create pending record, holding its quota, and hand it to a background worker
+    site, error_response = _create_pending_site(request, prompt)
+    if error_response:
+        return error_response
     
-    # Check user limits
-    if request.user.is_authenticated:
-        profile, created = UserProfile.objects.get_or_create(user=request.user)
-        
-        if not profile.can_generate_website():
-            return JsonResponse({
-                "error": "You've reached your free website generation limit. Please upgrade to continue creating amazing websites!",
-                "upgrade_required": True,
-                "redirect_url": "/pricing/",
-                "subscription_plans_url": "/pricing/"
-            }, status=403)
+    try:
+        transaction.on_commit(lambda: run_generation.delay(site.id))
+    except Exception as e:
+        site.status = "failed"
+        site.save()
+        quota.release(site.user_id, [site])
+        return JsonResponse({"error": f"Could not queue generation: {str(e)}"}, status=503)
+    
+    # Return JSON for API calls or redirect for web interface
+    if request.headers.get('Content-Type') == 'application/json' or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        # The job may already be done when running eagerly
+        site.refresh_from_db()
+        return JsonResponse(_job_payload(site), status=202)
     else:
-        # For anonymous users, we can still generate but won't save to their account
-        pass
+        # Redirect to enhanced result page
+        return redirect('generator:generation_result', site_id=site.id)
+
+
+def generate_stream(request):
+    """
+    Server-Sent Events endpoint streaming the OpenAI HTML website as it is written.
+    Emits 'start', then 'token' events with text chunks, then 'done' with the job
+    payload (or 'error'). The final HTML is saved with save_website_as_zip.
+    No page uses it (generate.html polls /api/generate/); it is for API clients,
+    and holds a gunicorn worker thread for the whole stream (see gunicorn.conf.py).
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST allowed"}, status=405)
+    
+    prompt, error_response = _validate_generation_request(request)
+    if error_response:
+        return error_response
+    
+    # Generated right here rather than by a worker, so it is started from the outset
+    site, error_response = _create_pending_site(request, prompt, started_at=timezone.now())
+    if error_response:
+        return error_response
     
+    response = StreamingHttpResponse(_website_event_stream(site), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    return response
+
+
+def _website_event_stream(site):
+    """Relay OpenAI output as SSE events, then persist the finished website"""
+    start_time = time.time()
+    stream = None
+    settled = False
     try:
-        start_time = time.time()
-        
-        # Create pending record
-        site = GeneratedSite.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            prompt=prompt,
-            status="pending"
-        )
-        
-        # Call OpenAI
-        code = generate_website_code(prompt)
+        yield _sse_event('start', {"job_id": site.id, "site_id": site.id})
         
-        generation_time = time.time() - start_time
-        
-        if code.startswith("Error:"):
-            site.status = "failed"
-            site.save()
-            return JsonResponse({"error": code}, status=500)
+        stream = stream_openai_website(site.prompt)
+        while True:
+            try:
+                chunk = next(stream)
+            except StopIteration as finished:
+                code = finished.value
+                break
+            yield _sse_event('token', chunk)
         
-        # Save as professional .zip file with proper structure
-        site.generation_time = generation_time
-        save_website_as_zip(site, code)
+        site.generation_time = time.time() - start_time
+        save_website_as_zip(site, build_html_artifact(code, site.prompt))
         
-        # Decrement user usage if authenticated
-        if request.user.is_authenticated:
-            profile.decrement_usage()
+        quota.commit(site.user_id, [site])
+        settled = True
         
-        # Return JSON for API calls or redirect for web interface
-        if request.headers.get('Content-Type') == 'application/json' or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return JsonResponse({
-                "site_id": site.id,
-                "download_url": site.generated_file.url,
-                "generation_time": round(generation_time, 2),
-                "message": "Website generated successfully!",
-                "redirect_url": f"/generation-result/{site.id}/"
-            })
-        else:
-            # Redirect to enhanced result page
-            return redirect('generator:generation_result', site_id=site.id)
+        yield _sse_event('done', _job_payload(site))
         
     except Exception as e:
-        # Update site status to failed
-        if 'site' in locals():
-            site.status = "failed"
-            site.save()
-        
-        return JsonResponse({"error": f"Generation failed: {str(e)}"}, status=500)
+        print(f"❌ Streaming generation for site {site.id} failed: {e}")
+        _fail_streamed_site(site)
+        settled = True
+        yield _sse_event('error', {"error": "Generation failed. Please try again."})
+    
+    finally:
+        if stream is not None:
+            stream.close()
+        if not settled:
+            # The client went away mid-stream (GeneratorExit): don't leave the site pending on its quota
+            print(f"⚠️  Client disconnected from streaming generation for site {site.id}")
+            _fail_streamed_site(site)
+
+
+def _fail_streamed_site(site):
+    site.status = "failed"
+    site.save()
+    quota.release(site.user_id, [site])
+
+
+def _sse_event(event, data):
+    """Format one Server-Sent Event; data is JSON-encoded so newlines are safe"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _validate_generation_request(request):
+    """Return (prompt, None) for a valid generation request, else (None, error response)"""
+    prompt = request.POST.get("prompt")
+    if not prompt:
+        return None, JsonResponse({"error": "No prompt provided"}, status=400)
+    
+    if len(prompt.strip()) < 10:
+        return None, JsonResponse({"error": "Prompt too short. Please provide more details."}, status=400)
+    
+    # Check user limits
+    if request.user.is_authenticated:
+        # Cached quota state; no profile query on a cache hit. The
+        # reservation in _create_pending_site is the authoritative check
+        if not request.quota['can_generate']:
+            return None, _quota_exceeded_response()
+    
+    # Anonymous users can still generate but won't save to an account
+    return prompt, None
+
+
+def _quota_exceeded_response():
+    return JsonResponse({
+        "error": "You've reached your free website generation limit. Please upgrade to continue creating amazing websites!",
+        "upgrade_required": True,
+        "redirect_url": "/pricing/",
+        "subscription_plans_url": "/pricing/"
+    }, status=403)
+
+
+def _create_pending_site(request, prompt, started_at=None):
+    """Reserve one website of quota and create its pending site: (site, None) or (None, error response)"""
+    # Load the profile before the transaction, so it opens with reserve()'s write
+    get_profile(request.user)
+    try:
+        with transaction.atomic():
+            hold = quota.reserve(request.user)
+            site = GeneratedSite.objects.create(
+                user=request.user if request.user.is_authenticated else None,
+                prompt=prompt,
+                status="pending",
+                quota_hold=hold,
+                started_at=started_at
+            )
+    except quota.QuotaExceeded:
+        return None, _quota_exceeded_response()
+    return site, None
+
+
+def generation_status(request, site_id):
+    """Pollable status of a background generation job"""
+    site = get_object_or_404(GeneratedSite.objects.defer(*SITE_BODY_FIELDS), id=site_id)
+    
+    # Check if user has permission to see this job
+    if site.user and site.user != request.user and not request.user.is_staff:
+        raise Http404("Job not found")
+    
+    return JsonResponse(_job_payload(site))
+
+
+def _job_payload(site):
+    """JSON representation of a generation job"""
+    payload = {
+        "job_id": site.id,
+        "site_id": site.id,
+        "status": site.status,
+        "status_url": reverse('generator:generation_status', args=[site.id]),
+    }
+    if site.status == "completed":
+        payload.update({
+            "download_url": reverse('generator:download_site', args=[site.id]),
+            "generation_time": round(site.generation_time or 0, 2),
+            "message": "Website generated successfully!",
+            "redirect_url": reverse('generator:generation_result', args=[site.id]),
+        })
+    elif site.status == "failed":
+        payload["error"] = "Generation failed. Please try again."
+    return payload
+
+
+def generate_bulk_api(request):
+    """
+    Enterprise endpoint queueing many generations at once.
+    Accepts JSON {"prompts": [...], "combined_archive": true} or repeated
+    ``prompts`` form fields; quota is charged once for the whole batch.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST allowed"}, status=405)
+    
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+    
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({"error": "Invalid JSON body"}, status=400)
+        prompts = data.get("prompts")
+        combined_archive = bool(data.get("combined_archive"))
+    else:
+        prompts = request.POST.getlist("prompts")
+        combined_archive = request.POST.get("combined_archive") in ("1", "true", "on")
+    
+    if not isinstance(prompts, list) or not prompts:
+        return JsonResponse({"error": "No prompts provided"}, status=400)
+    
+    max_prompts = getattr(settings, 'BULK_GENERATION_MAX_PROMPTS', 50)
+    if len(prompts) > max_prompts:
+        return JsonResponse({"error": f"A batch can contain at most {max_prompts} prompts."}, status=400)
+    
+    prompts = [str(prompt).strip() for prompt in prompts]
+    short = [index for index, prompt in enumerate(prompts) if len(prompt) < 10]
+    if short:
+        return JsonResponse({"error": "Prompt too short. Please provide more details.", "invalid_items": short}, status=400)
+    
+    profile = request.profile
+    if profile.subscription_plan != 'enterprise' or not profile.can_generate_website():
+        return JsonResponse({
+            "error": "Bulk generation is available on the Enterprise plan.",
+            "upgrade_required": True,
+            "redirect_url": "/pricing/",
+        }, status=403)
+    
+    if profile.get_remaining_websites() < len(prompts):
+        return JsonResponse({"error": "Not enough websites remaining for this batch."}, status=403)
+    
+    try:
+        with transaction.atomic():
+            # One reservation for the whole batch
+            hold = quota.reserve(request.user, count=len(prompts))
+            batch = GenerationBatch.objects.create(
+                user=request.user,
+                total_items=len(prompts),
+                combined_archive=combined_archive,
+            )
+            GeneratedSite.objects.bulk_create([
+                GeneratedSite(user=request.user, prompt=prompt, status="pending", batch=batch, quota_hold=hold)
+                for prompt in prompts
+            ])
+            # bulk_create bypasses save(), so count the new sites here
+            UserSiteStats.apply(request.user.id, total_sites=len(prompts))
+    except quota.QuotaExceeded:
+        return JsonResponse({"error": "Not enough websites remaining for this batch."}, status=403)
+    
+    try:
+        transaction.on_commit(lambda: run_batch.delay(batch.id))
+    except Exception as e:
+        with transaction.atomic():
+            failed = batch.sites.filter(status="pending").update(status="failed")
+            UserSiteStats.apply(request.user.id, failed_sites=failed)
+            quota.release(request.user.id, list(batch.sites.only('id', 'quota_hold', 'created_at')))
+        batch.status = "failed"
+        batch.save()
+        return JsonResponse({"error": f"Could not queue batch: {str(e)}"}, status=503)
+    
+    batch.refresh_from_db()
+    return JsonResponse(_batch_payload(batch), status=202)
+
+
+@login_required
+def batch_status(request, batch_id):
+    """Pollable status of a bulk generation batch with per-item status"""
+    batch = get_object_or_404(GenerationBatch, id=batch_id)
+    
+    if batch.user != request.user and not request.user.is_staff:
+        raise Http404("Batch not found")
+    
+    return JsonResponse(_batch_payload(batch))
+
+
+@login_required
+def download_batch(request, batch_id):
+    """Download the combined archive of a bulk batch"""
+    batch = get_object_or_404(GenerationBatch, id=batch_id)
+    
+    if batch.user != request.user and not request.user.is_staff:
+        raise Http404("Batch not found")
+    
+    if not batch.archive or not batch.archive.storage.exists(batch.archive.name):
+        raise Http404("File not found")
+    
+    filename = f"batch_{batch.id}.zip"
+    backend = getattr(settings, 'SITE_DOWNLOAD_BACKEND', 'django')
+    if backend in ('x-accel', 'x-sendfile'):
+        return offload_archive(batch.archive, filename, backend)
+    return serve_stored_archive(request, batch.archive, filename)
+
+
+def _batch_payload(batch):
+    """JSON representation of a bulk generation batch"""
+    items = [_job_payload(site) for site in batch.sites.defer(*SITE_BODY_FIELDS).order_by('id')]
+    payload = {
+        "batch_id": batch.id,
+        "status": batch.status,
+        "total": batch.total_items,
+        "completed": sum(1 for item in items if item["status"] == "completed"),
+        "failed": sum(1 for item in items if item["status"] == "failed"),
+        "status_url": reverse('generator:batch_status', args=[batch.id]),
+        "items": items,
+    }
+    if batch.archive:
+        payload["archive_url"] = reverse('generator:download_batch', args=[batch.id])
+    return payload
 
 
 @login_required
 def dashboard(request):
     """User dashboard view"""
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    profile = request.profile
     
     # Get user's generated sites
     sites_list = GeneratedSite.objects.filter(user=request.user)
+    site_stats = UserSiteStats.for_user(request.user.id)
     
     # Filter by status if requested
     status_filter = request.GET.get('status')
-    if status_filter and status_filter != 'all':
+    if status_filter == 'all':
+        status_filter = None
+    if status_filter:
         sites_list = sites_list.filter(status=status_filter)
     
-    # Search functionality
+    # Search functionality (ranked full-text search where the database supports it)
     search_query = request.GET.get('search')
     if search_query:
-        sites_list = sites_list.filter(
-            Q(prompt__icontains=search_query)
+        sites_list = search_sites(sites_list, search_query)
+    
+    # Calculate statistics
+    if status_filter or search_query:
+        # One conditional aggregate over the filtered sites
+        stats = sites_list.aggregate(
+            total_sites=Count('id'),
+            completed_sites=Count('id', filter=Q(status='completed')),
+            total_downloads=Sum('downloads_count'),
         )
+    else:
+        # Maintained counters: no scan of the user's sites at all
+        stats = {
+            'total_sites': site_stats.total_sites,
+            'completed_sites': site_stats.completed_sites,
+            'total_downloads': site_stats.total_downloads,
+        }
+    total_sites = stats['total_sites']
+    completed_sites = stats['completed_sites']
+    total_downloads = stats['total_downloads'] or 0
     
-    # Pagination
-    paginator = Paginator(sites_list, 12)  # 12 sites per page
-    page_number = request.GET.get('page')
-    sites = paginator.get_page(page_number)
+    sites_page = _site_cards(sites_list)
     
-    # Calculate statistics
-    total_sites = sites_list.count()
-    completed_sites = sites_list.filter(status='completed').count()
-    total_downloads = sites_list.aggregate(
-        downloads=Sum('downloads_count')
-    )['downloads'] or 0
+    if search_query:
+        # Ranked results stay offset-paginated. Their order is the relevance
+        # score, computed per query over every match, so the database ranks and
+        # sorts all matches for any page and a (rank, created_at, id) cursor
+        # would skip nothing. The count is the aggregate above, not a second
+        # COUNT(*). The API pages the same search unranked, by cursor.
+        paginator = Paginator(sites_page, DEFAULT_PER_PAGE)
+        paginator.count = total_sites
+        sites = paginator.get_page(request.GET.get('page'))
+        next_url = _page_url(request, page=sites.next_page_number()) if sites.has_next() else None
+        previous_url = _page_url(request, page=sites.previous_page_number()) if sites.has_previous() else None
+    else:
+        # Keyset pagination: one index range scan per page, however deep
+        sites = paginate(sites_page, after=request.GET.get('after'), before=request.GET.get('before'))
+        next_url = _page_url(request, after=sites.next_cursor) if sites.has_next else None
+        previous_url = _page_url(request, before=sites.previous_cursor) if sites.has_previous else None
     
     days_since_joined = (timezone.now() - request.user.date_joined).days
     
@@ -159,72 +438,127 @@ def dashboard(request):
         'total_sites': total_sites,
         'completed_sites': completed_sites,
         'total_downloads': total_downloads,
+        'approximate_total': site_stats.count_for_status(status_filter) if not search_query else total_sites,
+        'next_page_url': next_url,
+        'previous_page_url': previous_url,
         'days_since_joined': days_since_joined,
-        'remaining_websites': profile.get_remaining_websites(),
-        'can_generate': profile.can_generate_website(),
+        'remaining_websites': request.quota['remaining'],
+        'can_generate': request.quota['can_generate'],
         'now': timezone.now(),
     }
     
     return render(request, 'generator/dashboard.html', context)
 
 
+def _site_cards(sites_list):
+    """
+    Only the columns the cards show; long prompts are cut in the database
+    and the full prompt is only fetched for failed sites (Retry button)
+    """
+    return sites_list.only('id', 'user', 'status', 'created_at', 'generation_time').annotate(
+        prompt_preview=Substr('prompt', 1, PROMPT_PREVIEW_LENGTH),
+        retry_prompt=Case(When(status='failed', then=F('prompt')), default=Value(''), output_field=TextField()),
+    )
+
+
+def _page_url(request, **params):
+    """The current URL with its paging parameters replaced by ``params``"""
+    query = request.GET.copy()
+    for key in ('page', 'after', 'before'):
+        query.pop(key, None)
+    query.update(params)
+    return f"{request.path}?{query.urlencode()}"
+
+
+def sites_api(request):
+    """
+    JSON listing of the user's sites, newest first, with keyset pagination.
+    Pass ``after`` (next_cursor) or ``before`` (previous_cursor) to move
+    between pages; ``status`` and ``search`` filter the list.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+    
+    sites_list = GeneratedSite.objects.filter(user=request.user)
+    status_filter = request.GET.get('status')
+    if status_filter == 'all':
+        status_filter = None
+    if status_filter:
+        sites_list = sites_list.filter(status=status_filter)
+    search_query = request.GET.get('search')
+    if search_query:
+        # Unranked so the newest-first key order (and the cursors) still hold
+        sites_list = search_sites(sites_list, search_query, ranked=False)
+    
+    try:
+        per_page = int(request.GET.get('per_page', DEFAULT_PER_PAGE))
+    except ValueError:
+        return JsonResponse({"error": "per_page must be a number"}, status=400)
+    
+    page = paginate(_site_cards(sites_list), after=request.GET.get('after'),
+                    before=request.GET.get('before'), per_page=per_page)
+    
+    items = []
+    for site in page:
+        item = _job_payload(site)
+        item.update({
+            "created_at": site.created_at.isoformat(),
+            "prompt_preview": site.prompt_preview,
+        })
+        items.append(item)
+    
+    payload = {
+        "items": items,
+        "next_cursor": page.next_cursor,
+        "previous_cursor": page.previous_cursor,
+    }
+    if not search_query:
+        # From the per-user counters, not a COUNT(*)
+        payload["approximate_total"] = UserSiteStats.for_user(request.user.id).count_for_status(status_filter)
+    return JsonResponse(payload)
+
 
 def download_site(request, site_id):
     """Handle website download and track statistics"""
+    # Bodies are only needed (and then lazily loaded) for on-the-fly archives
+    site = get_object_or_404(GeneratedSite.objects.defer(*SITE_BODY_FIELDS), id=site_id)
+    
+    # Check if user has permission to download
+    if site.user and site.user != request.user and not request.user.is_staff:
+        raise Http404("Site not found")
+    
+    if site.status != "completed":
+        messages.error(request, "This website is not ready for download yet.")
+        raise Http404("File not found")
+    
     try:
-        site = get_object_or_404(GeneratedSite, id=site_id)
-        
-        # Check if user has permission to download
-        if site.user and site.user != request.user and not request.user.is_staff:
-            raise Http404("Site not found")
-        
-        # Check if file exists and is accessible
-        if not site.generated_file:
-            messages.error(request, "File not found or has been deleted.")
+        # Check if stored file exists on filesystem
+        if site.generated_file and not site.generated_file.storage.exists(site.generated_file.name):
+            messages.error(request, "File not found on server.")
             raise Http404("File not found")
         
-        try:
-            # Check if file exists on filesystem
-            if not site.generated_file.storage.exists(site.generated_file.name):
-                messages.error(request, "File not found on server.")
-                raise Http404("File not found")
-            
-            # Increment download count
-            site.downloads_count += 1
-            site.save()
-            
-            # Create response with proper error handling
-            file_content = site.generated_file.read()
-            if not file_content:
-                messages.error(request, "File is empty or corrupted.")
-                raise Http404("File corrupted")
-            
-            response = HttpResponse(
-                file_content,
-                content_type='application/zip'
-            )
-            response['Content-Disposition'] = f'attachment; filename="website_{site.id}.zip"'
-            return response
-            
-        except (IOError, OSError) as e:
-            messages.error(request, "Error accessing file. Please try again later.")
-            raise Http404("File access error")
-            
-    except GeneratedSite.DoesNotExist:
-        raise Http404("Site not found")
-    except Exception as e:
-        messages.error(request, "An unexpected error occurred. Please contact support.")
-        raise Http404("Download error")
+        # Stream the archive instead of reading it into memory
+        response = serve_archive(request, site)
+        
+    except (IOError, OSError) as e:
+        messages.error(request, "Error accessing file. Please try again later.")
+        raise Http404("File access error")
+    
+    # Count once per download, not per resumed range
+    if is_new_download(request, response):
+        record_download(site)
+    
+    return response
 
 
 @login_required
 def delete_site(request, site_id):
     """Delete a generated website"""
     if request.method == 'POST':
-        site = get_object_or_404(GeneratedSite, id=site_id, user=request.user)
+        site = get_object_or_404(GeneratedSite.objects.defer(*SITE_BODY_FIELDS), id=site_id, user=request.user)
         
-        # Delete the file if it exists
-        if site.generated_file:
+        # Delete the file if it exists and isn't a shared cached archive
+        if site.generated_file and not generation_cache.archive_in_use(site.generated_file.name, exclude_site_id=site.id):
             try:
                 site.generated_file.delete()
             except:
@@ -245,6 +579,7 @@ def delete_site(request, site_id):
 
 # ============== NEW PAGES ==============
 
+@cache_public_page(settings.PAGE_CACHE_TTL)
 def help_center(request):
     """Help Center page with contact information"""
     context = {
@@ -257,6 +592,7 @@ def help_center(request):
     return render(request, 'pages/help_center.html', context)
 
 
+@cache_public_page(settings.PAGE_CACHE_SHORT_TTL)
 def contact_us(request):
     """Contact Us page"""
     if request.method == 'POST':
@@ -294,37 +630,19 @@ def suggestion_box(request):
         messages.success(request, 'Thank you for your suggestion! We will review it carefully.')
         return redirect('generator:suggestion_box')
     
-    # Get recent implemented suggestions to show
+    # Get recent implemented suggestions to show; the queryset is lazy and
+    # only runs when the template's cached fragment has expired
     implemented_suggestions = Suggestion.objects.filter(status='implemented')[:5]
     
     context = {
         'page_title': 'Suggestion Box',
         'implemented_suggestions': implemented_suggestions,
+        'fragment_cache_ttl': settings.FRAGMENT_CACHE_TTL,
     }
     return render(request, 'pages/suggestion_box.html', context)
 
 
-def generate_qr_code(data):
-    """Generate QR code for payment"""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
-    
-    # Convert to base64 for embedding in HTML
-    qr_code_base64 = base64.b64encode(buffer.getvalue()).decode()
-    return qr_code_base64
-
-
+@cache_public_page(settings.PAGE_CACHE_SHORT_TTL)
 def pricing(request):
     """Pricing page with payment options - both authenticated and anonymous users can view"""
     plans = {
@@ -383,12 +701,11 @@ def pricing(request):
     
     # Add user context if authenticated
     if request.user.is_authenticated:
-        profile, created = UserProfile.objects.get_or_create(user=request.user)
         context.update({
-            'user_profile': profile,
-            'current_plan': profile.subscription_plan,
-            'websites_remaining': profile.get_remaining_websites(),
-            'subscription_active': profile.subscription_plan != 'free' and profile.subscription_expires and profile.subscription_expires > timezone.now()
+            'user_profile': request.profile,
+            'current_plan': request.quota['plan'],
+            'websites_remaining': request.quota['remaining'],
+            'subscription_active': request.quota['subscription_active'],
         })
     
     return render(request, 'pages/pricing.html', context)
@@ -410,33 +727,27 @@ def payment_page(request, plan):
     selected_plan = plans[plan]
     transaction_id = str(uuid.uuid4())[:12].upper()
     
-    # Create payment record
+    # Generate UPI payment string
+    upi_id = "runner.abhi01-1@okaxis"  # Replace with your UPI ID
+    upi_payment_string = f"upi://pay?pa={upi_id}&pn=AI Website Generator&am={selected_plan['price']}&cu=INR&tn=Payment for {selected_plan['name']} - {transaction_id}"
+    
+    # Create payment record; the QR image is served by payment_qr from qr_code_data
     payment = Payment.objects.create(
         user=request.user,
         amount=selected_plan['price'],
         payment_method='upi',
         transaction_id=transaction_id,
+        qr_code_data=upi_payment_string,
         subscription_plan=plan,
         subscription_months=1
     )
     
-    # Generate UPI payment string
-    upi_id = "runner.abhi01-1@okaxis"  # Replace with your UPI ID
-    upi_payment_string = f"upi://pay?pa={upi_id}&pn=AI Website Generator&am={selected_plan['price']}&cu=INR&tn=Payment for {selected_plan['name']} - {transaction_id}"
-    
-    # Generate QR code
-    qr_code_base64 = generate_qr_code(upi_payment_string)
-    
-    # Save QR code data to payment
-    payment.qr_code_data = upi_payment_string
-    payment.save()
-    
     context = {
         'page_title': f'Payment - {selected_plan["name"]}',
         'plan': selected_plan,
         'plan_key': plan,
         'transaction_id': transaction_id,
-        'qr_code': qr_code_base64,
+        'qr_format': settings.PAYMENT_QR_FORMAT,
         'upi_id': upi_id,
         'amount': selected_plan['price'],
         'payment': payment,
@@ -444,6 +755,25 @@ def payment_page(request, plan):
     return render(request, 'pages/payment.html', context)
 
 
+@login_required
+def payment_qr(request, transaction_id, fmt):
+    """QR code image of a payment's UPI string (SVG or PNG)"""
+    if fmt not in qr.RENDERERS:
+        raise Http404("Unknown image format")
+    payment = Payment.objects.filter(user=request.user, transaction_id=transaction_id).only('qr_code_data').first()
+    if payment is None or not payment.qr_code_data:
+        raise Http404("Payment not found")
+
+    # The payload never changes for a transaction, so its hash is a stable ETag
+    etag = f'"{fmt}-{hashlib.md5(payment.qr_code_data.encode("utf-8")).hexdigest()}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(qr.render(payment.qr_code_data, fmt), content_type=qr.CONTENT_TYPES[fmt])
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=settings.PAYMENT_QR_MAX_AGE)
+    return response
+
+
 @login_required 
 def payment_success(request):
     """Payment success page with enhanced handling"""
@@ -466,7 +796,7 @@ def payment_success(request):
                 payment.save()
                 
                 # Update user subscription
-                profile, created = UserProfile.objects.get_or_create(user=request.user)
+                profile = request.profile
                 profile.subscription_plan = payment.subscription_plan
                 
                 # Calculate expiration date based on plan
@@ -476,14 +806,8 @@ def payment_success(request):
                 
                 profile.subscription_expires = timezone.now() + timezone.timedelta(days=duration_days)
                 
-                # Reset website counts based on plan
-                if payment.subscription_plan == 'basic':
-                    profile.free_websites_remaining = 10
-                elif payment.subscription_plan == 'premium':
-                    profile.free_websites_remaining = 50
-                elif payment.subscription_plan == 'enterprise':
-                    profile.free_websites_remaining = 999
-                
+                # The plan's allowance is its monthly UsagePeriod limit; free_websites_remaining
+                # is the free plan's lifetime allowance and is left as it is for after expiry
                 profile.save()
                 
                 context.update({
@@ -491,7 +815,7 @@ def payment_success(request):
                     'subscription_activated': True,
                     'plan_name': payment.subscription_plan.title(),
                     'amount_paid': payment.amount,
-                    'websites_included': profile.free_websites_remaining,
+                    'websites_included': PLAN_LIMITS.get(payment.subscription_plan),
                     'expiry_date': profile.subscription_expires,
                 })
                 
@@ -517,6 +841,7 @@ def payment_success(request):
     return render(request, 'pages/payment_success.html', context)
 
 
+@cache_public_page(settings.PAGE_CACHE_TTL)
 def terms_conditions(request):
     """Terms and Conditions page"""
     context = {
@@ -527,6 +852,7 @@ def terms_conditions(request):
     return render(request, 'pages/terms_conditions.html', context)
 
 
+@cache_public_page(settings.PAGE_CACHE_TTL)
 def privacy_policy(request):
     """Privacy Policy page"""
     context = {
@@ -545,11 +871,12 @@ def about_us(request):
         'company_name': 'AI Website Generator',
         'founded_year': '2024',
         'team_size': '5+',
-        'websites_generated': GeneratedSite.objects.filter(status='completed').count(),
+        'websites_generated': counters.get('completed_sites'),
     }
     return render(request, 'pages/about_us.html', context)
 
 
+@cache_public_page(settings.PAGE_CACHE_TTL)
 def faq(request):
     """Frequently Asked Questions page"""
     faqs = [
@@ -589,25 +916,20 @@ def faq(request):
 @login_required
 def subscription_management(request):
     """Subscription management page for users to view and manage their subscription"""
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    profile = request.profile
     
     # Get recent payments
     recent_payments = Payment.objects.filter(user=request.user).order_by('-created_at')[:5]
     
-    # Calculate usage statistics
-    current_month_start = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    websites_this_month = GeneratedSite.objects.filter(
-        user=request.user,
-        created_at__gte=current_month_start,
-        status='completed'
-    ).count()
+    # Usage statistics from this month's rollup row, not a scan of the sites
+    usage = UsagePeriod.peek(request.user.id, profile.subscription_plan)
     
     context = {
         'profile': profile,
         'recent_payments': recent_payments,
-        'websites_this_month': websites_this_month,
-        'websites_remaining': profile.get_remaining_websites(),
-        'subscription_active': profile.subscription_plan != 'free' and profile.subscription_expires and profile.subscription_expires > timezone.now(),
+        'websites_this_month': usage.generated,
+        'websites_remaining': profile.free_websites_remaining if profile.subscription_plan == 'free' else usage.remaining,
+        'subscription_active': profile.subscription_active(),
         'days_remaining': (profile.subscription_expires - timezone.now()).days if profile.subscription_expires and profile.subscription_expires > timezone.now() else 0,
     }
     
@@ -618,7 +940,7 @@ def subscription_management(request):
 def cancel_subscription(request):
     """Cancel user subscription"""
     if request.method == 'POST':
-        profile = request.user.userprofile
+        profile = request.profile
         profile.subscription_plan = 'free'
         profile.subscription_expires = None
         profile.free_websites_remaining = 0  # They've already used their free websites
@@ -0,0 +1,68 @@
+"""
+Minimal zip writer for pre-rendered project files.
+
+Python's zipfile module always compresses entries itself. Generated projects
+already carry raw deflate blobs (see RenderedFile), many of them cached for
+the whole process, so this writer emits them as-is and yields the archive as
+a sequence of byte chunks. Entries are small and fully in memory, so sizes
+and CRCs are known up front and no data descriptors or ZIP64 records are
+needed.
+"""
+import struct
+import time
+from typing import Iterable, Iterator, Tuple
+
+from .artifacts import RenderedFile
+
+ZIP_DEFLATED = 8
+VERSION = 20               # 2.0: deflate
+FLAG_UTF8 = 0x0800         # file names are UTF-8
+UNIX_FILE_ATTRS = (0o100644 & 0xFFFF) << 16
+
+
+def _dos_datetime(timestamp: float) -> Tuple[int, int]:
+    t = time.localtime(timestamp)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((max(t.tm_year, 1980) - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def iter_zip(entries: Iterable[Tuple[str, RenderedFile]], timestamp: float = None) -> Iterator[bytes]:
+    """Yield a complete zip archive for ``(path, RenderedFile)`` pairs"""
+    dos_time, dos_date = _dos_datetime(timestamp or time.time())
+    central_directory = []
+    offset = 0
+
+    for path, rendered in entries:
+        name = path.encode('utf-8')
+        local_header = struct.pack(
+            '<IHHHHHIIIHH',
+            0x04034b50, VERSION, FLAG_UTF8, ZIP_DEFLATED, dos_time, dos_date,
+            rendered.crc32, len(rendered.deflated), len(rendered.data), len(name), 0,
+        )
+        central_directory.append(struct.pack(
+            '<IHHHHHHIIIHHHHHII',
+            0x02014b50, (3 << 8) | VERSION, VERSION, FLAG_UTF8, ZIP_DEFLATED, dos_time, dos_date,
+            rendered.crc32, len(rendered.deflated), len(rendered.data), len(name), 0, 0, 0, 0,
+            UNIX_FILE_ATTRS, offset,
+        ) + name)
+
+        yield local_header + name
+        yield rendered.deflated
+        offset += len(local_header) + len(name) + len(rendered.deflated)
+
+    directory = b''.join(central_directory)
+    yield directory
+    yield struct.pack(
+        '<IHHHHIIH',
+        0x06054b50, 0, 0, len(central_directory), len(central_directory), len(directory), offset, 0,
+    )
+
+
+def zip_size(entries: Iterable[Tuple[str, RenderedFile]]) -> int:
+    """Exact size in bytes of the archive iter_zip would produce"""
+    size = 22  # end of central directory record
+    for path, rendered in entries:
+        name_length = len(path.encode('utf-8'))
+        size += 30 + name_length + len(rendered.deflated) + 46 + name_length
+    return size
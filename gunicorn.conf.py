@@ -0,0 +1,11 @@
+"""
+Gunicorn settings, read automatically from the working directory
+(``gunicorn ai_webgen.wsgi``, the Procfile and deploy.sh all pick it up).
+"""
+import os
+
+# /api/generate/stream/ keeps its request open for the whole OpenAI stream.
+# Threaded workers let one stream hold a thread instead of a whole sync
+# worker, and their timeout is a worker heartbeat, so long streams aren't killed
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))